@@ -0,0 +1,63 @@
+import io
+from typing import Iterable, Iterator, Sequence
+
+# -----------------------------
+# COPY FROM STDIN
+# -----------------------------
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def format_copy_value(value) -> str:
+    """A single value in COPY's text format (NULL is \\N)"""
+    if value is None:
+        return "\\N"
+    return str(value).translate(_COPY_ESCAPES)
+
+
+class CopyStream(io.TextIOBase):
+    """
+    Read-only text stream rendering `rows` as COPY text-format lines on demand,
+    so the payload is never materialized in memory.
+    """
+
+    def __init__(self, rows: Iterable[Sequence]):
+        self._rows: Iterator[Sequence] = iter(rows)
+        self._buffer = ""
+        self.rows_written = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        lines = [self._buffer]
+        buffered = len(self._buffer)
+        while size < 0 or buffered < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = "\t".join(format_copy_value(value) for value in row) + "\n"
+            lines.append(line)
+            buffered += len(line)
+            self.rows_written += 1
+
+        data = "".join(lines)
+        if size < 0:
+            self._buffer = ""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def copy_rows(cursor, table: str, columns: Sequence[str], rows: Iterable[Sequence]) -> int:
+    """
+    Stream `rows` into `table` with COPY FROM STDIN (PostgreSQL only).
+    `rows` is consumed while the COPY runs, so it must not query the same connection.
+    Returns the number of rows sent.
+    """
+    quote = cursor.db.ops.quote_name
+    stream = CopyStream(rows)
+    cursor.copy_expert(
+        f"COPY {quote(table)} ({', '.join(quote(column) for column in columns)}) FROM STDIN",
+        stream,
+    )
+    return stream.rows_written
@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+# -----------------------------
+# Generation counters
+# -----------------------------
+# Every cached entry is pinned to the generations of the tags it depends on.
+# A write bumps only the generations it touches, which orphans the affected
+# keys (they simply age out) and leaves everything else warm.
+GENERATION_PREFIX = "gen"
+
+
+def model_tag(model) -> str:
+    """Tag shared by every entry built from `model` (list pages, nested data)"""
+    return model._meta.label_lower
+
+
+def row_tag(model, pk) -> str:
+    """Tag for entries built from a single row of `model`"""
+    return f"{model._meta.label_lower}:{pk}"
+
+
+def _generation_key(tag: str) -> str:
+    return f"{GENERATION_PREFIX}:{tag}"
+
+
+def _seed() -> int:
+    # Seed from the clock so a counter that was evicted never hands out a
+    # generation that is still referenced by old entries.
+    return time.time_ns() // 1000
+
+
+def get_generations(tags: Iterable[str]) -> List[int]:
+    """Generations of `tags`: one get_many, plus one set_many/get_many when some are not seeded yet"""
+    keys = [_generation_key(tag) for tag in tags]
+    found = cache.get_many(keys)
+    missing = [key for key in dict.fromkeys(keys) if key not in found]
+    if missing:
+        seeded = dict.fromkeys(missing, _seed())
+        cache.set_many(seeded, timeout=None)
+        # Read back: a concurrent seeder or invalidation may have written them meanwhile
+        found.update(seeded)
+        found.update(cache.get_many(missing))
+    return [int(found[key]) for key in keys]
+
+
+def invalidate(*tags: str) -> None:
+    """Bump the generation of each tag"""
+    for tag in tags:
+        key = _generation_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _seed(), timeout=None)
+
+
+def invalidate_model(model, pk: Optional[object] = None) -> None:
+    """Invalidate list-level entries of `model` and, if given, the entries of row `pk`"""
+    tags = [model_tag(model)]
+    if pk is not None:
+        tags.append(row_tag(model, pk))
+    invalidate(*tags)
+
+
+# -----------------------------
+# Cache keys
+# -----------------------------
+def _base_cache_key(prefix: str, identifier: str, query_params: str) -> str:
+    if query_params:
+        query_hash = hashlib.md5(query_params.encode()).hexdigest()
+        return f"{prefix}:{identifier}:{query_hash}"
+    return f"{prefix}:{identifier}" if identifier else prefix
+
+
+def make_cache_key(prefix: str, identifier: str = "", query_params: str = "", tags: Iterable[str] = ()) -> str:
+    """Generate consistent cache keys, versioned by the generations of `tags`"""
+    return make_cache_keys(prefix, {identifier: tags}, query_params)[identifier]
+
+
+def make_cache_keys(prefix: str, tags_by_identifier: Dict[str, Iterable[str]], query_params: str = "") -> Dict[str, str]:
+    """make_cache_key for many identifiers, reading the generations of all their tags at once"""
+    tags_by_identifier = {identifier: list(tags) for identifier, tags in tags_by_identifier.items()}
+    all_tags = list(dict.fromkeys(tag for tags in tags_by_identifier.values() for tag in tags))
+    generations = dict(zip(all_tags, get_generations(all_tags))) if all_tags else {}
+
+    keys = {}
+    for identifier, tags in tags_by_identifier.items():
+        key = _base_cache_key(prefix, identifier, query_params)
+        if tags:
+            key = f"{key}:v" + ".".join(str(generations[tag]) for tag in tags)
+        keys[identifier] = key
+    return keys
+
+
+# -----------------------------
+# Single-flight reads
+# -----------------------------
+LOCK_PREFIX = "lock"
+
+
+def get_or_build(
+    key: str,
+    build: Callable[[], Any],
+    timeout: int,
+    stale_timeout: int = 60,
+    lock_timeout: int = 10,
+    poll_interval: float = 0.05,
+) -> Any:
+    """
+    Read-through cache with stampede protection:
+      - only the caller holding the rebuild lock runs `build()` for an expired key
+      - everyone else keeps serving the stale copy for up to `stale_timeout` seconds
+      - callers with no copy at all wait for the lock holder instead of rebuilding
+    A `build()` result of None is returned but never cached.
+    """
+    entry = cache.get(key)
+    if entry is not None and entry["expires_at"] > time.time():
+        logger.info("CACHE HIT for key: %s", key)
+        return entry["value"]
+
+    lock_key = f"{LOCK_PREFIX}:{key}"
+    deadline = time.monotonic() + lock_timeout
+    while not cache.add(lock_key, 1, timeout=lock_timeout):
+        if entry is not None:
+            logger.info("CACHE STALE for key: %s", key)
+            return entry["value"]
+        if time.monotonic() >= deadline:
+            # The lock holder died or is too slow; stop waiting on it.
+            return build()
+        time.sleep(poll_interval)
+        entry = cache.get(key)
+        if entry is not None:
+            logger.info("CACHE HIT for key: %s", key)
+            return entry["value"]
+
+    try:
+        # Someone may have finished a rebuild between our read and the lock.
+        entry = cache.get(key)
+        if entry is not None and entry["expires_at"] > time.time():
+            return entry["value"]
+        value = build()
+        if value is not None:
+            envelope = {"value": value, "expires_at": time.time() + timeout}
+            cache.set(key, envelope, timeout=timeout + stale_timeout)
+            logger.info("CACHE SET for key: %s", key)
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+# -----------------------------
+# Batched reads
+# -----------------------------
+def get_many_or_build(
+    keys: Dict[Hashable, str],
+    build_missing: Callable[[List[Hashable]], Dict[Hashable, Any]],
+    timeout: int,
+    stale_timeout: int = 60,
+) -> Dict[Hashable, Any]:
+    """
+    Batched read-through over `keys` ({id: cache key}):
+      - a single get_many for every key
+      - a single `build_missing(ids)` for the misses and expired entries
+      - a single set_many writing the built values back
+    Entries share get_or_build's format, so both paths warm each other.
+    Ids found neither in the cache nor by `build_missing()` are left out.
+    """
+    found = cache.get_many(list(keys.values())) if keys else {}
+    now = time.time()
+    values, missing = {}, []
+    for ident, key in keys.items():
+        entry = found.get(key)
+        if entry is not None and entry["expires_at"] > now:
+            values[ident] = entry["value"]
+        else:
+            missing.append(ident)
+    logger.info("CACHE BATCH %d hits, %d misses", len(values), len(missing))
+
+    if missing:
+        built = {ident: value for ident, value in build_missing(missing).items() if value is not None}
+        expires_at = time.time() + timeout
+        cache.set_many(
+            {keys[ident]: {"value": value, "expires_at": expires_at} for ident, value in built.items()},
+            timeout=timeout + stale_timeout,
+        )
+        values.update(built)
+    return values
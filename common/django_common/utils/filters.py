@@ -0,0 +1,38 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+
+_LEXEME_RE = re.compile(r"\w+")
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    SearchFilter backed by a maintained tsvector column instead of ILIKE '%term%'.
+    Views opt in with `search_vector_field` (and optionally `search_config`):
+      - every word of `?search=` must match, each as a prefix ("harr pot" finds "Harry Potter")
+      - results are ranked by ts_rank unless the client passed an explicit `?ordering=`
+    Views without a search vector, and non-Postgres databases, fall back to SearchFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        vector_field = getattr(view, "search_vector_field", None)
+        lexemes = [lexeme for term in self.get_search_terms(request) for lexeme in _LEXEME_RE.findall(term)]
+        if not vector_field or not lexemes or connections[queryset.db].vendor != "postgresql":
+            return super().filter_queryset(request, queryset, view)
+
+        query = SearchQuery(
+            " & ".join(f"{lexeme}:*" for lexeme in lexemes),
+            search_type="raw",
+            config=getattr(view, "search_config", "simple"),
+        )
+        # ts_rank is a real; as double precision it round-trips through keyset cursors exactly
+        rank = Cast(SearchRank(F(vector_field), query), FloatField())
+        queryset = queryset.filter(**{vector_field: query}).annotate(search_rank=rank)
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by("-search_rank", "pk")
+        return queryset
@@ -1,3 +1,10 @@
+from functools import lru_cache
+from typing import Iterable, Optional
+
+import numpy as np
+
+from django_common.utils.bulk import copy_rows
+
 # -----------------------------
 # ISBN helpers
 # -----------------------------
@@ -26,4 +33,159 @@ def is_valid_isbn13(isbn: str) -> bool:
 
 def is_valid_isbn(isbn: str) -> bool:
     isbn = clean_isbn(isbn)
-    return is_valid_isbn10(isbn) or is_valid_isbn13(isbn)
\ No newline at end of file
+    return is_valid_isbn10(isbn) or is_valid_isbn13(isbn)
+
+def isbn10_to_isbn13(isbn: str) -> str:
+    """The 978-prefixed ISBN-13 of a valid, cleaned ISBN-10"""
+    body = "978" + isbn[:9]
+    total = sum(int(num) * (1 if i % 2 == 0 else 3) for i, num in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+@lru_cache(maxsize=65536)
+def canonical_isbn(isbn: str) -> Optional[str]:
+    """
+    The ISBN-13 form of a raw ISBN-10 or ISBN-13, or None if it is invalid.
+    Memoized: the same ISBNs come up over and over in ratings and book files.
+    """
+    isbn = clean_isbn(isbn)
+    if is_valid_isbn13(isbn):
+        return isbn
+    if is_valid_isbn10(isbn):
+        return isbn10_to_isbn13(isbn.upper())
+    return None
+
+
+# -----------------------------
+# Batch (NumPy) API
+# -----------------------------
+_ISBN10_WEIGHTS = np.arange(1, 11)
+_ISBN13_WEIGHTS = np.tile([1, 3], 7)[:13]
+_ISBN978 = np.array([9, 7, 8])
+
+
+def _digit_matrix(isbns: np.ndarray) -> np.ndarray:
+    """
+    Cleaned ISBNs as an (n, 13) matrix of code points minus ord('0'), padded
+    with zeros. Non-ASCII characters are clamped to 127 (not a digit nor an X).
+    """
+    chars = isbns.astype("<U13").view(np.uint32).reshape(len(isbns), 13)
+    chars = np.minimum(chars, 127).astype(np.int16)
+    chars[chars == 0] = ord("0")
+    return chars - ord("0")
+
+
+def clean_isbns(isbns: Iterable[str]) -> np.ndarray:
+    """`clean_isbn` over a whole array of strings"""
+    isbns = np.asarray(isbns if isinstance(isbns, np.ndarray) else list(isbns), dtype=np.str_)
+    if not isbns.size:
+        return isbns
+    # Most values are already clean: only run the (slower) string ops on the rest
+    dirty = ~np.strings.isalnum(isbns)
+    if dirty.any():
+        cleaned = isbns[dirty]
+        for char in ("-", " ", '"'):
+            cleaned = np.strings.replace(cleaned, char, "")
+        isbns = isbns.copy()
+        isbns[dirty] = np.strings.strip(cleaned)
+    return isbns
+
+
+def _checksum_masks(cleaned: np.ndarray):
+    """(digit matrix, valid ISBN-10 mask, valid ISBN-13 mask) for cleaned ISBNs"""
+    lengths = np.strings.str_len(cleaned)
+    digits = _digit_matrix(cleaned)
+    is_digit = (digits >= 0) & (digits <= 9)
+
+    # ISBN-10: nine digits then a digit or X (either case)
+    is_x = (digits[:, 9] == ord("X") - ord("0")) | (digits[:, 9] == ord("x") - ord("0"))
+    check10 = np.where(is_x, 10, digits[:, 9])
+    valid10 = (
+        (lengths == 10)
+        & is_digit[:, :9].all(axis=1)
+        & (is_digit[:, 9] | is_x)
+        & (((digits[:, :9] * _ISBN10_WEIGHTS[:9]).sum(axis=1) + 10 * check10) % 11 == 0)
+    )
+
+    # ISBN-13: the weighted sum including the check digit is a multiple of 10
+    valid13 = (
+        (lengths == 13)
+        & is_digit.all(axis=1)
+        & ((digits * _ISBN13_WEIGHTS).sum(axis=1) % 10 == 0)
+    )
+    return digits, valid10, valid13
+
+
+def canonicalize_isbns(isbns: Iterable[str]) -> np.ndarray:
+    """
+    `canonical_isbn` over a whole array: an object array of ISBN-13 strings,
+    with None where the input is not a valid ISBN-10 or ISBN-13.
+    Checksums are computed on a digit matrix, without a Python loop per value.
+    """
+    cleaned = clean_isbns(isbns)
+    if not len(cleaned):
+        return np.empty(0, dtype=object)
+    digits, valid10, valid13 = _checksum_masks(cleaned)
+
+    # Rewrite ISBN-10 rows as 978 + the first nine digits + a fresh check digit
+    converted = digits[valid10]
+    converted[:, 3:12] = converted[:, :9]
+    converted[:, :3] = _ISBN978
+    converted[:, 12] = (10 - (converted[:, :12] * _ISBN13_WEIGHTS[:12]).sum(axis=1) % 10) % 10
+    digits[valid10] = converted
+
+    valid = valid10 | valid13
+    result = np.full(len(cleaned), None, dtype=object)
+    result[valid] = (digits[valid] + ord("0")).astype(np.uint32).view("<U13").ravel()
+    return result
+
+
+def validate_isbns(isbns: Iterable[str]) -> np.ndarray:
+    """Boolean mask of the valid ISBN-10/ISBN-13 values in `isbns`"""
+    cleaned = clean_isbns(isbns)
+    if not len(cleaned):
+        return np.zeros(0, dtype=bool)
+    _, valid10, valid13 = _checksum_masks(cleaned)
+    return valid10 | valid13
+
+
+# -----------------------------
+# Stored ISBNs
+# -----------------------------
+def canonicalize_isbn_column(cursor, table: str, column: str = "isbn", unique_with=(), batch_size: int = 50000) -> int:
+    """
+    Rewrite the ISBN-10 values stored in `table`.`column` as ISBN-13 (PostgreSQL only).
+    A row whose ISBN-13 form is already present, for the same `unique_with`
+    columns, is deleted instead. Returns the number of rows rewritten.
+    Must be called inside a transaction.
+    """
+    quote = cursor.db.ops.quote_name
+    table, column = quote(table), quote(column)
+    cursor.execute("CREATE TEMP TABLE isbn_map (old text PRIMARY KEY, new text) ON COMMIT DROP")
+
+    last = ""
+    while True:
+        cursor.execute(
+            f"SELECT DISTINCT {column} FROM {table} WHERE {column} > %s AND length({column}) = 10 ORDER BY 1 LIMIT %s",
+            [last, batch_size],
+        )
+        batch = [isbn for isbn, in cursor.fetchall()]
+        if not batch:
+            break
+        mapped = canonicalize_isbns(batch)
+        copy_rows(cursor, "isbn_map", ["old", "new"], [(old, new) for old, new in zip(batch, mapped) if new is not None])
+        last = batch[-1]
+    cursor.execute("ANALYZE isbn_map")
+
+    same_row = "".join(f" AND o.{quote(name)} = t.{quote(name)}" for name in unique_with)
+    cursor.execute(
+        f"""
+        DELETE FROM {table} t USING isbn_map m
+        WHERE t.{column} = m.old
+          AND EXISTS (SELECT 1 FROM {table} o WHERE o.{column} = m.new{same_row})
+        """
+    )
+    cursor.execute(f"UPDATE {table} t SET {column} = m.new FROM isbn_map m WHERE t.{column} = m.old")
+    updated = cursor.rowcount
+    # ON COMMIT DROP only fires at the outermost commit
+    cursor.execute("DROP TABLE isbn_map")
+    return updated
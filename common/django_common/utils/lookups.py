@@ -0,0 +1,18 @@
+from django.db.models import Lookup
+
+
+class Any(Lookup):
+    """
+    `column = ANY(%s)` with the values bound as a single array parameter.
+    Unlike `__in`, the SQL text does not change with the number of values.
+
+        queryset.filter(Any(F("isbn"), ["0441478123", "0345391802"]))
+    """
+
+    lookup_name = "any"
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs_sql, lhs_params = self.process_lhs(compiler, connection)
+        rhs_sql, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs_sql} = ANY({rhs_sql})", [*lhs_params, *rhs_params]
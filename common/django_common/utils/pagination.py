@@ -0,0 +1,256 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import and_, or_
+from typing import List, Optional, Tuple
+
+from django.db import connections
+from django.db.models import F, Model, Q
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# -----------------------------
+# Count estimates
+# -----------------------------
+def estimate_count(queryset) -> Optional[int]:
+    """
+    Planner estimate of the number of rows in `queryset`, without a COUNT(*).
+    Unfiltered querysets read pg_class.reltuples, filtered ones the EXPLAIN row estimate.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+            # reltuples is -1 until the table has been vacuumed/analyzed once
+            return row[0] if row and row[0] >= 0 else None
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+
+# -----------------------------
+# Keyset pagination
+# -----------------------------
+class KeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination unless the request carries `?cursor=`, which
+    switches to keyset (seek) pagination:
+      - rows are ordered by the view's `?ordering=` fields plus the primary key
+        as a tiebreaker, and each page continues with a `WHERE (a, pk) > (x, y)`
+        seek instead of an OFFSET scan
+      - annotations in the ordering (e.g. the full-text search rank) are
+        carried in the cursor the same way
+      - no COUNT(*) is run; `?count=estimate` adds an X-Total-Count-Estimate
+        header from the planner statistics instead
+    An empty `?cursor=` requests the first page.
+    """
+
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    count_header = "X-Total-Count-Estimate"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_keyset_ordering(request, queryset, view)
+        self.estimated_count = None
+        if request.query_params.get(self.count_query_param) == "estimate":
+            self.estimated_count = estimate_count(queryset)
+
+        position, reverse = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.order_by(reverse))
+        if queryset._fields:
+            # .values() rows must carry the ordering columns to build the next cursor
+            missing = [name for name, _ in self.ordering if name not in queryset._fields]
+            # Annotations left out of .values() are only aliases now and have to be selected again
+            annotations = {name: queryset.query.annotations[name] for name in missing if name in queryset.query.annotations}
+            queryset = queryset.values(*queryset._fields, *(name for name in missing if name not in annotations))
+            queryset = queryset.annotate(**annotations)
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(queryset, position, reverse))
+
+        # One extra row tells us whether there is a page beyond this one.
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results:
+            first, last = self.get_position(results[0]), self.get_position(results[-1])
+            if has_more or reverse:
+                self.next_position = last
+            if position is not None and (has_more or not reverse):
+                self.previous_position = first
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+
+        response = Response({
+            "next": self.get_cursor_link(self.next_position, reverse=False),
+            "previous": self.get_cursor_link(self.previous_position, reverse=True),
+            "results": data,
+        })
+        if self.estimated_count is not None:
+            response[self.count_header] = str(self.estimated_count)
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    # ------------------------
+    # Ordering
+    # ------------------------
+    def get_keyset_ordering(self, request, queryset, view) -> List[Tuple[str, bool]]:
+        """Ordering as (field, descending) pairs, always ending on a unique field"""
+        ordering = None
+        if view is not None and any(issubclass(b, OrderingFilter) for b in getattr(view, "filter_backends", [])):
+            ordering = OrderingFilter().get_ordering(request, queryset, view)
+        ordering = list(ordering or queryset.query.order_by or queryset.model._meta.ordering or [])
+
+        fields = [(f[1:], True) if f.startswith("-") else (f, False) for f in ordering if isinstance(f, str)]
+        if not any(self.is_unique(queryset, name) for name, _ in fields):
+            # Same direction as the last field, so a single index on (field, pk) can be scanned either way
+            fields.append((queryset.model._meta.pk.name, fields[-1][1] if fields else False))
+        return fields
+
+    def order_by(self, reverse: bool):
+        # Explicit NULLS placement (Postgres' defaults) so seeking over NULLs is well defined
+        expressions = []
+        for name, descending in self.ordering:
+            if descending != reverse:
+                expressions.append(F(name).desc(nulls_first=True))
+            else:
+                expressions.append(F(name).asc(nulls_last=True))
+        return expressions
+
+    @staticmethod
+    def resolve_field(model, path: str):
+        field = None
+        for part in path.split(LOOKUP_SEP):
+            field = model._meta.pk if part == "pk" else model._meta.get_field(part)
+            model = field.related_model or model
+        return field
+
+    @classmethod
+    def is_unique(cls, queryset, path: str) -> bool:
+        if path in queryset.query.annotations:
+            return False
+        field = cls.resolve_field(queryset.model, path)
+        return LOOKUP_SEP not in path and (field.primary_key or (field.unique and not field.null))
+
+    @classmethod
+    def is_nullable(cls, queryset, path: str) -> bool:
+        # Annotations (e.g. a search rank) are carried in the cursor like columns;
+        # whether an expression can be NULL is unknown, so assume it can
+        if path in queryset.query.annotations:
+            return True
+        return cls.resolve_field(queryset.model, path).null
+
+    # ------------------------
+    # Seeking
+    # ------------------------
+    def seek_filter(self, queryset, position: list, reverse: bool) -> Q:
+        """Rows strictly after `position` in the (possibly reversed) ordering"""
+        nullable = [self.is_nullable(queryset, name) for name, _ in self.ordering]
+        clauses = []
+        for i, ((name, descending), value) in enumerate(zip(self.ordering, position)):
+            after = self.after(name, value, descending != reverse, nullable[i])
+            if after is None:
+                continue
+            equal = [self.equal(n, v) for (n, _), v in zip(self.ordering[:i], position[:i])]
+            clauses.append(reduce(and_, equal, after))
+        if not clauses:
+            return Q(pk__in=[])
+        seek = reduce(or_, clauses)
+
+        # Redundant bound on the leading column so the planner can start an
+        # index range scan at the cursor instead of filtering the whole index.
+        (name, descending), value = self.ordering[0], position[0]
+        descending = descending != reverse
+        if value is not None and (descending or not nullable[0]):
+            seek &= Q(**{f"{name}__{'lte' if descending else 'gte'}": value})
+        return seek
+
+    @staticmethod
+    def equal(name: str, value) -> Q:
+        return Q(**{f"{name}__isnull": True}) if value is None else Q(**{name: value})
+
+    @staticmethod
+    def after(name: str, value, descending: bool, nullable: bool) -> Optional[Q]:
+        if descending:  # NULLS FIRST
+            return Q(**{f"{name}__isnull": False}) if value is None else Q(**{f"{name}__lt": value})
+        if value is None:  # NULLS LAST: nothing sorts after NULL
+            return None
+        after = Q(**{f"{name}__gt": value})
+        return (after | Q(**{f"{name}__isnull": True})) if nullable else after
+
+    def get_position(self, obj) -> list:
+        position = []
+        for name, _ in self.ordering:
+            if isinstance(obj, dict):
+                position.append(obj[name])
+                continue
+            value = obj
+            for part in name.split(LOOKUP_SEP):
+                value = getattr(value, part) if value is not None else None
+            position.append(value.pk if isinstance(value, Model) else value)
+        return position
+
+    # ------------------------
+    # Cursors
+    # ------------------------
+    def encode_cursor(self, position: list, reverse: bool) -> str:
+        payload = json.dumps({"p": position, "r": int(reverse)}, default=str, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position, reverse = payload["p"], bool(payload["r"])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound("Invalid cursor")
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound("Invalid cursor")
+        return position, reverse
+
+    def get_cursor_link(self, position, reverse: bool) -> Optional[str]:
+        if position is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
@@ -0,0 +1,54 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Tuple
+
+# -----------------------------
+# Sharding files by byte range
+# -----------------------------
+DEFAULT_RANGE_BYTES = 4 * 1024 * 1024
+
+
+def split_line_ranges(file_path: str, start: int = 0, range_bytes: int = DEFAULT_RANGE_BYTES) -> List[Tuple[int, int]]:
+    """
+    Consecutive (start, end) byte ranges covering `file_path` from `start` to EOF,
+    each roughly `range_bytes` long and ending on a line boundary.
+    """
+    size = os.path.getsize(file_path)
+    ranges = []
+    with open(file_path, "rb") as f:
+        while start < size:
+            f.seek(min(start + range_bytes, size))
+            f.readline()  # move on to the start of the next line
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def read_range(file_path: str, start: int, end: int) -> bytes:
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def map_ranges(func: Callable, ranges: List[Tuple[int, int]], workers: int = 1, *args) -> Iterator:
+    """
+    Yield `func(*args, start, end)` for every range, in file order.
+    With `workers` > 1 the calls run in a process pool, keeping at most
+    2 * workers ranges in flight so results never pile up in memory.
+    `func` must be a module-level function importable without Django set up.
+    """
+    if workers <= 1:
+        for start, end in ranges:
+            yield func(*args, start, end)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(func, *args, start, end))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
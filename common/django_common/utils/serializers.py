@@ -0,0 +1,117 @@
+from typing import Callable, List, Optional, Tuple
+
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+# Fields whose to_representation is a no-op for the values the database driver returns
+PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField, serializers.FloatField)
+
+
+def query_param_list(request, name: str) -> Optional[List[str]]:
+    if request is None or name not in request.query_params:
+        return None
+    return [value.strip() for value in request.query_params[name].split(",") if value.strip()]
+
+
+class SparseFieldsetSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer honouring `?fields=` and `?expand=` on the request:
+      - `fields` keeps only the listed top-level fields
+      - once `fields` is given, nested objects are rendered as primary keys
+        unless they are listed in `expand`
+    Without `?fields=` the full, nested representation is kept.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        requested = query_param_list(request, "fields")
+        self.is_sparse = requested is not None
+        if not self.is_sparse:
+            return
+
+        expand = set(query_param_list(request, "expand") or [])
+        for name in list(self.fields):
+            if name not in requested:
+                self.fields.pop(name)
+        for name, field in list(self.fields.items()):
+            if isinstance(field, serializers.BaseSerializer) and name not in expand:
+                kwargs = {"read_only": True, "many": isinstance(field, serializers.ListSerializer)}
+                if field.source != name:
+                    kwargs["source"] = field.source
+                self.fields[name] = serializers.PrimaryKeyRelatedField(**kwargs)
+
+    # ------------------------
+    # Query planning
+    # ------------------------
+    def optimize_queryset(self, queryset):
+        """Restrict `queryset` to the columns and relations this serializer renders"""
+        plan = self._query_plan(self)
+        if plan is None:
+            return queryset
+        only, select, prefetch = plan
+        queryset = queryset.select_related(None).prefetch_related(None)
+        return queryset.select_related(*select).prefetch_related(*prefetch).only(*only)
+
+    @classmethod
+    def _query_plan(cls, serializer, prefix: str = ""):
+        only, select, prefetch = [f"{prefix}{serializer.Meta.model._meta.pk.name}"], [], []
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            if field.source == "*" or "." in field.source:
+                return None
+            path = f"{prefix}{field.source}"
+            if isinstance(field, (serializers.ListSerializer, ManyRelatedField)):
+                prefetch.append(path)
+            elif isinstance(field, serializers.ModelSerializer):
+                nested = cls._query_plan(field, prefix=f"{path}__")
+                if nested is None:
+                    return None
+                only += nested[0]
+                select += [path, *nested[1]]
+                prefetch += nested[2]
+            else:
+                only.append(path)
+        return only, select, prefetch
+
+    def get_values_plan(self) -> Optional[Tuple[List[str], Callable[[dict], dict]]]:
+        """
+        (columns, render) for building list rows straight from `.values(*columns)`,
+        bypassing per-instance serialization. None if a field needs the full serializer.
+        """
+        columns = []
+        render = self._values_renderer(self, "", columns)
+        return (columns, render) if render is not None else None
+
+    @classmethod
+    def _values_renderer(cls, serializer, prefix: str, columns: List[str]):
+        getters = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == "*" or "." in field.source or isinstance(field, ManyRelatedField):
+                return None
+            column = f"{prefix}{field.source}"
+            if isinstance(field, serializers.ModelSerializer):
+                nested = cls._values_renderer(field, f"{column}__", columns)
+                if nested is None:
+                    return None
+                pk_column = f"{column}__{field.Meta.model._meta.pk.name}"
+                if pk_column not in columns:
+                    columns.append(pk_column)
+                # A NULL foreign key renders as None, not as an object full of Nones
+                getters.append((name, lambda row, pk=pk_column, nested=nested: nested(row) if row[pk] is not None else None))
+            elif isinstance(field, serializers.BaseSerializer):
+                return None
+            else:
+                columns.append(column)
+                if isinstance(field, (PASSTHROUGH_FIELDS, RelatedField)):
+                    getters.append((name, lambda row, c=column: row[c]))
+                else:
+                    to_representation = field.to_representation
+                    getters.append(
+                        (name, lambda row, c=column, f=to_representation: f(row[c]) if row[c] is not None else None)
+                    )
+
+        return lambda row: {name: getter(row) for name, getter in getters}
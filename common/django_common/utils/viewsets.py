@@ -0,0 +1,283 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from django_common.utils.cache import (
+    get_many_or_build,
+    get_or_build,
+    invalidate_model,
+    make_cache_key,
+    make_cache_keys,
+    model_tag,
+    row_tag,
+)
+from django_common.utils.lookups import Any
+from django_common.utils.serializers import query_param_list
+
+
+class CachedModelViewSetMixin:
+    """
+    Read-through caching for ModelViewSet list/retrieve, with single-flight
+    rebuilds and stale-while-revalidate (see `get_or_build`).
+    Writes made through the viewset bump the model/row generations, so only
+    entries built from the written data are invalidated.
+    """
+
+    cache_prefix = None  # defaults to the model name
+    cache_dependencies = ()  # models nested in the responses
+    cache_timeouts = {"list": 300, "retrieve": 600}
+    cache_stale_timeout = 60
+
+    def get_cache_model(self):
+        return self.queryset.model
+
+    def get_cache_prefix(self) -> str:
+        return self.cache_prefix or self.get_cache_model()._meta.model_name
+
+    def get_cache_lookup(self) -> str:
+        return str(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+
+    def get_dependency_tags(self):
+        return [model_tag(model) for model in self.cache_dependencies]
+
+    def cached_response(self, key: str, fetch):
+        response = None
+
+        def build():
+            nonlocal response
+            response = fetch()
+            if response.status_code != 200:
+                return None
+            # Keep headers set by the action itself (e.g. pagination count estimates)
+            headers = {name: value for name, value in response.items() if name != "Content-Type"}
+            return {"data": response.data, "headers": headers}
+
+        cached = get_or_build(
+            key, build, timeout=self.cache_timeouts[self.action], stale_timeout=self.cache_stale_timeout
+        )
+        if response is not None:
+            return response
+        return Response(cached["data"], headers=cached["headers"])
+
+    def list(self, request, *args, **kwargs):
+        cache_key = make_cache_key(
+            f"{self.get_cache_prefix()}:list",
+            query_params=request.query_params.urlencode(),
+            tags=[model_tag(self.get_cache_model()), *self.get_dependency_tags()],
+        )
+        return self.cached_response(
+            cache_key, lambda: super(CachedModelViewSetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def get_retrieve_cache_tags(self, lookup: str) -> list:
+        return [row_tag(self.get_cache_model(), lookup), *self.get_dependency_tags()]
+
+    def get_retrieve_cache_key(self, lookup: str, query_params: str) -> str:
+        return make_cache_key(
+            self.get_cache_prefix(),
+            identifier=lookup,
+            query_params=query_params,
+            tags=self.get_retrieve_cache_tags(lookup),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        cache_key = self.get_retrieve_cache_key(self.get_cache_lookup(), request.query_params.urlencode())
+        return self.cached_response(
+            cache_key, lambda: super(CachedModelViewSetMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_model(self.get_cache_model())
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_model(self.get_cache_model(), pk=self.get_cache_lookup())
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        invalidate_model(self.get_cache_model(), pk=self.get_cache_lookup())
+
+
+class SparseFieldsetViewSetMixin:
+    """
+    Companion of SparseFieldsetSerializer:
+      - with `?fields=`, list/retrieve querysets are trimmed to the rendered
+        columns and relations (.only() / select_related / prefetch_related)
+      - list pages whose fields are plain columns or nested foreign keys are
+        built straight from .values() rows instead of model instances
+    """
+
+    values_fast_path = True
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("list", "retrieve", "batch"):
+            serializer = self.get_serializer()
+            if serializer.is_sparse:
+                queryset = serializer.optimize_queryset(queryset)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        plan = self.get_serializer().get_values_plan() if self.values_fast_path else None
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        columns, render = plan
+        queryset = self.filter_queryset(self.get_queryset()).values(*columns)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response([render(row) for row in page])
+        return Response([render(row) for row in queryset])
+
+
+class BatchRetrieveViewSetMixin:
+    """
+    Companion of CachedModelViewSetMixin adding a batch retrieve:
+        GET  <prefix>/batch/?<lookup>__in=a,b,c
+        POST <prefix>/batch/  {"<lookup>__in": ["a", "b", "c"]}
+    All objects come from one cache get_many (after one for the generations of
+    every key), one `<lookup> = ANY(...)` query for the misses and one
+    set_many, sharing entries with retrieve.
+    Results keep the requested order; unknown lookups are listed in "missing".
+    """
+
+    batch_max_size = 100
+
+    def get_batch_param(self) -> str:
+        return f"{self.lookup_field}__in"
+
+    def get_batch_lookups(self, request) -> list:
+        param = self.get_batch_param()
+        if request.method == "POST":
+            values = request.data.get(param) if isinstance(request.data, dict) else None
+            if not isinstance(values, list):
+                raise ValidationError({param: "Expected a list."})
+        else:
+            values = query_param_list(request, param) or []
+
+        lookups = list(dict.fromkeys(str(value).strip() for value in values if str(value).strip()))
+        if len(lookups) > self.batch_max_size:
+            raise ValidationError({param: f"At most {self.batch_max_size} values per request."})
+        return lookups
+
+    def build_batch(self, lookups: list) -> dict:
+        objects = list(self.get_queryset().filter(Any(F(self.lookup_field), lookups)))
+        data = self.get_serializer(objects, many=True).data
+        return {
+            str(getattr(obj, self.lookup_field)): {"data": row, "headers": {}}
+            for obj, row in zip(objects, data)
+        }
+
+    @action(detail=False, methods=["get", "post"])
+    def batch(self, request, *args, **kwargs):
+        lookups = self.get_batch_lookups(request)
+        params = request.query_params.copy()
+        params.pop(self.get_batch_param(), None)
+        query_params = params.urlencode()
+
+        # The same keys as retrieve, with every generation read in one round trip
+        keys = make_cache_keys(
+            self.get_cache_prefix(), {lookup: self.get_retrieve_cache_tags(lookup) for lookup in lookups}, query_params
+        )
+        found = get_many_or_build(
+            keys, self.build_batch, timeout=self.cache_timeouts["retrieve"], stale_timeout=self.cache_stale_timeout
+        )
+        return Response({
+            "results": [found[lookup]["data"] for lookup in lookups if lookup in found],
+            "missing": [lookup for lookup in lookups if lookup not in found],
+        })
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller"""
+
+    def write(self, value):
+        return value
+
+
+class ExportViewSetMixin:
+    """
+    Adds GET <prefix>/export/, streaming the filtered queryset as NDJSON
+    (default) or CSV with `?output=csv`:
+      - rows come from a server-side cursor (`.iterator(chunk_size=...)`),
+        so memory stays flat whatever the table size
+      - every export carries an `X-Export-Position` header, and
+        `?after=<position>` returns the rows changed since the export that
+        returned it, ordered by `export_position_field`, for incremental pulls
+    Positions are transaction ids, not timestamps: a pull returns the rows
+    written by transactions at or after the position that had finished when
+    it started, so rows a long transaction commits late are picked up by the
+    next pull instead of being skipped. A full export may return a row again
+    in the next pull (consumers upsert by key), but no row is missed.
+    """
+
+    export_fields = ()  # ORM lookups, also used as output keys
+    export_annotations = {}  # output key -> expression
+    export_position_field = "change_xid"  # id of the writing transaction, stamped by a database trigger
+    export_position_header = "X-Export-Position"
+    export_chunk_size = 2000
+
+    @staticmethod
+    def get_export_position(queryset) -> int:
+        """A transaction id below which every transaction has finished: nothing older can still commit"""
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+            return cursor.fetchone()[0]
+
+    def get_export_queryset(self, request, position: int):
+        # Rows are read with .values(); prefetches would only run extra queries per chunk
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        after = request.query_params.get("after")
+        if after is None:
+            return queryset.order_by("pk")
+
+        try:
+            after = int(after)
+        except ValueError:
+            after = -1
+        if after < 0:
+            raise ValidationError({"after": "Expected the position of a previous export."})
+        field = self.export_position_field
+        return queryset.filter(**{f"{field}__gte": after, f"{field}__lt": position}).order_by(field, "pk")
+
+    @action(detail=False, methods=["get"])
+    def export(self, request, *args, **kwargs):
+        # Taken before the rows are read, so every transaction below it is visible to the export
+        position = self.get_export_position(self.get_queryset())
+        queryset = self.get_export_queryset(request, position)
+        rows = queryset.values(*self.export_fields, **self.export_annotations).iterator(
+            chunk_size=self.export_chunk_size
+        )
+        columns = [*self.export_fields, *self.export_annotations]
+
+        if request.query_params.get("output") == "csv":
+            content, content_type, extension = self.stream_csv(rows, columns), "text/csv", "csv"
+        else:
+            content, content_type, extension = self.stream_ndjson(rows), "application/x-ndjson", "ndjson"
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{self.basename}.{extension}"'
+        response[self.export_position_header] = str(position)
+        return response
+
+    @staticmethod
+    def stream_ndjson(rows):
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+    @staticmethod
+    def stream_csv(rows, columns):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(
+                ["|".join(map(str, value)) if isinstance(value, list) else value for value in row.values()]
+            )
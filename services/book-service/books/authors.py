@@ -0,0 +1,94 @@
+from typing import Dict, Iterable
+
+from django.db.models import F
+
+from books.models import Author
+from books.normalization import canonical_author_key
+from django_common.utils.bulk import copy_rows
+from django_common.utils.lookups import Any
+
+BATCH_SIZE = 5000
+
+
+def author_ids_by_key(keys: Iterable[str], batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """{canonical key: author id} for the given keys, in chunked `canonical_key = ANY(...)` queries"""
+    keys = list(keys)
+    found = {}
+    for i in range(0, len(keys), batch_size):
+        found.update(
+            Author.objects.filter(Any(F("canonical_key"), keys[i:i + batch_size])).values_list("canonical_key", "id")
+        )
+    return found
+
+
+def rekey_authors(cursor) -> int:
+    """
+    Recompute every author's canonical key, merge authors whose keys collide and
+    store the keys. Among duplicates the primary is the name with the most
+    alphabetic characters, then the longest name, then the oldest id; books and
+    quotes of the others are reassigned to it. Returns the number of authors merged.
+
+    Works on the tables directly (migrations run it too) and must be called
+    inside a transaction.
+    """
+    cursor.execute(
+        "CREATE TEMP TABLE author_dedup (author_id bigint, key text, letters int, length int) ON COMMIT DROP"
+    )
+    last_id = 0
+    while True:
+        cursor.execute("SELECT id, name FROM authors WHERE id > %s ORDER BY id LIMIT %s", [last_id, BATCH_SIZE])
+        batch = cursor.fetchall()
+        if not batch:
+            break
+        copy_rows(
+            cursor,
+            "author_dedup",
+            ["author_id", "key", "letters", "length"],
+            [(pk, canonical_author_key(name), sum(ch.isalpha() for ch in name), len(name)) for pk, name in batch],
+        )
+        last_id = batch[-1][0]
+
+    # more letters, longer, older id wins
+    cursor.execute(
+        """
+        CREATE TEMP TABLE author_merge ON COMMIT DROP AS
+        SELECT author_id, primary_id FROM (
+            SELECT author_id, first_value(author_id) OVER (
+                PARTITION BY key ORDER BY letters DESC, length DESC, author_id
+            ) AS primary_id
+            FROM author_dedup
+        ) ranked
+        WHERE author_id <> primary_id
+        """
+    )
+    cursor.execute("CREATE UNIQUE INDEX ON author_merge (author_id)")
+    cursor.execute("ANALYZE author_merge")
+
+    # Reassign FKs, then delete duplicates
+    for table in ("books", "quotes"):
+        cursor.execute(
+            f"UPDATE {table} t SET author_id = m.primary_id FROM author_merge m WHERE t.author_id = m.author_id"
+        )
+    cursor.execute("DELETE FROM authors a USING author_merge m WHERE a.id = m.author_id")
+    merged = cursor.rowcount
+
+    # The unique constraint is checked row by row: when keys move between authors,
+    # park the changed rows on placeholders first. A key with a digit is all
+    # letters and digits, so '#<id>' is never a real one
+    cursor.execute(
+        """
+        UPDATE authors a SET canonical_key = '#' || a.id
+        FROM author_dedup d
+        WHERE a.id = d.author_id AND a.canonical_key IS DISTINCT FROM d.key
+        """
+    )
+    cursor.execute(
+        """
+        UPDATE authors a SET canonical_key = d.key
+        FROM author_dedup d
+        WHERE a.id = d.author_id AND a.canonical_key IS DISTINCT FROM d.key
+        """
+    )
+    # ON COMMIT DROP only fires at the outermost commit
+    cursor.execute("DROP TABLE author_dedup, author_merge")
+    return merged
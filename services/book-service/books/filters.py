@@ -0,0 +1,16 @@
+import django_filters
+
+from .models import Author
+from .normalization import canonical_author_key
+
+
+class AuthorFilter(django_filters.FilterSet):
+    # Matches spelling variants ("Garcia Marquez", "GARCÍA MÁRQUEZ") through the indexed canonical key
+    name = django_filters.CharFilter(method="filter_name")
+
+    class Meta:
+        model = Author
+        fields = ["name"]
+
+    def filter_name(self, queryset, name, value):
+        return queryset.filter(canonical_key=canonical_author_key(value))
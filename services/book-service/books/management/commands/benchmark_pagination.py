@@ -0,0 +1,66 @@
+import time
+from statistics import median
+
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from books.models import Book
+from books.views import BookViewSet
+
+NO_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+class Command(BaseCommand):
+    help = "Compare page-number and keyset pagination latency of /books at increasing depths."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, nargs="+", default=[1, 100, 10000])
+        parser.add_argument("--ordering", default="title")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = BookViewSet.as_view({"get": "list"})
+        ordering = options["ordering"]
+
+        self.stdout.write(f"Books: {Book.objects.count()}, ordering={ordering}")
+        self.stdout.write(f"{'page':>8} {'page-number ms':>16} {'keyset ms':>12} {'queries (pn/ks)':>16}")
+
+        with override_settings(CACHES=NO_CACHE, DEBUG=True, ALLOWED_HOSTS=["testserver"]):
+            for page in options["pages"]:
+                cursor = self.cursor_for(page, ordering)
+                if cursor is None:
+                    self.stdout.write(f"{page:>8} (beyond the last page)")
+                    continue
+
+                page_number = factory.get("/api/v1/books/", {"page": page, "ordering": ordering})
+                keyset = factory.get("/api/v1/books/", {"cursor": cursor, "ordering": ordering})
+                pn_ms, pn_queries = self.measure(view, page_number, options["repeat"])
+                ks_ms, ks_queries = self.measure(view, keyset, options["repeat"])
+                self.stdout.write(f"{page:>8} {pn_ms:>16.2f} {ks_ms:>12.2f} {f'{pn_queries}/{ks_queries}':>16}")
+
+    def cursor_for(self, page, ordering):
+        """Cursor positioned where page-number mode's `page` starts"""
+        if page == 1:
+            return ""
+        viewset = BookViewSet(action_map={"get": "list"}, format_kwarg=None, kwargs={})
+        request = viewset.initialize_request(APIRequestFactory().get("/api/v1/books/", {"ordering": ordering}))
+        viewset.request = request
+
+        paginator, queryset = viewset.paginator, viewset.get_queryset()
+        paginator.ordering = paginator.get_keyset_ordering(request, queryset, viewset)
+        offset = (page - 1) * paginator.page_size - 1
+        last = queryset.order_by(*paginator.order_by(reverse=False))[offset:offset + 1].first()
+        return paginator.encode_cursor(paginator.get_position(last), reverse=False) if last else None
+
+    def measure(self, view, request, repeat):
+        timings = []
+        for _ in range(repeat):
+            reset_queries()
+            start = time.perf_counter()
+            response = view(request)
+            response.render()
+            timings.append((time.perf_counter() - start) * 1000)
+        return median(timings), len(connection.queries)
@@ -0,0 +1,44 @@
+import time
+from statistics import median
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from books.views import BookViewSet
+
+NO_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+SCENARIOS = [
+    ("full, serializer", {}, False),
+    ("full, values() fast path", {}, True),
+    ("?fields=isbn,title,author, serializer", {"fields": "isbn,title,author"}, False),
+    ("?fields=isbn,title,author, fast path", {"fields": "isbn,title,author"}, True),
+]
+
+
+class Command(BaseCommand):
+    help = "Compare payload size and render time of a /books list page across fieldsets and serialization paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = BookViewSet.as_view({"get": "list"})
+
+        self.stdout.write(f"{'scenario':<42} {'bytes':>8} {'ms/page':>9}")
+        with override_settings(CACHES=NO_CACHE, ALLOWED_HOSTS=["testserver"]), \
+                mock.patch.object(BookViewSet.pagination_class, "page_size", options["page_size"]):
+            for label, params, fast_path in SCENARIOS:
+                request = factory.get("/api/v1/books/", {"ordering": "title", "cursor": "", **params})
+                timings = []
+                with mock.patch.object(BookViewSet, "values_fast_path", fast_path):
+                    for _ in range(options["repeat"]):
+                        start = time.perf_counter()
+                        response = view(request)
+                        response.render()
+                        timings.append((time.perf_counter() - start) * 1000)
+                self.stdout.write(f"{label:<42} {len(response.content):>8} {median(timings):>9.2f}")
@@ -1,111 +1,67 @@
 import csv
 import json
 import os
-import re
-import unicodedata
-from typing import Dict, List, Tuple
+from contextlib import nullcontext
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Set
 
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from django.db.models import Count
+from django.db import connection, transaction
+from django.db.models import Count, F
 
+from books.authors import author_ids_by_key, rekey_authors
 from books.models import Book, Author, Quote, Tag
+from books.normalization import (
+    normalize_quote_row,
+    parse_book_range,
+    parse_quote_range,
+)
 from config.settings import BASE_DIR
-from django_common.utils.isbn_helpers import *
+from django_common.utils.bulk import copy_rows
+from django_common.utils.lookups import Any
+from django_common.utils.parallel import map_ranges, split_line_ranges
 
 
-# -----------------------------
-# Normalization & validation
-# -----------------------------
-_INITIALS_RE = re.compile(r"\b([A-Za-z])\.(\s+)?(?=[A-Za-z])")
-_PUNCT_SPACE_RE = re.compile(r"[,\u2010\u2011\u2012\u2013\u2014\u2015]+")  # commas & dashes
-_MULTI_SPACE_RE = re.compile(r"\s+")
-_ALLOWED_NAME_RE = re.compile(r"^[A-Za-zÀ-ÖØ-öø-ÿ' .\-]+$")
-
-def strip_diacritics(s: str) -> str:
-    return unicodedata.normalize("NFKD", s).encode("ASCII", "ignore").decode("utf-8")
-
-def smart_title(s: str) -> str:
-    # Title-case but preserve common particles and all-caps acronyms
-    particles = {"de", "del", "la", "le", "van", "von", "der", "da", "dos", "du", "of"}
-    words = s.split()
-    out = []
-    for i, w in enumerate(words):
-        w2 = w
-        if len(w) <= 3 and w.isupper():  # treat acronyms like "USA"
-            w2 = w
-        elif w.lower() in particles and i not in (0, len(words)-1):
-            w2 = w.lower()
-        else:
-            w2 = w.capitalize()
-        out.append(w2)
-    return " ".join(out)
-
-def normalize_author_display(name: str) -> str:
-    """
-    Produce a nice, human display name:
-      - trim
-      - collapse punctuation & spaces
-      - insert space after each initial if missing: 'A.A.' -> 'A. A.'
-      - title-case smartly
-    """
-    if not name:
-        return "Unknown"
-
-    name = name.strip()
-    name = _PUNCT_SPACE_RE.sub(" ", name)
-    name = _MULTI_SPACE_RE.sub(" ", name)
-
-    # Add space after initials if missing, e.g., "A.A." -> "A. A."
-    # This handles initials at the start of a word
-    name = re.sub(r"\b([A-Z])\.(?=[A-Z])", r"\1. ", name)
-
-    # Collapse multiple spaces again just in case
-    name = _MULTI_SPACE_RE.sub(" ", name)
-
-    name = smart_title(name)
-    return name
-
-def canonical_author_key(name: str) -> str:
-    """
-    Canonical key for matching/dedup:
-      - ASCII fold
-      - lowercase
-      - remove all punct/spaces
-    Example: "A. A. Attanasio" -> "aaattanasio"
-    """
-    ascii_name = strip_diacritics(name)
-    ascii_name = ascii_name.lower()
-    ascii_name = re.sub(r"[^a-z]", "", ascii_name)
-    return ascii_name
-
-def is_reasonable_author_name(name: str) -> bool:
-    """Reject empty, numeric-only, or garbage names."""
-    if not name or len(name.strip()) < 2:
-        return False
-    s = name.strip()
-    if s.isdigit():
-        return False
-    if not _ALLOWED_NAME_RE.match(s):
-        return False
-    # too few alphabetics?
-    if sum(ch.isalpha() for ch in s) < 2:
-        return False
-    return True
-
 # -----------------------------
 # Management command
 # -----------------------------
 BULK_CHUNK = 5000
+DEFAULT_BOOK_CHUNK = 20000
+BOOK_STAGING_COLUMNS = [
+    "ord", "isbn", "title", "author_key", "author_name", "year_of_publication", "publisher",
+    "image_url_s", "image_url_m", "image_url_l",
+]
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
 
 class Command(BaseCommand):
     help = "Import books (books.csv) and quotes (quotes_01.jsonl), normalize & deduplicate authors."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=DEFAULT_BOOK_CHUNK,
+            help="Books read, staged and committed per chunk (bounds memory use).",
+        )
+        parser.add_argument(
+            "--atomic", action="store_true",
+            help="Import all books in a single transaction instead of committing every chunk.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Processes parsing and normalizing the input files in parallel.",
+        )
+
     def handle(self, *args, **kwargs):
-        self.import_books()
-        self.import_quotes("quotes_01.jsonl")
-        self.import_quotes("quotes_02.json")
-        self.import_quotes("quotes_03.jsonl")
+        workers = kwargs["workers"]
+        self.import_books(chunk_size=kwargs["chunk_size"], atomic=kwargs["atomic"], workers=workers)
+        self.import_quotes("quotes_01.jsonl", workers=workers)
+        self.import_quotes("quotes_02.json", workers=workers)
+        self.import_quotes("quotes_03.jsonl", workers=workers)
 
         # Deduplicate authors by canonical key
         self.deduplicate_authors()
@@ -119,220 +75,214 @@ class Command(BaseCommand):
     # ------------------------
     # BOOKS
     # ------------------------
-    def import_books(self):
-        file_path = os.path.join(BASE_DIR, "data/books.csv")
+    def import_books(self, filename="books.csv", chunk_size=DEFAULT_BOOK_CHUNK, atomic=False, workers=1):
+        """
+        Streaming loader: the CSV is parsed in line-aligned byte ranges (by
+        `workers` processes) and loaded in chunks of `chunk_size` rows, each
+        COPY'd into a staging table and merged with set-based SQL. Authors are
+        resolved by joining on their canonical key, so memory stays bounded by
+        the chunk size.
+        Every chunk commits on its own unless `atomic` is set; re-running an
+        interrupted import is safe (existing ISBNs are left untouched).
+        """
+        file_path = os.path.join(BASE_DIR, "data", filename)
         self.stdout.write(f"📚 Loading books from {file_path}")
 
-        # Preload caches
-        authors_by_name: Dict[str, Author] = {a.name: a for a in Author.objects.all()}
-        authors_by_key: Dict[str, Author] = {canonical_author_key(a.name): a for a in Author.objects.all()}
-
-        new_authors_batch: List[Author] = []
-        books_batch: List[Book] = []
-
-        # 1) Read CSV
-        with open(file_path, newline="", encoding="latin-1") as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=";")
-            for row in reader:
-                try:
-                    isbn = clean_isbn(row["ISBN"])
-                    if not is_valid_isbn(isbn):
-                        continue
-
-                    raw_author = (row.get("Book-Author") or "").strip('"').strip("'").strip()
-                    display_name = normalize_author_display(raw_author)
-                    if not is_reasonable_author_name(display_name):
-                        continue
-
-                    key = canonical_author_key(display_name)
-                    author = authors_by_key.get(key)
-                    if author is None:
-                        # Create placeholder Author in-memory; defer DB write
-                        author = Author(name=display_name, bio="")
-                        new_authors_batch.append(author)
-                        # Reserve the key to avoid duplicating in the same run
-                        authors_by_key[key] = author
-
-                    title = (row.get("Book-Title") or "").strip('"').strip("'")
-                    year = row.get("Year-Of-Publication") or ""
-                    year = int(year) if str(year).isdigit() else None
-
-                    book = Book(
-                        isbn=isbn,
-                        title=title,
-                        author=author,  # may be unsaved yet; resolved after bulk_create
-                        year_of_publication=year,
-                        publisher=(row.get("Publisher") or "").strip('"').strip("'"),
-                        image_url_s=(row.get("Image-URL-S") or "").strip('"').strip("'"),
-                        image_url_m=(row.get("Image-URL-M") or "").strip('"').strip("'"),
-                        image_url_l=(row.get("Image-URL-L") or "").strip('"').strip("'"),
-                    )
-                    books_batch.append(book)
-                except Exception:
-                    # swallow bad rows silently or log if you prefer
-                    continue
-
-        # 2) Persist in chunks inside a transaction
-        with transaction.atomic():
-            if new_authors_batch:
-                # save authors
-                for i in range(0, len(new_authors_batch), BULK_CHUNK):
-                    Author.objects.bulk_create(new_authors_batch[i:i+BULK_CHUNK], ignore_conflicts=True)
-
-                # refresh caches (resolve actual DB instances by name)
-                saved_names = [a.name for a in new_authors_batch]
-                for a in Author.objects.filter(name__in=saved_names):
-                    authors_by_name[a.name] = a
-                    authors_by_key[canonical_author_key(a.name)] = a
-
-            # resolve FK Author objects and bulk_create books
-            resolved_books: List[Book] = []
-            for b in books_batch:
-                # If b.author is an unsaved instance with just a name, resolve to DB instance
-                if not getattr(b.author, "pk", None):
-                    resolved = authors_by_key[canonical_author_key(b.author.name)]
-                    b.author = resolved
-                resolved_books.append(b)
-
-            if resolved_books:
-                for i in range(0, len(resolved_books), BULK_CHUNK):
-                    Book.objects.bulk_create(resolved_books[i:i+BULK_CHUNK], ignore_conflicts=True)
-
-        self.stdout.write(self.style.SUCCESS(f"✅ Books imported. Total now: {Book.objects.count()}"))
+        authors_before, books_before = Author.objects.count(), Book.objects.count()
+        with connection.cursor() as cursor:
+            self.create_book_staging_tables(cursor)
+        try:
+            rows_staged = 0
+            with transaction.atomic() if atomic else nullcontext():
+                for chunk in chunked(self.read_books_csv(file_path, workers), chunk_size):
+                    with transaction.atomic(), connection.cursor() as cursor:
+                        self.load_book_chunk(cursor, chunk)
+                    rows_staged += len(chunk)
+                    self.stdout.write(f"  … {rows_staged} rows staged")
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS books_import")
+
+        self.stdout.write(self.style.SUCCESS(f"➕ New authors created: {Author.objects.count() - authors_before}"))
+        self.stdout.write(self.style.SUCCESS(f"✅ Books imported: {Book.objects.count() - books_before}. Total now: {Book.objects.count()}"))
+
+    def read_books_csv(self, file_path, workers=1) -> Iterator[tuple]:
+        """Valid, normalized rows as (ordinal, isbn, title, author key, author name, year, publisher, images...)"""
+        with open(file_path, "rb") as f:
+            header = f.readline()
+        fieldnames = next(csv.reader([header.decode("latin-1")], delimiter=";"))
+        ranges = split_line_ranges(file_path, start=len(header))
+        return chain.from_iterable(map_ranges(parse_book_range, ranges, workers, file_path, fieldnames))
+
+    def create_book_staging_tables(self, cursor):
+        # Session-level temp table: it must survive the per-chunk commits
+        cursor.execute("DROP TABLE IF EXISTS books_import")
+        cursor.execute(
+            """
+            CREATE TEMP TABLE books_import (
+                ord bigint, isbn text, title text, author_key text, author_name text,
+                year_of_publication integer, publisher text,
+                image_url_s text, image_url_m text, image_url_l text
+            )
+            """
+        )
+
+    def load_book_chunk(self, cursor, rows: List[tuple]):
+        cursor.execute("TRUNCATE books_import")
+        copy_rows(cursor, "books_import", BOOK_STAGING_COLUMNS, rows)
+        cursor.execute("ANALYZE books_import")
+
+        # New authors keep the first spelling seen in the file
+        cursor.execute(
+            f"""
+            INSERT INTO {Author._meta.db_table} (name, canonical_key, bio, created_at)
+            SELECT DISTINCT ON (s.author_key) s.author_name, s.author_key, '', now()
+            FROM books_import s
+            WHERE NOT EXISTS (SELECT 1 FROM {Author._meta.db_table} a WHERE a.canonical_key = s.author_key)
+            ORDER BY s.author_key, s.ord
+            ON CONFLICT DO NOTHING
+            """
+        )
+
+        # First occurrence of an ISBN wins, existing books are left untouched
+        cursor.execute(
+            f"""
+            INSERT INTO {Book._meta.db_table} (
+                isbn, title, author_id, year_of_publication, publisher, image_url_s, image_url_m, image_url_l
+            )
+            SELECT DISTINCT ON (s.isbn)
+                s.isbn, s.title, k.id, s.year_of_publication, s.publisher,
+                s.image_url_s, s.image_url_m, s.image_url_l
+            FROM books_import s JOIN {Author._meta.db_table} k ON k.canonical_key = s.author_key
+            ORDER BY s.isbn, s.ord
+            ON CONFLICT (isbn) DO NOTHING
+            """
+        )
 
     # ------------------------
     # QUOTES
     # ------------------------
-    def import_quotes(self, filename):
+    def import_quotes(self, filename, workers=1):
+        """
+        Set-based quote loader:
+          1) parse & normalize the file (JSON lines in parallel across `workers`
+             processes); the first occurrence of a quote decides its author
+          2) bulk-insert the new authors and tags
+          3) COPY quotes and quote->tag pairs into temp tables, then merge them
+             with INSERT ... ON CONFLICT DO NOTHING
+        """
         file_path = os.path.join(BASE_DIR, "data", filename)
         self.stdout.write(f"💬 Loading quotes from {file_path}")
 
-        authors_by_key: Dict[str, Author] = {canonical_author_key(a.name): a for a in Author.objects.all()}
-        tags_cache: Dict[str, Tag] = {t.name: t for t in Tag.objects.all()}
-
-        new_authors_count = 0
-        new_tags_count = 0
-        new_quotes_count = 0
-        
-        def normalize_row(row: dict) -> dict:
-            """Map different file formats to a common structure."""
-            if "quote" in row:
-                return {
-                    "quote": (row.get("quote") or "").strip(),
-                    "author": (row.get("author") or "Unknown").strip(),
-                    "tags": row.get("tags") or [],
-                }
-            elif "Quote" in row:  # quotes_02.jsonl style
-                return {
-                    "quote": (row.get("Quote") or "").strip(),
-                    "author": (row.get("Author") or "Unknown").strip(),
-                    "tags": row.get("Tags") or [],
-                }
-            return {}
+        author_names: Dict[str, str] = {}  # canonical key -> first display name
+        quote_authors: Dict[str, str] = {}  # quote text -> canonical author key
+        quote_tags: Dict[str, Set[str]] = {}  # quote text -> tag names
+        max_tag_length = Tag._meta.get_field("name").max_length
 
-        with transaction.atomic():
+        # 1) Parse
+        if filename.endswith(".jsonl"):
+            ranges = split_line_ranges(file_path)
+            rows = chain.from_iterable(map_ranges(parse_quote_range, ranges, workers, file_path))
+        else:  # assume standard JSON array
             with open(file_path, "r", encoding="latin-1") as f:
-                if filename.endswith(".jsonl"):
-                    rows = (json.loads(line) for line in f)
-                else:  # assume standard JSON array
-                    rows = json.load(f)
-
-                for raw_row in rows:
-                    try:
-                        row = normalize_row(raw_row)
-                        if not row:
-                            continue
-
-                        display_name = normalize_author_display(row["author"])
-                        if not is_reasonable_author_name(display_name):
-                            continue
-
-                        key = canonical_author_key(display_name)
-                        author = authors_by_key.get(key)
-                        if author is None:
-                            author, created = Author.objects.get_or_create(
-                                name=display_name, defaults={"bio": ""}
-                            )
-                            authors_by_key[key] = author
-                            if created:
-                                new_authors_count += 1
-
-                        quote_text = row["quote"]
-                        if not quote_text:
-                            continue
-
-                        quote, created = Quote.objects.get_or_create(
-                            text=quote_text,
-                            defaults={
-                                "author": author,
-                            },
-                        )
-                        if created:
-                            new_quotes_count += 1
-                        elif not quote.author_id:
-                            quote.author = author
-                            quote.save(update_fields=["author"])
-
-                        # Tags
-                        for tag_name in (row.get("tags") or []):
-                            tag_name = tag_name.strip()
-                            tag = tags_cache.get(tag_name)
-                            if tag is None:
-                                tag, created = Tag.objects.get_or_create(name=tag_name)
-                                tags_cache[tag_name] = tag
-                                if created:
-                                    new_tags_count += 1
-                            quote.tags.add(tag)
-
-                    except Exception:
-                        continue
+                rows = [row for row in map(self.normalize_quote_row, json.load(f)) if row is not None]
+
+        for quote_text, display_name, key, tags in rows:
+            author_names.setdefault(key, display_name)
+            if not quote_text:
+                continue
+
+            quote_authors.setdefault(quote_text, key)
+            tag_set = quote_tags.setdefault(quote_text, set())
+            try:
+                for tag_name in tags:
+                    tag_name = tag_name.strip()
+                    if tag_name and len(tag_name) <= max_tag_length:
+                        tag_set.add(tag_name)
+            except Exception:
+                continue
+
+        tag_names = set().union(*quote_tags.values())
+        authors_before, tags_before = Author.objects.count(), Tag.objects.count()
+
+        # 2) + 3) Persist
+        with transaction.atomic():
+            author_ids = author_ids_by_key(author_names)
+            Author.objects.bulk_create(
+                [
+                    Author(name=name, canonical_key=key, bio="")
+                    for key, name in author_names.items() if key not in author_ids
+                ],
+                batch_size=BULK_CHUNK,
+                ignore_conflicts=True,
+            )
+            Tag.objects.bulk_create(
+                [Tag(name=name) for name in tag_names], batch_size=BULK_CHUNK, ignore_conflicts=True
+            )
+
+            author_ids.update(author_ids_by_key(key for key in author_names if key not in author_ids))
+            tag_ids = dict(Tag.objects.filter(Any(F("name"), list(tag_names))).values_list("name", "id"))
+
+            through = Quote.tags.through._meta
+            with connection.cursor() as cursor:
+                cursor.execute("CREATE TEMP TABLE quotes_import (text text, author_id bigint) ON COMMIT DROP")
+                copy_rows(
+                    cursor,
+                    "quotes_import",
+                    ["text", "author_id"],
+                    ((text, author_ids[key]) for text, key in quote_authors.items()),
+                )
+                cursor.execute(
+                    f"""
+                    INSERT INTO {Quote._meta.db_table} (text, author_id, created_at)
+                    SELECT text, author_id, now() FROM quotes_import
+                    ON CONFLICT (text) DO NOTHING
+                    """
+                )
+                new_quotes_count = cursor.rowcount
+
+                cursor.execute("CREATE TEMP TABLE quote_tags_import (text text, tag_id bigint) ON COMMIT DROP")
+                copy_rows(
+                    cursor,
+                    "quote_tags_import",
+                    ["text", "tag_id"],
+                    ((text, tag_ids[name]) for text, names in quote_tags.items() for name in names),
+                )
+                cursor.execute("ANALYZE quote_tags_import")
+                cursor.execute(
+                    f"""
+                    INSERT INTO {through.db_table} ({through.get_field("quote").column}, {through.get_field("tag").column})
+                    SELECT q.id, s.tag_id FROM quote_tags_import s
+                    JOIN {Quote._meta.db_table} q ON q.text = s.text
+                    ON CONFLICT DO NOTHING
+                    """
+                )
+                # ON COMMIT DROP only fires at the outermost commit
+                cursor.execute("DROP TABLE quotes_import, quote_tags_import")
 
         self.stdout.write(self.style.SUCCESS(f"✅ Imported {new_quotes_count} new quotes"))
-        self.stdout.write(self.style.SUCCESS(f"➕ New authors created: {new_authors_count}"))
-        self.stdout.write(self.style.SUCCESS(f"🏷️ New tags created: {new_tags_count}"))
-   
+        self.stdout.write(self.style.SUCCESS(f"➕ New authors created: {Author.objects.count() - authors_before}"))
+        self.stdout.write(self.style.SUCCESS(f"🏷️ New tags created: {Tag.objects.count() - tags_before}"))
+
+    @staticmethod
+    def normalize_quote_row(row):
+        try:
+            return normalize_quote_row(row)
+        except Exception:
+            return None
+
     # ------------------------
     # DEDUP AUTHORS
     # ------------------------
     def deduplicate_authors(self):
         """
-        Merge duplicate Author rows that normalize to the same canonical key.
-        Prefer:
-          1) The name with the most alphabetic characters (more complete).
-          2) If tie, the longest name.
-          3) If still tie, the earliest created id.
-        Reassign all Book/Quote FKs, then delete duplicates.
+        Merge duplicate Author rows that normalize to the same canonical key
+        (e.g. after the normalization rules changed) and refresh the stored keys.
+        See `rekey_authors` for how the surviving record is chosen.
         """
         self.stdout.write("🧹 Deduplicating authors...")
-        authors = list(Author.objects.all().only("id", "name", "created_at"))
-        buckets: Dict[str, List[Author]] = {}
-        for a in authors:
-            buckets.setdefault(canonical_author_key(a.name), []).append(a)
-
-        merged = 0
-        with transaction.atomic():
-            for key, group in buckets.items():
-                if len(group) <= 1:
-                    continue
-
-                # pick primary
-                def score(a: Author) -> Tuple[int, int, int]:
-                    letters = sum(ch.isalpha() for ch in a.name)
-                    return (letters, len(a.name), -a.id)  # more letters, longer, older id wins
-
-                group.sort(key=score, reverse=True)
-                primary, *dups = group
-
-                if not dups:
-                    continue
-
-                # Reassign FKs
-                Book.objects.filter(author__in=dups).update(author=primary)
-                Quote.objects.filter(author__in=dups).update(author=primary)
-
-                # Delete duplicates
-                Author.objects.filter(id__in=[d.id for d in dups]).delete()
-                merged += len(dups)
+        with transaction.atomic(), connection.cursor() as cursor:
+            merged = rekey_authors(cursor)
 
         if merged:
             self.stdout.write(self.style.SUCCESS(f"🧩 Merged {merged} duplicate author record(s)."))
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:18
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+BOOK_VECTOR = """
+    setweight(to_tsvector('simple', coalesce({title}, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({author_name}, '')), 'B')
+"""
+
+CREATE_TRIGGERS = f"""
+CREATE FUNCTION books_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {BOOK_VECTOR.format(
+        title="NEW.title", author_name="(SELECT name FROM authors WHERE id = NEW.author_id)"
+    )};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER books_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, author_id ON books
+    FOR EACH ROW EXECUTE FUNCTION books_search_vector_update();
+
+CREATE FUNCTION authors_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE books b SET search_vector = {BOOK_VECTOR.format(title="b.title", author_name="NEW.name")}
+    WHERE b.author_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER authors_search_vector_trigger
+    AFTER UPDATE OF name ON authors
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION authors_search_vector_update();
+
+CREATE FUNCTION quotes_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector('english', coalesce(NEW.text, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER quotes_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF text ON quotes
+    FOR EACH ROW EXECUTE FUNCTION quotes_search_vector_update();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS books_search_vector_trigger ON books;
+DROP TRIGGER IF EXISTS authors_search_vector_trigger ON authors;
+DROP TRIGGER IF EXISTS quotes_search_vector_trigger ON quotes;
+DROP FUNCTION IF EXISTS books_search_vector_update();
+DROP FUNCTION IF EXISTS authors_search_vector_update();
+DROP FUNCTION IF EXISTS quotes_search_vector_update();
+"""
+
+BACKFILL = f"""
+UPDATE books b SET search_vector = {BOOK_VECTOR.format(title="b.title", author_name="a.name")}
+FROM authors a WHERE a.id = b.author_id;
+
+UPDATE quotes SET search_vector = to_tsvector('english', coalesce(text, ''));
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_book_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='quote',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+        migrations.RunSQL(BACKFILL, reverse_sql=migrations.RunSQL.noop),
+    ]
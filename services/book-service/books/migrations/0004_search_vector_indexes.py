@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:18
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('books', '0003_search_vector'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='books_search_vector_gin'),
+        ),
+        AddIndexConcurrently(
+            model_name='quote',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='quotes_search_vector_gin'),
+        ),
+    ]
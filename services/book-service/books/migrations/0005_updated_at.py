@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:23
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+# auto_now only covers Model.save(); the trigger also stamps QuerySet.update() and raw SQL writes
+CREATE_TRIGGERS = """
+CREATE FUNCTION set_updated_at() RETURNS trigger AS $$
+BEGIN
+    -- wall-clock time like auto_now, not the transaction start time now() returns
+    NEW.updated_at := clock_timestamp();
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER books_updated_at_trigger
+    BEFORE UPDATE ON books
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+CREATE TRIGGER quotes_updated_at_trigger
+    BEFORE UPDATE ON quotes
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS books_updated_at_trigger ON books;
+DROP TRIGGER IF EXISTS quotes_updated_at_trigger ON quotes;
+DROP FUNCTION IF EXISTS set_updated_at();
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_search_vector_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now(), db_index=True),
+        ),
+        migrations.AddField(
+            model_name='quote',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now(), db_index=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+def populate_canonical_keys(apps, schema_editor):
+    # Keys must be unique, so authors whose names collide are merged first
+    from books.authors import rekey_authors
+
+    with schema_editor.connection.cursor() as cursor:
+        rekey_authors(cursor)
+        # Run the deferred FK checks of the reassigned rows now: authors can't be
+        # altered below while they are pending
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='canonical_key',
+            field=models.CharField(editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(populate_canonical_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='author',
+            name='canonical_key',
+            field=models.CharField(editable=False, max_length=255, unique=True),
+        ),
+    ]
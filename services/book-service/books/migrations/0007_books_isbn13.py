@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:09
+
+from django.db import migrations
+
+
+def books_to_isbn13(apps, schema_editor):
+    # The importers now store ISBN-13; rewrite the ISBN-10 keys of books loaded before
+    from django_common.utils.isbn_helpers import canonicalize_isbn_column
+
+    with schema_editor.connection.cursor() as cursor:
+        canonicalize_isbn_column(cursor, apps.get_model("books", "Book")._meta.db_table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_author_canonical_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(books_to_isbn13, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+# updated_at is stamped when a row is written, not when it commits: a long
+# transaction can commit rows older than what an export already returned.
+# Exports page on the writing transaction's id instead (see ExportViewSetMixin).
+CREATE_TRIGGERS = """
+CREATE FUNCTION set_change_xid() RETURNS trigger AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER books_change_xid_trigger
+    BEFORE INSERT OR UPDATE ON books
+    FOR EACH ROW EXECUTE FUNCTION set_change_xid();
+
+CREATE TRIGGER quotes_change_xid_trigger
+    BEFORE INSERT OR UPDATE ON quotes
+    FOR EACH ROW EXECUTE FUNCTION set_change_xid();
+
+-- Exported quotes carry their tag names and author name: touch the quotes
+-- when their tags are added or removed, or a tag or author is renamed
+CREATE FUNCTION touch_tagged_quotes() RETURNS trigger AS $$
+BEGIN
+    UPDATE quotes SET updated_at = clock_timestamp() WHERE id IN (SELECT quote_id FROM changed);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER quotes_tags_insert_trigger
+    AFTER INSERT ON quotes_tags REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_tagged_quotes();
+
+CREATE TRIGGER quotes_tags_delete_trigger
+    AFTER DELETE ON quotes_tags REFERENCING OLD TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_tagged_quotes();
+
+CREATE FUNCTION touch_renamed_tag_quotes() RETURNS trigger AS $$
+BEGIN
+    UPDATE quotes SET updated_at = clock_timestamp()
+    WHERE id IN (SELECT quote_id FROM quotes_tags WHERE tag_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tags_rename_trigger
+    AFTER UPDATE OF name ON tags
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION touch_renamed_tag_quotes();
+
+-- Books are touched by authors_search_vector_trigger already
+CREATE FUNCTION touch_renamed_author_quotes() RETURNS trigger AS $$
+BEGIN
+    UPDATE quotes SET updated_at = clock_timestamp() WHERE author_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER authors_rename_quotes_trigger
+    AFTER UPDATE OF name ON authors
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION touch_renamed_author_quotes();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS books_change_xid_trigger ON books;
+DROP TRIGGER IF EXISTS quotes_change_xid_trigger ON quotes;
+DROP TRIGGER IF EXISTS quotes_tags_insert_trigger ON quotes_tags;
+DROP TRIGGER IF EXISTS quotes_tags_delete_trigger ON quotes_tags;
+DROP TRIGGER IF EXISTS tags_rename_trigger ON tags;
+DROP TRIGGER IF EXISTS authors_rename_quotes_trigger ON authors;
+DROP FUNCTION IF EXISTS set_change_xid();
+DROP FUNCTION IF EXISTS touch_tagged_quotes();
+DROP FUNCTION IF EXISTS touch_renamed_tag_quotes();
+DROP FUNCTION IF EXISTS touch_renamed_author_quotes();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_books_isbn13'),
+    ]
+
+    operations = [
+        # Rows written before the triggers count as settled long ago
+        migrations.AddField(
+            model_name='book',
+            name='change_xid',
+            field=models.BigIntegerField(db_default=0, db_index=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='quote',
+            name='change_xid',
+            field=models.BigIntegerField(db_default=0, db_index=True, editable=False),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+    ]
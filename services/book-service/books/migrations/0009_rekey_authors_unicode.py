@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:40
+
+from django.db import migrations
+
+
+def rekey_authors(apps, schema_editor):
+    # Keys now keep letters of every script and digits: recompute them, merging
+    # authors that only the new rules tell apart as the same name
+    from books.authors import rekey_authors
+
+    with schema_editor.connection.cursor() as cursor:
+        rekey_authors(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_change_xid'),
+    ]
+
+    operations = [
+        migrations.RunPython(rekey_authors, migrations.RunPython.noop),
+    ]
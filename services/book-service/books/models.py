@@ -1,8 +1,15 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Now
 from django.utils import timezone
 
+from books.normalization import canonical_author_key
+
 class Author(models.Model):
     name = models.CharField(max_length=255, unique=True)
+    # accent-stripped, casefolded letters and digits of the name: spelling variants share it
+    canonical_key = models.CharField(max_length=255, unique=True, editable=False)
     bio = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now)
 
@@ -13,6 +20,13 @@ class Author(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.canonical_key = canonical_author_key(self.name)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "name" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "canonical_key"}
+        super().save(*args, **kwargs)
+
 
 class Book(models.Model):
     isbn = models.CharField(max_length=13, primary_key=True)
@@ -23,12 +37,21 @@ class Book(models.Model):
     image_url_s = models.URLField(blank=True, null=True)
     image_url_m = models.URLField(blank=True, null=True)
     image_url_l = models.URLField(blank=True, null=True)
+    # title (weight A) + author name (weight B), maintained by database triggers
+    search_vector = SearchVectorField(null=True, editable=False)
+    # also bumped by a database trigger, so QuerySet.update() and raw SQL count as changes
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now(), db_index=True)
+    # id of the transaction that last wrote the row, set by a database trigger; exports page on it
+    change_xid = models.BigIntegerField(db_default=0, db_index=True, editable=False)
 
     class Meta:
         db_table = "books"
         indexes = [
-            models.Index(fields=["title"]),
+            # isbn is the keyset pagination tiebreaker for both orderings
+            models.Index(fields=["title", "isbn"]),
+            models.Index(fields=["year_of_publication", "isbn"]),
             models.Index(fields=["author"]),
+            GinIndex(fields=["search_vector"], name="books_search_vector_gin"),
         ]
 
     def __str__(self):
@@ -51,10 +74,18 @@ class Quote(models.Model):
     author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name="quotes")
     tags = models.ManyToManyField(Tag, related_name="quotes", blank=True)
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now(), db_index=True)
+    # also touched by database triggers when the quote's tags or their names change
+    change_xid = models.BigIntegerField(db_default=0, db_index=True, editable=False)
+    # text, maintained by a database trigger
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         db_table = "quotes"
         ordering = ["author__name"]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="quotes_search_vector_gin"),
+        ]
 
     def __str__(self):
         return f"{self.text[:50]}..." if len(self.text) > 50 else self.text
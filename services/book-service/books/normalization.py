@@ -0,0 +1,179 @@
+import csv
+import io
+import json
+import re
+import unicodedata
+from typing import List, Optional, Sequence
+
+from django_common.utils.isbn_helpers import canonical_isbn
+from django_common.utils.parallel import read_range
+
+# Pure-Python helpers shared by the importers. This module must stay importable
+# without Django being set up: the parse functions run in worker processes.
+
+# -----------------------------
+# Normalization & validation
+# -----------------------------
+_INITIALS_RE = re.compile(r"\b([A-Za-z])\.(\s+)?(?=[A-Za-z])")
+_PUNCT_SPACE_RE = re.compile(r"[,\u2010\u2011\u2012\u2013\u2014\u2015]+")  # commas & dashes
+_MULTI_SPACE_RE = re.compile(r"\s+")
+_ALLOWED_NAME_RE = re.compile(r"^[A-Za-zÀ-ÖØ-öø-ÿ' .\-]+$")
+
+def strip_diacritics(s: str) -> str:
+    return unicodedata.normalize("NFKD", s).encode("ASCII", "ignore").decode("utf-8")
+
+def smart_title(s: str) -> str:
+    # Title-case but preserve common particles and all-caps acronyms
+    particles = {"de", "del", "la", "le", "van", "von", "der", "da", "dos", "du", "of"}
+    words = s.split()
+    out = []
+    for i, w in enumerate(words):
+        w2 = w
+        if len(w) <= 3 and w.isupper():  # treat acronyms like "USA"
+            w2 = w
+        elif w.lower() in particles and i not in (0, len(words)-1):
+            w2 = w.lower()
+        else:
+            w2 = w.capitalize()
+        out.append(w2)
+    return " ".join(out)
+
+def normalize_author_display(name: str) -> str:
+    """
+    Produce a nice, human display name:
+      - trim
+      - collapse punctuation & spaces
+      - insert space after each initial if missing: 'A.A.' -> 'A. A.'
+      - title-case smartly
+    """
+    if not name:
+        return "Unknown"
+
+    name = name.strip()
+    name = _PUNCT_SPACE_RE.sub(" ", name)
+    name = _MULTI_SPACE_RE.sub(" ", name)
+
+    # Add space after initials if missing, e.g., "A.A." -> "A. A."
+    # This handles initials at the start of a word
+    name = re.sub(r"\b([A-Z])\.(?=[A-Z])", r"\1. ", name)
+
+    # Collapse multiple spaces again just in case
+    name = _MULTI_SPACE_RE.sub(" ", name)
+
+    name = smart_title(name)
+    return name
+
+def canonical_author_key(name: str) -> str:
+    """
+    Canonical key for matching/dedup:
+      - compatibility-decompose and drop combining marks (accents)
+      - casefold
+      - keep letters and digits only, of any script
+    Example: "A. A. Attanasio" -> "aaattanasio", "Антон Чехов" -> "антончехов"
+    A name with no letter or digit keys as its casefolded self, never as "".
+    """
+    decomposed = unicodedata.normalize("NFKD", name)
+    folded = "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+    return "".join(ch for ch in folded if ch.isalnum()) or name.casefold()
+
+def is_reasonable_author_name(name: str) -> bool:
+    """Reject empty, numeric-only, or garbage names."""
+    if not name or len(name.strip()) < 2:
+        return False
+    s = name.strip()
+    if s.isdigit():
+        return False
+    if not _ALLOWED_NAME_RE.match(s):
+        return False
+    # too few alphabetics?
+    if sum(ch.isalpha() for ch in s) < 2:
+        return False
+    return True
+
+
+# -----------------------------
+# Row parsing
+# -----------------------------
+def _strip_quotes(value: Optional[str]) -> str:
+    return (value or "").strip('"').strip("'")
+
+
+def normalize_book_row(row: dict) -> Optional[tuple]:
+    """
+    (isbn, title, author key, author display name, year, publisher, image urls...)
+    for a books.csv row, or None if the row is rejected.
+    """
+    isbn = canonical_isbn(row["ISBN"])  # ISBN-10s are stored as ISBN-13
+    if isbn is None:
+        return None
+
+    display_name = normalize_author_display(_strip_quotes(row.get("Book-Author")).strip())
+    if not is_reasonable_author_name(display_name):
+        return None
+
+    year = row.get("Year-Of-Publication") or ""
+    return (
+        isbn,
+        _strip_quotes(row.get("Book-Title")),
+        canonical_author_key(display_name),
+        display_name,
+        int(year) if str(year).isdigit() else None,
+        _strip_quotes(row.get("Publisher")),
+        _strip_quotes(row.get("Image-URL-S")),
+        _strip_quotes(row.get("Image-URL-M")),
+        _strip_quotes(row.get("Image-URL-L")),
+    )
+
+
+def parse_book_range(file_path: str, fieldnames: Sequence[str], start: int, end: int) -> List[tuple]:
+    """
+    Normalized rows of books.csv between byte offsets `start` and `end`, each
+    prefixed with an ordinal that increases with the position in the file
+    (`start` + row index: a row takes at least one byte, so ranges never overlap).
+    Only the first row of each ISBN within the range is kept.
+    """
+    text = read_range(file_path, start, end).decode("latin-1")
+    reader = csv.DictReader(io.StringIO(text, newline=""), fieldnames=fieldnames, delimiter=";")
+    rows, seen = [], set()
+    for index, row in enumerate(reader):
+        try:
+            normalized = normalize_book_row(row)
+        except Exception:
+            # swallow bad rows silently or log if you prefer
+            continue
+        if normalized is not None and normalized[0] not in seen:
+            seen.add(normalized[0])
+            rows.append((start + index, *normalized))
+    return rows
+
+
+def normalize_quote_row(row: dict) -> Optional[tuple]:
+    """
+    (quote text, author display name, author key, tags) for a quotes file row,
+    or None if the row is rejected. The text may be empty: the author is still registered.
+    """
+    if "quote" in row:
+        text, author, tags = row.get("quote"), row.get("author"), row.get("tags")
+    elif "Quote" in row:  # quotes_02.jsonl style
+        text, author, tags = row.get("Quote"), row.get("Author"), row.get("Tags")
+    else:
+        return None
+
+    display_name = normalize_author_display((author or "Unknown").strip())
+    if not is_reasonable_author_name(display_name):
+        return None
+    return (text or "").strip(), display_name, canonical_author_key(display_name), tags or []
+
+
+def parse_quote_range(file_path: str, start: int, end: int) -> List[tuple]:
+    """Normalized rows of a JSON-lines quotes file between byte offsets `start` and `end`"""
+    rows = []
+    for line in read_range(file_path, start, end).decode("latin-1").split("\n"):
+        try:
+            if line.strip():
+                normalized = normalize_quote_row(json.loads(line))
+                if normalized is not None:
+                    rows.append(normalized)
+        except Exception:
+            continue
+    return rows
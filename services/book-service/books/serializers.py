@@ -1,14 +1,26 @@
+from django_common.utils.isbn_helpers import canonical_isbn
+from django_common.utils.serializers import SparseFieldsetSerializer
 from rest_framework import serializers
+
 from .models import Author, Book, Quote, Tag
+from .normalization import canonical_author_key
 
 
-class AuthorSerializer(serializers.ModelSerializer):
+class AuthorSerializer(SparseFieldsetSerializer):
     class Meta:
         model = Author
         fields = ["id", "name", "bio", "created_at"]
 
+    def validate_name(self, value):
+        duplicates = Author.objects.filter(canonical_key=canonical_author_key(value))
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError("An author with an equivalent name already exists.")
+        return value
+
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SparseFieldsetSerializer):
     author = AuthorSerializer(read_only=True)
 
     class Meta:
@@ -24,13 +36,27 @@ class BookSerializer(serializers.ModelSerializer):
             "image_url_l",
         ]
 
-class TagSerializer(serializers.ModelSerializer):
+    def validate_isbn(self, value):
+        # Books are stored under the ISBN-13, whichever form the client sent
+        isbn = canonical_isbn(value)
+        if isbn is None:
+            raise serializers.ValidationError("Not a valid ISBN-10 or ISBN-13.")
+        # The model's unique check ran on the raw value: an ISBN-10 passes it even if its ISBN-13 is taken
+        duplicates = Book.objects.filter(isbn=isbn)
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError("A book with this ISBN already exists.")
+        return isbn
+
+
+class TagSerializer(SparseFieldsetSerializer):
     class Meta:
         model = Tag
         fields = ["id", "name"]
 
 
-class QuoteSerializer(serializers.ModelSerializer):
+class QuoteSerializer(SparseFieldsetSerializer):
     author = AuthorSerializer()
     tags = TagSerializer(many=True)
 
@@ -1,3 +1,701 @@
-from django.test import TestCase
+import csv
+import functools
+import io
+import json
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from books.authors import rekey_authors
+from books.management.commands.import_books import Command as ImportCommand
+from books.models import Author, Book, Quote, Tag
+from books.serializers import BookSerializer
+from books.views import BookViewSet
+from django_common.utils.cache import get_or_build
+from django_common.utils.isbn_helpers import (
+    canonical_isbn,
+    canonicalize_isbn_column,
+    canonicalize_isbns,
+    isbn10_to_isbn13,
+    validate_isbns,
+)
+from django_common.utils.parallel import split_line_ranges
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TaggedCacheInvalidationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(name="Ursula K. Le Guin")
+        self.book = Book.objects.create(isbn="9780441478125", title="The Left Hand of Darkness", author=self.author)
+        self.tag = Tag.objects.create(name="classic")
+
+        self.book_urls = [reverse("book-list"), reverse("book-detail", kwargs={"isbn": self.book.isbn})]
+        self.author_urls = [reverse("author-list"), reverse("author-detail", kwargs={"id": self.author.id})]
+        self.tag_urls = [reverse("tag-list"), reverse("tag-detail", kwargs={"pk": self.tag.id})]
+
+    def warm(self, urls):
+        for url in urls:
+            self.client.get(url)
+            self.assertCached(url)
+
+    def assertCached(self, url):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_tag_write_leaves_book_and_author_entries_warm(self):
+        self.warm(self.book_urls + self.author_urls)
+
+        response = self.client.post(reverse("tag-list"), {"name": "fantasy"}, format="json")
+        self.assertEqual(response.status_code, 201)
+
+        for url in self.book_urls + self.author_urls:
+            self.assertCached(url)
+
+    def test_book_write_leaves_author_and_tag_entries_warm(self):
+        self.warm(self.book_urls + self.author_urls + self.tag_urls)
+
+        url = reverse("book-detail", kwargs={"isbn": self.book.isbn})
+        response = self.client.patch(url, {"title": "The Dispossessed"}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        for url in self.author_urls + self.tag_urls:
+            self.assertCached(url)
+        self.assertEqual(self.client.get(reverse("book-list")).data["results"][0]["title"], "The Dispossessed")
+
+    def test_author_write_invalidates_nested_book_entries(self):
+        self.warm(self.book_urls + self.tag_urls)
+
+        url = reverse("author-detail", kwargs={"id": self.author.id})
+        response = self.client.patch(url, {"name": "U. K. Le Guin"}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        book = self.client.get(reverse("book-detail", kwargs={"isbn": self.book.isbn})).data
+        self.assertEqual(book["author"]["name"], "U. K. Le Guin")
+        for url in self.tag_urls:
+            self.assertCached(url)
+
+    def test_update_invalidates_only_the_written_row(self):
+        other = Author.objects.create(name="Octavia E. Butler")
+        other_url = reverse("author-detail", kwargs={"id": other.id})
+        self.warm(self.author_urls + [other_url])
+
+        url = reverse("author-detail", kwargs={"id": self.author.id})
+        self.client.patch(url, {"bio": "American author"}, format="json")
+
+        self.assertCached(other_url)
+        self.assertEqual(self.client.get(url).data["bio"], "American author")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SingleFlightCacheTest(SimpleTestCase):
+    WORKERS = 20
+
+    def setUp(self):
+        cache.clear()
+        self.builds = 0
+        self.lock = threading.Lock()
+
+    def slow_build(self):
+        with self.lock:
+            self.builds += 1
+            build = self.builds
+        time.sleep(0.2)
+        return {"build": build}
+
+    def hammer(self):
+        results = []
+        barrier = threading.Barrier(self.WORKERS)
+
+        def worker():
+            barrier.wait()
+            results.append(get_or_build("books:list", self.slow_build, timeout=300))
+
+        threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_cold_key_is_built_once_under_concurrency(self):
+        results = self.hammer()
+
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(results, [{"build": 1}] * self.WORKERS)
+
+    def test_expired_key_is_rebuilt_once_while_stale_copy_is_served(self):
+        get_or_build("books:list", self.slow_build, timeout=0)
+
+        results = self.hammer()
+
+        self.assertEqual(self.builds, 2)
+        self.assertEqual(results.count({"build": 2}), 1)
+        self.assertEqual(results.count({"build": 1}), self.WORKERS - 1)
+        self.assertEqual(get_or_build("books:list", self.slow_build, timeout=300), {"build": 2})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class KeysetPaginationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(name="Terry Pratchett")
+        titles = ["Mort", "Small Gods", "Sourcery", "Eric"]
+        years = [1987, None, 1992, 1992, None, 1988]
+        Book.objects.bulk_create(
+            Book(isbn=f"{i:010d}", title=titles[i % len(titles)], year_of_publication=years[i % len(years)], author=author)
+            for i in range(47)
+        )
+        self.books = list(Book.objects.all())
+
+    def walk(self, params):
+        url, isbns, pages = reverse("book-list"), [], []
+        response = self.client.get(url, {**params, "cursor": ""})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            pages.append(response.data)
+            isbns += [book["isbn"] for book in response.data["results"]]
+            if not response.data["next"]:
+                return isbns, pages
+            response = self.client.get(response.data["next"])
+
+    def test_walks_every_ordering_without_gaps_or_duplicates(self):
+        orderings = {
+            "title": lambda b: (b.title, b.isbn),
+            "-title": lambda b: (tuple(-ord(c) for c in b.title), -int(b.isbn)),
+            "year_of_publication": lambda b: (b.year_of_publication is None, b.year_of_publication or 0, b.isbn),
+            "-year_of_publication": lambda b: (b.year_of_publication is not None, -(b.year_of_publication or 0), -int(b.isbn)),
+        }
+        for ordering, key in orderings.items():
+            with self.subTest(ordering=ordering):
+                isbns, pages = self.walk({"ordering": ordering})
+                self.assertEqual(isbns, [b.isbn for b in sorted(self.books, key=key)])
+                self.assertEqual([len(p["results"]) for p in pages], [20, 20, 7])
+
+    def test_previous_links_walk_back(self):
+        _, pages = self.walk({"ordering": "year_of_publication"})
+        response = self.client.get(pages[-1]["previous"])
+        self.assertEqual(response.data["results"], pages[-2]["results"])
+        response = self.client.get(response.data["previous"])
+        self.assertEqual(response.data["results"], pages[0]["results"])
+        self.assertIsNone(response.data["previous"])
+
+    def test_page_number_mode_is_the_default(self):
+        response = self.client.get(reverse("book-list"), {"page": 3})
+        self.assertEqual(response.data["count"], 47)
+        self.assertEqual(len(response.data["results"]), 7)
+
+    def test_count_estimate_header_is_opt_in(self):
+        response = self.client.get(reverse("book-list"), {"cursor": ""})
+        self.assertNotIn("X-Total-Count-Estimate", response)
+
+        response = self.client.get(reverse("book-list"), {"cursor": "", "count": "estimate", "publisher": "Corgi"})
+        self.assertIn("X-Total-Count-Estimate", response)
+        cached = self.client.get(reverse("book-list"), {"cursor": "", "count": "estimate", "publisher": "Corgi"})
+        self.assertEqual(cached["X-Total-Count-Estimate"], response["X-Total-Count-Estimate"])
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse("book-list"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FullTextSearchTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.le_guin = Author.objects.create(name="Ursula K. Le Guin")
+        self.herbert = Author.objects.create(name="Frank Herbert")
+        Book.objects.create(isbn="0441478123", title="The Left Hand of Darkness", author=self.le_guin)
+        Book.objects.create(isbn="0441172717", title="Dune", author=self.herbert)
+        Book.objects.create(isbn="0399128964", title="Dune Messiah", author=self.herbert)
+        Book.objects.create(isbn="0000000001", title="Essays on Frank Herbert", author=self.le_guin)
+        Quote.objects.create(text="Fear is the mind-killer.", author=self.herbert)
+        Quote.objects.create(text="The only thing that makes life possible is permanent uncertainty.", author=self.le_guin)
+
+    def search(self, name, term, **params):
+        response = self.client.get(reverse(f"{name}-list"), {"search": term, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def test_every_term_is_prefix_matched(self):
+        self.assertEqual([b["isbn"] for b in self.search("book", "lef dark")], ["0441478123"])
+        self.assertEqual(self.search("book", "left dune"), [])
+
+    def test_title_matches_rank_above_author_matches(self):
+        titles = [b["title"] for b in self.search("book", "herbert")]
+        self.assertEqual(titles[0], "Essays on Frank Herbert")
+        self.assertCountEqual(titles[1:], ["Dune", "Dune Messiah"])
+
+    def test_explicit_ordering_overrides_rank(self):
+        titles = [b["title"] for b in self.search("book", "herbert", ordering="title")]
+        self.assertEqual(titles, ["Dune", "Dune Messiah", "Essays on Frank Herbert"])
+
+    def test_ranked_results_walk_with_cursor(self):
+        titles = ["Dune", "Dune Dune", "The Dune Encyclopedia", "Herbert's Dune"]
+        Book.objects.bulk_create(
+            Book(isbn=f"{i:010d}", title=titles[i % len(titles)], author=self.herbert) for i in range(10, 55)
+        )
+        url, pages = reverse("book-list"), []
+        response = self.client.get(url, {"search": "dune", "cursor": ""})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([b["isbn"] for b in response.data["results"]])
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+
+        by_page_number = []
+        for page in range(1, 4):
+            response = self.client.get(url, {"search": "dune", "page": page})
+            by_page_number += [b["isbn"] for b in response.data["results"]]
+        self.assertEqual([len(p) for p in pages], [20, 20, 7])
+        self.assertEqual(sum(pages, []), by_page_number)
+
+        response = self.client.get(url, {"search": "dune", "cursor": "", "ordering": "title"})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("quote-list"), {"search": "life", "cursor": ""})
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_author_rename_refreshes_book_vectors(self):
+        self.herbert.name = "F. P. Herbert Jr."
+        self.herbert.save()
+        self.assertEqual(len(self.search("book", "jr")), 2)
+
+    def test_quote_search_is_stemmed(self):
+        texts = [q["text"] for q in self.search("quote", "uncertain")]
+        self.assertEqual(texts, ["The only thing that makes life possible is permanent uncertainty."])
+        self.assertEqual(len(self.search("quote", "makes life")), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SparseFieldsetTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(name="Jorge Luis Borges", bio="Argentine writer")
+        Book.objects.create(isbn="9780811200127", title="Labyrinths", year_of_publication=1962, author=self.author)
+        Book.objects.create(isbn="9780802130303", title="Ficciones", author=self.author)
+        quote = Quote.objects.create(text="I have always imagined that Paradise will be a kind of library.", author=self.author)
+        quote.tags.add(Tag.objects.create(name="books"), Tag.objects.create(name="paradise"))
+
+    def get(self, name, **params):
+        response = self.client.get(reverse(f"{name}-list"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def test_values_fast_path_matches_serializer_output(self):
+        for params in [{}, {"ordering": "title"}, {"fields": "isbn,author", "expand": "author"}, {"cursor": ""}]:
+            with self.subTest(params=params):
+                with mock.patch.object(BookViewSet, "values_fast_path", False):
+                    expected = self.get("book", **params)
+                cache.clear()
+                self.assertEqual(self.get("book", **params), expected)
+
+    def test_fields_limits_columns_and_flattens_relations(self):
+        books = self.get("book", fields="isbn,title,author", ordering="title")
+        self.assertEqual(books[0], {"isbn": "9780802130303", "title": "Ficciones", "author": self.author.id})
+
+    def test_expand_nests_the_relation(self):
+        book = self.get("book", fields="title,author", expand="author", ordering="title")[0]
+        self.assertEqual(book["author"]["name"], "Jorge Luis Borges")
+        self.assertEqual(set(book), {"title", "author"})
+
+    def test_many_relations_are_flattened_to_ids(self):
+        with self.assertNumQueries(3):  # count, page, tags prefetch
+            quote = self.get("quote", fields="text,tags")[0]
+        self.assertEqual(sorted(quote["tags"]), sorted(Tag.objects.values_list("id", flat=True)))
+
+    def test_detail_fieldsets_are_cached_separately(self):
+        url = reverse("book-detail", kwargs={"isbn": "9780811200127"})
+        self.assertIn("publisher", self.client.get(url).data)
+        self.assertEqual(self.client.get(url, {"fields": "title"}).data, {"title": "Labyrinths"})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ExportTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(name="Italo Calvino")
+        Book.objects.create(isbn="0156439611", title="Invisible Cities", author=self.author, year_of_publication=1974)
+        Book.objects.create(isbn="0156001314", title="If on a Winter's Night", author=self.author)
+        quote = Quote.objects.create(text="The more enlightened our houses are, the more their walls ooze ghosts.", author=self.author)
+        quote.tags.add(Tag.objects.create(name="houses"), Tag.objects.create(name="ghosts"))
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(f"{name}-export"), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_streams_one_object_per_line(self):
+        rows = [json.loads(line) for line in self.export("book").splitlines()]
+        self.assertEqual([row["isbn"] for row in rows], ["0156001314", "0156439611"])
+        self.assertEqual(rows[1]["author__name"], "Italo Calvino")
+        self.assertEqual(rows[1]["year_of_publication"], 1974)
+
+    def test_csv_has_header_and_flattened_lists(self):
+        rows = list(csv.DictReader(io.StringIO(self.export("quote", output="csv"))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["tag_names"], "ghosts|houses")
+        self.assertEqual(rows[0]["author__name"], "Italo Calvino")
+
+    def test_filters_apply_and_bad_position_is_rejected(self):
+        rows = self.export("book", year_of_publication=1974).splitlines()
+        self.assertEqual(len(rows), 1)
+        response = self.client.get(reverse("book-export"), {"after": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tag_changes_touch_the_quote(self):
+        quote = Quote.objects.get()
+
+        def touched(change):
+            before = Quote.objects.values_list("updated_at", flat=True).get()
+            change()
+            return Quote.objects.values_list("updated_at", flat=True).get() > before
+
+        self.assertTrue(touched(lambda: quote.tags.add(Tag.objects.create(name="walls"))))
+        self.assertTrue(touched(lambda: quote.tags.remove(Tag.objects.get(name="walls"))))
+        self.assertTrue(touched(lambda: Tag.objects.filter(name="ghosts").update(name="phantoms")))
+        self.assertTrue(touched(lambda: Author.objects.filter(pk=self.author.pk).update(name="I. Calvino")))
+        self.assertFalse(touched(lambda: Tag.objects.create(name="untagged")))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ExportPositionTest(APITransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(name="Italo Calvino")
+        Book.objects.create(isbn="0156439611", title="Invisible Cities", author=self.author)
+
+    def export(self, **params):
+        response = self.client.get(reverse("book-export"), params)
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        return [row["isbn"] for row in rows], response["X-Export-Position"]
+
+    def test_pulls_return_rows_changed_since_the_last_one(self):
+        isbns, position = self.export()
+        self.assertEqual(isbns, ["0156439611"])
+        self.assertEqual(self.export(after=position), ([], position))
+
+        Book.objects.filter(isbn="0156439611").update(publisher="Harcourt")  # stamped by the trigger
+        Book.objects.create(isbn="0156453800", title="Mr. Palomar", author=self.author)
+        isbns, position = self.export(after=position)
+        self.assertEqual(isbns, ["0156439611", "0156453800"])
+        self.assertEqual(self.export(after=position)[0], [])
+
+    def test_rows_committed_late_are_not_skipped(self):
+        _, position = self.export()
+        written, commit = threading.Event(), threading.Event()
+
+        def long_transaction():
+            try:
+                with transaction.atomic():
+                    Book.objects.create(isbn="0156001314", title="If on a Winter's Night", author=self.author)
+                    written.set()
+                    commit.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=long_transaction)
+        thread.start()
+        written.wait(10)
+        # Written after the open transaction's row, and committed first
+        Book.objects.create(isbn="0156453800", title="Mr. Palomar", author=self.author)
+        isbns, next_position = self.export(after=position)
+        self.assertEqual(isbns, [])  # held back until the older transaction finishes
+
+        commit.set()
+        thread.join()
+        isbns, _ = self.export(after=next_position)
+        self.assertEqual(isbns, ["0156001314", "0156453800"])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BatchRetrieveTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(name="Octavia E. Butler")
+        self.isbns = ["9780446675505", "9780807083109", "9780446601894"]
+        for isbn, title in zip(self.isbns, ["Parable of the Sower", "Kindred", "Parable of the Talents"]):
+            Book.objects.create(isbn=isbn, title=title, author=author)
+        self.url = reverse("book-batch")
+
+    def test_results_keep_request_order_and_report_missing(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"isbn__in": "9780807083109,9789999999991,9780446675505"})
+        self.assertEqual([book["isbn"] for book in response.data["results"]], ["9780807083109", "9780446675505"])
+        self.assertEqual(response.data["missing"], ["9789999999991"])
+
+    def test_post_body_and_warm_entries_shared_with_retrieve(self):
+        self.client.get(reverse("book-detail", kwargs={"isbn": self.isbns[0]}))
+        with self.assertNumQueries(1):  # only the two misses hit the database
+            response = self.client.post(self.url, {"isbn__in": self.isbns}, format="json")
+        self.assertEqual(len(response.data["results"]), 3)
+
+        with self.assertNumQueries(0):
+            self.client.post(self.url, {"isbn__in": self.isbns}, format="json")
+            self.client.get(reverse("book-detail", kwargs={"isbn": self.isbns[2]}))
+
+    def test_generations_are_read_in_one_round_trip(self):
+        author = Author.objects.get()
+        isbns = [isbn10_to_isbn13(f"{i:09d}") for i in range(30)]
+        Book.objects.bulk_create(Book(isbn=isbn, title=f"Story {isbn}", author=author) for isbn in isbns)
+        get_many = LocMemCache.get_many
+        with mock.patch.object(LocMemCache, "get_many", autospec=True, side_effect=get_many) as spy:
+            self.client.get(self.url, {"isbn__in": ",".join(isbns)})
+        # generations, generations seeded meanwhile, entries
+        self.assertEqual(spy.call_count, 3)
+        with mock.patch.object(LocMemCache, "get_many", autospec=True, side_effect=get_many) as spy:
+            response = self.client.get(self.url, {"isbn__in": ",".join(isbns)})
+        self.assertEqual(spy.call_count, 2)
+        self.assertEqual(len(response.data["results"]), 30)
+
+    def test_update_invalidates_the_batched_entry(self):
+        self.client.get(self.url, {"isbn__in": ",".join(self.isbns)})
+        self.client.patch(reverse("book-detail", kwargs={"isbn": self.isbns[1]}), {"title": "Kindred (25th ed.)"})
+        titles = [book["title"] for book in self.client.get(self.url, {"isbn__in": ",".join(self.isbns)}).data["results"]]
+        self.assertIn("Kindred (25th ed.)", titles)
+
+    def test_isbn10_lookups_find_the_stored_isbn13(self):
+        for isbn in ["0446675504", "0-446-67550-4", "9780446675505"]:
+            response = self.client.get(reverse("book-detail", kwargs={"isbn": isbn}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["isbn"], "9780446675505")
+
+        response = self.client.get(self.url, {"isbn__in": "0807083100,9780446675505,0446675504"})
+        self.assertEqual([book["isbn"] for book in response.data["results"]], ["9780807083109", "9780446675505"])
+        self.assertEqual(response.data["missing"], [])
+
+    def test_written_isbns_are_stored_as_isbn13(self):
+        author = Author.objects.get()
+        serializer = BookSerializer(data={"isbn": "0-553-28368-5", "title": "Dawn"})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.save(author=author).isbn, "9780553283686")
+
+        for isbn in ["0446675504", "9780446675505", "1234567890"]:  # taken as ISBN-10 or -13, invalid
+            self.assertFalse(BookSerializer(data={"isbn": isbn, "title": "Copy"}).is_valid())
+        response = self.client.patch(reverse("book-detail", kwargs={"isbn": "9780553283686"}), {"isbn": "0807083100"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("isbn", response.data)
+
+    def test_invalid_batches_are_rejected(self):
+        self.assertEqual(self.client.post(self.url, {"isbn__in": "9780807083109"}, format="json").status_code, 400)
+        with mock.patch.object(BookViewSet, "batch_max_size", 2):
+            self.assertEqual(self.client.get(self.url, {"isbn__in": ",".join(self.isbns)}).status_code, 400)
+
+
+class ImportQuotesTest(APITestCase):
+    ROWS = [
+        {"quote": "Be yourself; everyone else is already taken.", "author": "oscar  wilde", "tags": ["honesty", " life "]},
+        {"Quote": "Be yourself; everyone else is already taken.", "Author": "Someone Else", "Tags": ["inspirational"]},
+        {"quote": "To live is the rarest thing\tin the world.", "author": "Oscar Wilde", "tags": ["life", ""]},
+        {"quote": "Ignored: unreasonable author", "author": "42", "tags": ["life"]},
+        {"quote": "", "author": "Mark Twain", "tags": ["humor"]},
+    ]
+
+    def import_rows(self, rows):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", encoding="latin-1") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+            f.flush()
+            ImportCommand(stdout=io.StringIO()).import_quotes(f.name)
+
+    def test_bulk_import_matches_per_row_semantics(self):
+        wilde = Author.objects.create(name="Oscar Wilde")
+        self.import_rows(self.ROWS)
+
+        self.assertEqual(Quote.objects.count(), 2)
+        self.assertEqual(set(Quote.objects.values_list("author", flat=True)), {wilde.id})
+        self.assertEqual(set(Author.objects.values_list("name", flat=True)), {"Oscar Wilde", "Someone Else", "Mark Twain"})
+        self.assertEqual(set(Tag.objects.values_list("name", flat=True)), {"honesty", "life", "inspirational"})
+        self.assertEqual(
+            sorted(Quote.objects.get(text__startswith="Be yourself").tags.values_list("name", flat=True)),
+            ["honesty", "inspirational", "life"],
+        )
+        self.assertEqual(Quote.objects.get(text__startswith="To live").text, self.ROWS[2]["quote"])
+
+    def test_reimport_is_idempotent_and_adds_new_tags(self):
+        self.import_rows(self.ROWS)
+        self.import_rows(self.ROWS + [{"quote": self.ROWS[2]["quote"], "author": "Oscar Wilde", "tags": ["art"]}])
+
+        self.assertEqual(Quote.objects.count(), 2)
+        self.assertEqual(Quote.tags.through.objects.count(), 5)
+
+
+class ImportBooksTest(APITestCase):
+    HEADER = ["ISBN", "Book-Title", "Book-Author", "Year-Of-Publication", "Publisher", "Image-URL-S", "Image-URL-M", "Image-URL-L"]
+    ROWS = [
+        ["0441478123", "The Left Hand of Darkness", "ursula k. le guin", "1969", "Ace", "", "", ""],
+        ["0-441-47812-3", "Duplicate ISBN, ignored", "Ursula K. Le Guin", "1969", "Ace", "", "", ""],
+        ["978-0-441-47812-5", "Same book as ISBN-13, ignored", "Ursula K. Le Guin", "1969", "Ace", "", "", ""],
+        ["006051275X", "The Dispossessed", "Ursula K. Le Guin", "n/a", "Harper", "", "", ""],
+        ["1234567890", "Invalid ISBN", "Ursula K. Le Guin", "", "", "", "", ""],
+        ["0553283685", "Hyperion", "Dan Simmons", "1989", "Bantam", "", "", ""],
+        ["0380789035", "Unreasonable author", "42", "", "", "", "", ""],
+        ["0553288202", "The Fall of Hyperion", "dan simmons", "1990", "Bantam", "", "", ""],
+    ]
+
+    def import_rows(self, rows, **kwargs):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="", encoding="latin-1") as f:
+            writer = csv.writer(f, delimiter=";", quoting=csv.QUOTE_ALL)
+            writer.writerows([self.HEADER, *rows])
+            f.flush()
+            ImportCommand(stdout=io.StringIO()).import_books(f.name, **kwargs)
+
+    def test_streaming_import_across_chunks(self):
+        existing = Author.objects.create(name="Ursula K. Le Guin")
+        self.import_rows(self.ROWS, chunk_size=2)
+
+        books = dict(Book.objects.values_list("isbn", "author__name"))
+        self.assertEqual(
+            books,
+            {
+                "9780441478125": "Ursula K. Le Guin",
+                "9780060512750": "Ursula K. Le Guin",
+                "9780553283686": "Dan Simmons",
+                "9780553288209": "Dan Simmons",
+            },
+        )
+        self.assertEqual(Book.objects.get(isbn="9780441478125").title, "The Left Hand of Darkness")
+        self.assertIsNone(Book.objects.get(isbn="9780060512750").year_of_publication)
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Book.objects.filter(author=existing).count(), 2)
+
+    def test_parallel_parsing_matches_serial(self):
+        rows = self.ROWS * 3
+        with mock.patch(
+            "books.management.commands.import_books.split_line_ranges",
+            functools.partial(split_line_ranges, range_bytes=64),
+        ):
+            self.import_rows(rows, workers=2)
+        parallel = sorted(Book.objects.values_list("isbn", "title", "author__name"))
+        Book.objects.all().delete()
+        self.import_rows(rows)
+        self.assertEqual(sorted(Book.objects.values_list("isbn", "title", "author__name")), parallel)
+
+    def test_reimport_leaves_existing_books_untouched(self):
+        self.import_rows(self.ROWS, atomic=True)
+        self.import_rows([["0441478123", "Changed title", "Someone New", "", "", "", "", ""]])
+
+        self.assertEqual(Book.objects.count(), 4)
+        self.assertEqual(Book.objects.get(isbn="9780441478125").title, "The Left Hand of Darkness")
+
+
+class DeduplicateAuthorsTest(APITestCase):
+    def test_duplicates_are_merged_into_the_most_complete_name(self):
+        # save() keeps keys unique, so simulate rows keyed under older normalization rules
+        shorter, primary, upper, other = Author.objects.bulk_create(
+            Author(name=name, canonical_key=f"stale{i}")
+            for i, name in enumerate([
+                "Gabriel GarciaMarquez",
+                "Gabriel García Márquez",  # longer than the older row
+                "GABRIEL GARCIA MARQUEZ",  # same length, newer id
+                "Mario Vargas Llosa",
+            ])
+        )
+        Book.objects.create(isbn="0060883286", title="One Hundred Years of Solitude", author=shorter)
+        Book.objects.create(isbn="0307389731", title="Love in the Time of Cholera", author=upper)
+        Quote.objects.create(text="It is not true that people stop pursuing dreams because they grow old.", author=upper)
+
+        out = io.StringIO()
+        ImportCommand(stdout=out).deduplicate_authors()
+
+        self.assertIn("Merged 2 duplicate", out.getvalue())
+        self.assertEqual(set(Author.objects.values_list("id", flat=True)), {primary.id, other.id})
+        self.assertEqual(set(Book.objects.values_list("author", flat=True)), {primary.id})
+        self.assertEqual(Quote.objects.get().author, primary)
+        self.assertEqual(Author.objects.get(pk=primary.pk).canonical_key, "gabrielgarciamarquez")
+
+    def test_keys_can_move_between_authors(self):
+        # Each author holds the key the other one should get
+        borges, cortazar = Author.objects.bulk_create([
+            Author(name="Jorge Luis Borges", canonical_key="juliocortazar"),
+            Author(name="Julio Cortázar", canonical_key="jorgeluisborges"),
+        ])
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.assertEqual(rekey_authors(cursor), 0)
+
+        self.assertEqual(Author.objects.get(pk=borges.pk).canonical_key, "jorgeluisborges")
+        self.assertEqual(Author.objects.get(pk=cortazar.pk).canonical_key, "juliocortazar")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AuthorCanonicalKeyTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(name="Gabriel García Márquez")
+
+    def test_key_follows_name_on_save(self):
+        self.assertEqual(self.author.canonical_key, "gabrielgarciamarquez")
+        self.author.name = "Mario Vargas Llosa"
+        self.author.save(update_fields=["name"])
+        self.assertEqual(Author.objects.get(pk=self.author.pk).canonical_key, "mariovargasllosa")
+
+    def test_name_filter_matches_spelling_variants(self):
+        Author.objects.create(name="Mario Vargas Llosa")
+        response = self.client.get(reverse("author-list"), {"name": "GABRIEL GARCIA MARQUEZ"})
+        self.assertEqual([a["id"] for a in response.data["results"]], [self.author.id])
+
+    def test_equivalent_name_is_rejected(self):
+        response = self.client.post(reverse("author-list"), {"name": "Gabriel Garcia Marquez"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("name", response.data)
+        response = self.client.patch(reverse("author-detail", args=[self.author.id]), {"name": "Gabriel García Márquez"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_non_latin_names_keep_distinct_keys(self):
+        tolstoy = Author.objects.create(name="Лев Толстой")
+        murakami = Author.objects.create(name="村上春樹")
+        self.assertEqual(tolstoy.canonical_key, "левтолстои")  # й decomposes to и + breve
+        self.assertEqual(murakami.canonical_key, "村上春樹")
+        self.assertEqual(Author.objects.create(name="?!").canonical_key, "?!")
+
+        self.assertEqual(self.client.post(reverse("author-list"), {"name": "ЛЕВ  ТОЛСТОЙ"}).status_code, 400)
+        response = self.client.get(reverse("author-list"), {"name": "лев толстой"})
+        self.assertEqual([a["id"] for a in response.data["results"]], [tolstoy.id])
+
+
+class IsbnHelpersTest(APITestCase):
+    VALUES = [
+        "0441478123", "0-441-47812-3", '"006051275x"', " 9780553283686 ", "978-0-306-40615-7",
+        "1234567890", "9780553283687", "04414781234", "044147812", "ISBN044147", "", "Ä441478123",
+    ]
+
+    def test_batch_matches_scalar(self):
+        expected = [canonical_isbn(value) for value in self.VALUES]
+        self.assertEqual(
+            expected[:5], ["9780441478125", "9780441478125", "9780060512750", "9780553283686", "9780306406157"]
+        )
+        self.assertEqual(expected[5:], [None] * 7)
+        self.assertEqual(list(canonicalize_isbns(self.VALUES)), expected)
+        self.assertEqual(list(validate_isbns(self.VALUES)), [isbn is not None for isbn in expected])
+        self.assertEqual(len(canonicalize_isbns([])), 0)
+
+    def test_stored_isbn10s_are_rewritten(self):
+        author = Author.objects.create(name="Ursula K. Le Guin")
+        Book.objects.create(isbn="0441478123", title="Duplicate of the ISBN-13 row", author=author)
+        Book.objects.create(isbn="9780441478125", title="The Left Hand of Darkness", author=author)
+        Book.objects.create(isbn="006051275X", title="The Dispossessed", author=author)
+        Book.objects.create(isbn="0000000002", title="Invalid, left alone", author=author)
+
+        with connection.cursor() as cursor:
+            self.assertEqual(canonicalize_isbn_column(cursor, Book._meta.db_table), 1)
+        self.assertEqual(
+            dict(Book.objects.values_list("isbn", "title")),
+            {
+                "9780441478125": "The Left Hand of Darkness",
+                "9780060512750": "The Dispossessed",
+                "0000000002": "Invalid, left alone",
+            },
+        )
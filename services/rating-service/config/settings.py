@@ -18,3 +18,11 @@ DATABASES = {
 }
 
 CACHES["default"]["KEY_PREFIX"] = os.getenv("RATING_SERVICE", "rating_service")
+
+# Write-behind mode: POSTed ratings are queued on a Redis stream and answered with 202;
+# `manage.py drain_ratings` upserts them in batches (see ratings/ingest.py)
+RATINGS_WRITE_BEHIND = os.getenv("RATING_WRITE_BEHIND") == "true"
+RATINGS_STREAM = f"{CACHES['default']['KEY_PREFIX']}:ratings:stream"
+RATINGS_STREAM_GROUP = "rating-writers"
+RATINGS_STREAM_MAX_BACKLOG = int(os.getenv("RATING_STREAM_MAX_BACKLOG", 500_000))
+RATINGS_STREAM_RETRY_AFTER = 5
@@ -0,0 +1,171 @@
+"""
+How ratings get into the database: the set-based upsert shared by the bulk
+endpoint and the write-behind consumer, and the Redis stream that buffers
+writes in write-behind mode (RATINGS_WRITE_BEHIND).
+
+Write-behind: the API validates ratings, appends one stream entry per rating
+and answers 202 at once; `manage.py drain_ratings` reads the stream through a
+consumer group and upserts each batch in one statement. Entries are acked (and
+deleted) only once their batch is committed, so a consumer that dies mid-batch
+leaves them pending and another consumer claims them: at-least-once delivery,
+made harmless by the upsert, which carries each entry's stream id as the
+rating's version and never replaces a newer rating with an older entry.
+"""
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from django_common.utils.cache import invalidate, model_tag, row_tag
+from ratings.models import BookRatingStats, Rating, write_version
+
+RatingKey = Tuple[int, str]
+
+
+def invalidate_stats(isbns):
+    """Drop the cached stats of `isbns`: the triggers rewrite them behind the cache's back"""
+    invalidate(model_tag(BookRatingStats), *(row_tag(BookRatingStats, isbn) for isbn in set(isbns)))
+
+
+def upsert_ratings(rows: Dict[RatingKey, int], versions: Optional[Dict[RatingKey, int]] = None) -> int:
+    """
+    Insert or update {(user_id, isbn): rating} in a single statement.
+    `versions` ({(user_id, isbn): write_version}) default to now; a stored
+    rating with a newer version is left alone. Returns the number of rows written.
+    """
+    if not rows:
+        return 0
+    now = write_version(time.time_ns() // 1_000_000)
+    versions = versions or {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {Rating._meta.db_table} AS r (user_id, isbn, rating, version)
+            SELECT * FROM unnest(%s::bigint[], %s::text[], %s::smallint[], %s::bigint[])
+            ON CONFLICT (user_id, isbn) DO UPDATE SET rating = EXCLUDED.rating, version = EXCLUDED.version
+            WHERE EXCLUDED.version >= r.version
+            """,
+            [
+                [user_id for user_id, _ in rows],
+                [isbn for _, isbn in rows],
+                list(rows.values()),
+                [versions.get(key, now) for key in rows],
+            ],
+        )
+        return cursor.rowcount
+
+
+# -----------------------------
+# Write-behind stream
+# -----------------------------
+def redis_connection():
+    return get_redis_connection("default")
+
+
+def ensure_group(client=None) -> None:
+    """Create the consumer group (and the stream) if they do not exist yet"""
+    client = client or redis_connection()
+    try:
+        client.xgroup_create(settings.RATINGS_STREAM, settings.RATINGS_STREAM_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def backlog(client=None) -> int:
+    """Entries not yet committed: acked entries are deleted, so this is the stream length"""
+    return (client or redis_connection()).xlen(settings.RATINGS_STREAM)
+
+
+def enqueue_ratings(ratings: Iterable[dict], client=None) -> int:
+    """Append validated ratings to the stream, in order, in one round trip"""
+    client = client or redis_connection()
+    pipe = client.pipeline(transaction=False)
+    count = 0
+    for rating in ratings:
+        pipe.xadd(settings.RATINGS_STREAM, {"u": rating["user_id"], "i": rating["isbn"], "r": rating["rating"]})
+        count += 1
+    pipe.execute()
+    return count
+
+
+def entry_version(entry_id: bytes) -> int:
+    """write_version() of a stream entry, from its id (<ms>-<seq>)"""
+    ms, seq = entry_id.split(b"-")
+    return write_version(int(ms), int(seq))
+
+
+def parse_entries(entries: List[tuple]) -> Tuple[Dict[RatingKey, int], Dict[RatingKey, int], List[bytes]]:
+    """
+    ({(user_id, isbn): rating}, {(user_id, isbn): entry_version}, ids of
+    malformed or deleted entries) for stream entries.
+    Entries are in stream order, so the last rating of a (user, book) wins,
+    as it would with synchronous writes. Across batches the versions decide:
+    an entry reclaimed from a dead consumer does not undo a later rating.
+    """
+    rows, versions, malformed = {}, {}, []
+    for entry_id, fields in entries:
+        try:
+            key = int(fields[b"u"]), fields[b"i"].decode()
+            rows[key] = int(fields[b"r"])
+            versions[key] = entry_version(entry_id)
+        except (KeyError, TypeError, ValueError, UnicodeDecodeError):
+            malformed.append(entry_id)
+    return rows, versions, malformed
+
+
+def acknowledge(entry_ids: List[bytes], client=None) -> None:
+    """Ack and delete committed entries, so the stream only holds the backlog"""
+    if not entry_ids:
+        return
+    client = client or redis_connection()
+    pipe = client.pipeline(transaction=False)
+    pipe.xack(settings.RATINGS_STREAM, settings.RATINGS_STREAM_GROUP, *entry_ids)
+    pipe.xdel(settings.RATINGS_STREAM, *entry_ids)
+    pipe.execute()
+
+
+def _entry_age(entry_id: Optional[bytes]) -> Optional[float]:
+    # Stream ids start with the millisecond timestamp of the XADD
+    if not entry_id:
+        return None
+    return max(0.0, time.time() - int(entry_id.split(b"-")[0]) / 1000)
+
+
+def queue_metrics(client=None) -> dict:
+    """
+    Backpressure metrics of the write-behind queue:
+        backlog        ratings accepted but not committed yet
+        pending        delivered to a consumer, not committed yet
+        lag            not delivered to any consumer yet
+        consumers      consumers registered in the group
+        oldest_age     seconds since the oldest uncommitted rating was accepted
+        max_backlog    the backlog at which writes are refused (429)
+    Read-only: the stream and group are created by the first write and the
+    drain command. Without a stream the queue is empty; without a group
+    (no consumer started yet) nothing has been delivered.
+    """
+    client = client or redis_connection()
+    try:
+        stream = client.xinfo_stream(settings.RATINGS_STREAM)
+        groups = client.xinfo_groups(settings.RATINGS_STREAM)
+    except ResponseError as e:
+        if "no such key" not in str(e).lower():
+            raise
+        stream, groups = {"length": 0}, []
+    group = next(
+        (group for group in groups if group["name"].decode() == settings.RATINGS_STREAM_GROUP),
+        {"pending": 0, "lag": stream["length"], "consumers": 0},
+    )
+    first = stream.get("first-entry")
+    return {
+        "backlog": stream["length"],
+        "pending": group["pending"],
+        "lag": group.get("lag"),
+        "consumers": group["consumers"],
+        "oldest_age": _entry_age(first[0] if first else None),
+        "max_backlog": settings.RATINGS_STREAM_MAX_BACKLOG,
+    }
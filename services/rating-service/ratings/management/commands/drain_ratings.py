@@ -0,0 +1,132 @@
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ratings.ingest import (
+    acknowledge,
+    ensure_group,
+    invalidate_stats,
+    parse_entries,
+    queue_metrics,
+    redis_connection,
+    upsert_ratings,
+)
+
+DEFAULT_BATCH = 1000
+
+
+class Command(BaseCommand):
+    help = 'Drain the write-behind rating stream into the database, one upsert per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH,
+            help='Stream entries read, upserted and acked per batch.',
+        )
+        parser.add_argument(
+            '--consumer', default=f'{socket.gethostname()}-{os.getpid()}',
+            help='Name of this consumer in the consumer group.',
+        )
+        parser.add_argument(
+            '--block-ms', type=int, default=2000,
+            help='How long to wait for new entries when the stream is empty.',
+        )
+        parser.add_argument(
+            '--claim-idle-ms', type=int, default=60000,
+            help='Take over entries left pending this long by another (dead) consumer.',
+        )
+        parser.add_argument(
+            '--report-every', type=float, default=30,
+            help='Seconds between progress and backlog reports.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the stream is drained instead of waiting for new entries.',
+        )
+
+    def handle(self, *args, **kwargs):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        client = redis_connection()
+        ensure_group(client)
+        self.stdout.write(f'Draining {settings.RATINGS_STREAM} as {kwargs["consumer"]}')
+
+        # Start with our own pending entries: left over by a previous run under
+        # the same name, or by a batch that failed
+        own_pending = True
+        written, last_report = 0, time.monotonic()
+        while not self.stopping:
+            entries = self.read_batch(client, kwargs, own_pending)
+            if not entries:
+                if own_pending:
+                    own_pending = False
+                    continue
+                if kwargs['once']:
+                    break
+                entries = self.read_new(client, kwargs, block=True)
+            if entries:
+                try:
+                    written += self.write_batch(client, entries)
+                except Exception as e:
+                    # Nothing was acked: the entries stay pending and are retried
+                    self.stderr.write(f'Batch of {len(entries)} ratings failed, retrying: {e}')
+                    own_pending = True
+                    time.sleep(1)
+
+            if time.monotonic() - last_report >= kwargs['report_every']:
+                self.report(client, written, time.monotonic() - last_report)
+                written, last_report = 0, time.monotonic()
+
+        self.report(client, written, time.monotonic() - last_report)
+        self.stdout.write(self.style.SUCCESS('Stopped'))
+
+    def stop(self, signum, frame):
+        # Finish the batch at hand, so nothing is left half-acked
+        self.stopping = True
+
+    def read_batch(self, client, kwargs, own_pending: bool) -> list:
+        """Our pending entries, else entries abandoned by other consumers, else new entries"""
+        if own_pending:
+            return self.read(client, kwargs, '0')
+        _, claimed, _ = client.xautoclaim(
+            settings.RATINGS_STREAM, settings.RATINGS_STREAM_GROUP, kwargs['consumer'],
+            min_idle_time=kwargs['claim_idle_ms'], start_id='0-0', count=kwargs['batch_size'],
+        )
+        # Entries deleted while pending come back as None
+        claimed = [entry for entry in claimed if entry and entry[1]]
+        return claimed or self.read_new(client, kwargs)
+
+    def read_new(self, client, kwargs, block: bool = False) -> list:
+        return self.read(client, kwargs, '>', kwargs['block_ms'] if block else None)
+
+    def read(self, client, kwargs, start: str, block=None) -> list:
+        response = client.xreadgroup(
+            settings.RATINGS_STREAM_GROUP, kwargs['consumer'], {settings.RATINGS_STREAM: start},
+            count=kwargs['batch_size'], block=block,
+        )
+        return response[0][1] if response else []
+
+    def write_batch(self, client, entries: list) -> int:
+        rows, versions, malformed = parse_entries(entries)
+        if malformed:
+            self.stderr.write(f'Dropping {len(malformed)} malformed entries')
+        written = upsert_ratings(rows, versions)
+        # One statement, committed on its own (autocommit). Acked only once committed:
+        # a crash before the ack redelivers the batch, and upserting it again is harmless
+        acknowledge([entry_id for entry_id, _ in entries], client)
+        invalidate_stats(isbn for _, isbn in rows)
+        return written
+
+    def report(self, client, written: int, elapsed: float):
+        metrics = queue_metrics(client)
+        age = metrics['oldest_age']
+        self.stdout.write(
+            f'  … {written} ratings written ({written / max(elapsed, 1e-9):.0f}/s), '
+            f'backlog {metrics["backlog"]}, pending {metrics["pending"]}'
+            + (f', oldest {age:.1f}s' if age is not None else '')
+        )
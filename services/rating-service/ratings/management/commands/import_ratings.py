@@ -1,73 +1,152 @@
 import csv
+import io
+import json
 import os
-from django.core.management.base import BaseCommand
-from ratings.models import Rating
+import time
+from collections import Counter
+from typing import List, Tuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from ratings.models import Rating, write_version
 from config.settings import BASE_DIR
+from django_common.utils.bulk import copy_rows
+from django_common.utils.isbn_helpers import canonicalize_isbns
+from django_common.utils.parallel import DEFAULT_RANGE_BYTES, read_range, split_line_ranges
+
+FIELDS = ['User-ID', 'ISBN', 'Book-Rating']
+STAGING_COLUMNS = ['ord', 'user_id', 'isbn', 'rating']
+
+
+def parse_rating_range(file_path: str, columns: List[int], start: int, end: int) -> Tuple[List[tuple], Counter]:
+    """
+    Rows (ordinal, user id, ISBN-13, rating) of ratings.csv between byte offsets
+    `start` and `end`, and the count of rows rejected per reason.
+    `columns` are the positions of the User-ID, ISBN and Book-Rating fields.
+    """
+    text = read_range(file_path, start, end).decode('latin-1')
+    user_col, isbn_col, rating_col = columns
+    stats = Counter()
+    parsed = []
+    for index, row in enumerate(csv.reader(io.StringIO(text, newline=''), delimiter=';')):
+        try:
+            user_id, isbn, rating = row[user_col], row[isbn_col], row[rating_col]
+        except IndexError:
+            stats['malformed'] += 1
+            continue
+        if not user_id.isdigit() or not rating.isdigit():
+            stats['malformed'] += 1
+        elif int(rating) == 0:
+            stats['implicit (0) rating'] += 1
+        else:
+            parsed.append((start + index, int(user_id), isbn, int(rating)))
+
+    # Validate every ISBN of the chunk in one vectorized pass; ISBN-10s are stored as ISBN-13
+    isbns = canonicalize_isbns([isbn for _, _, isbn, _ in parsed])
+    rows = [(ord_, user_id, isbn, rating) for (ord_, user_id, _, rating), isbn in zip(parsed, isbns) if isbn is not None]
+    stats['invalid ISBN'] += len(parsed) - len(rows)
+    return rows, stats
+
 
 class Command(BaseCommand):
     help = 'Import ratings from ratings.csv'
 
-    def handle(self, *args, **kwargs):
-        file_path = os.path.join(BASE_DIR, 'data/ratings.csv')
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=os.path.join(BASE_DIR, 'data/ratings.csv'))
+        parser.add_argument(
+            '--chunk-bytes', type=int, default=DEFAULT_RANGE_BYTES,
+            help='Bytes of the file read, staged and committed per chunk (bounds memory use).',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore the checkpoint of an interrupted import and start from the beginning.',
+        )
 
+    def handle(self, *args, **kwargs):
+        file_path = kwargs['file']
+        checkpoint_path = f'{file_path}.checkpoint'
         self.stdout.write(f'Loading ratings from {file_path}')
 
-        def clean_isbn(isbn: str) -> str:
-            """Remove spaces, quotes, and hyphens from ISBN."""
-            return isbn.replace('-', '').replace(' ', '').replace('"', '').strip()
-
-        def is_valid_isbn10(isbn: str) -> bool:
-            """Check if ISBN-10 is valid."""
-            if len(isbn) != 10 or not isbn[:-1].isdigit():
-                return False
-            total = sum((i + 1) * int(x) for i, x in enumerate(isbn[:-1]))
-            check = isbn[-1]
-            if check.upper() == 'X':
-                total += 10 * 10
-            elif check.isdigit():
-                total += 10 * int(check)
-            else:
-                return False
-            return total % 11 == 0
-
-        def is_valid_isbn13(isbn: str) -> bool:
-            """Check if ISBN-13 is valid."""
-            if len(isbn) != 13 or not isbn.isdigit():
-                return False
-            total = sum((int(num) * (1 if i % 2 == 0 else 3)) for i, num in enumerate(isbn[:-1]))
-            check_digit = (10 - (total % 10)) % 10
-            return check_digit == int(isbn[-1])
-
-        def is_valid_isbn(isbn: str) -> bool:
-            """Validate ISBN-10 or ISBN-13."""
-            isbn = clean_isbn(isbn)
-            return is_valid_isbn10(isbn) or is_valid_isbn13(isbn)
-
-        with open(file_path, newline='', encoding='latin-1') as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=';')
-            ratings = []
-            for row in reader:
-                try:
-                    rating = row['Book-Rating']
-                    isbn = clean_isbn(row['ISBN'])
-                    
-                    if not is_valid_isbn(isbn):
-                        self.stderr.write(f"Skipping row: invalid ISBN {isbn}")
-                        continue
-                    
-                    if rating.isdigit() and int(rating) != 0:
-                        ratings.append(Rating(
-                            user_id=int(row['User-ID']),
-                            isbn=isbn,
-                            rating=int(rating),
-                        ))
-                except Exception as e:
-                    self.stderr.write(f"Skipping row due to error: {e}")
-            
-            if ratings:
-                Rating.objects.bulk_create(ratings, ignore_conflicts=True)
-                self.stdout.write(self.style.SUCCESS(
-                    f'Successfully imported {len(ratings)} ratings'
-                ))
-            else:
-                self.stdout.write(self.style.WARNING('No valid ratings to import'))
+        with open(file_path, 'rb') as f:
+            header = f.readline()
+        fieldnames = next(csv.reader([header.decode('latin-1')], delimiter=';'), [])
+        try:
+            columns = [fieldnames.index(field) for field in FIELDS]
+        except ValueError:
+            raise CommandError(f'{file_path} must have the columns {", ".join(FIELDS)}')
+        size = os.path.getsize(file_path)
+
+        start, stats = len(header), Counter()
+        checkpoint = None if kwargs['restart'] else self.read_checkpoint(checkpoint_path, size)
+        if checkpoint:
+            start, stats = checkpoint['offset'], Counter(checkpoint['stats'])
+            self.stdout.write(f'Resuming at byte {start} of {size}')
+
+        with connection.cursor() as cursor:
+            self.create_staging_table(cursor)
+            try:
+                for chunk_start, chunk_end in split_line_ranges(file_path, start, kwargs['chunk_bytes']):
+                    rows, chunk_stats = parse_rating_range(file_path, columns, chunk_start, chunk_end)
+                    with transaction.atomic():
+                        stats['imported'] += self.load_chunk(cursor, rows)
+                    stats.update(chunk_stats)
+                    # Written once the chunk is committed: a crash replays at most one
+                    # chunk, and the upsert makes replaying it harmless
+                    self.write_checkpoint(checkpoint_path, {'offset': chunk_end, 'size': size, 'stats': stats})
+                    self.stdout.write(f'  … {chunk_end * 100 // size}% read, {stats["imported"]} ratings imported')
+            finally:
+                cursor.execute('DROP TABLE IF EXISTS ratings_import')
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        rejected = ', '.join(f'{count} {reason}' for reason, count in sorted(stats.items()) if reason != 'imported')
+        if rejected:
+            self.stdout.write(f'Skipped rows: {rejected}')
+        if stats['imported']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Successfully imported {stats["imported"]} ratings'
+            ))
+        else:
+            self.stdout.write(self.style.WARNING('No valid ratings to import'))
+
+    def read_checkpoint(self, checkpoint_path: str, size: int):
+        try:
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if checkpoint.get('size') != size:
+            self.stderr.write('Ignoring the checkpoint: the ratings file has changed since')
+            return None
+        return checkpoint
+
+    def write_checkpoint(self, checkpoint_path: str, checkpoint: dict):
+        # Replace atomically so a crash never leaves a truncated checkpoint behind
+        with open(f'{checkpoint_path}.tmp', 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(f'{checkpoint_path}.tmp', checkpoint_path)
+
+    def create_staging_table(self, cursor):
+        # Session-level temp table (unlogged, private): it must survive the per-chunk commits
+        cursor.execute('DROP TABLE IF EXISTS ratings_import')
+        cursor.execute('CREATE TEMP TABLE ratings_import (ord bigint, user_id bigint, isbn text, rating smallint)')
+
+    def load_chunk(self, cursor, rows: List[tuple]) -> int:
+        cursor.execute('TRUNCATE ratings_import')
+        copy_rows(cursor, 'ratings_import', STAGING_COLUMNS, rows)
+        # A user may rate a book twice (e.g. as ISBN-10 and ISBN-13): the last row wins,
+        # as it does across chunks. Stamped like any other write, so a queued rating
+        # older than the import never replaces it, and a newer one is never replaced
+        cursor.execute(
+            f"""
+            INSERT INTO {Rating._meta.db_table} AS r (user_id, isbn, rating, version)
+            SELECT DISTINCT ON (user_id, isbn) user_id, isbn, rating, %s
+            FROM ratings_import
+            ORDER BY user_id, isbn, ord DESC
+            ON CONFLICT (user_id, isbn) DO UPDATE SET rating = EXCLUDED.rating, version = EXCLUDED.version
+            WHERE EXCLUDED.version >= r.version
+            """,
+            [write_version(time.time_ns() // 1_000_000)],
+        )
+        return cursor.rowcount
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from ratings.models import RatingChange
+
+DEFAULT_KEEP_DAYS = 7
+DEFAULT_BATCH = 10000
+
+
+class Command(BaseCommand):
+    help = 'Delete rating changelog entries older than the retention period, in short batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-days', type=float, default=DEFAULT_KEEP_DAYS,
+            help='Changes logged within this many days are kept. Consumers further behind '
+                 'must rebuild from the ratings table (the daily full training run does).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH,
+            help='Changes deleted per statement (each committed on its own).',
+        )
+
+    def handle(self, *args, **kwargs):
+        cutoff = timezone.now() - timedelta(days=kwargs['keep_days'])
+        self.stdout.write(f'Purging rating changes logged before {cutoff.isoformat()}')
+
+        # Short statements instead of one long DELETE: no long-held locks or huge transaction
+        purged = 0
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute(
+                    f"""
+                    DELETE FROM {RatingChange._meta.db_table}
+                    WHERE seq IN (
+                        SELECT seq FROM {RatingChange._meta.db_table}
+                        WHERE changed_at < %s
+                        ORDER BY changed_at
+                        LIMIT %s
+                    )
+                    """,
+                    [cutoff, kwargs['batch_size']],
+                )
+                purged += cursor.rowcount
+                if cursor.rowcount < kwargs['batch_size']:
+                    break
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully purged {purged} rating changes'))
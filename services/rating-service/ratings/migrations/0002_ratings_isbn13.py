@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:09
+
+from django.db import migrations
+
+
+def ratings_to_isbn13(apps, schema_editor):
+    # The importer now stores ISBN-13; rewrite the ISBN-10s of ratings loaded before
+    from django_common.utils.isbn_helpers import canonicalize_isbn_column
+
+    with schema_editor.connection.cursor() as cursor:
+        canonicalize_isbn_column(
+            cursor, apps.get_model("ratings", "Rating")._meta.db_table, unique_with=["user_id"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(ratings_to_isbn13, migrations.RunPython.noop),
+    ]
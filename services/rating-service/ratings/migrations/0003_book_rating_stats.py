@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:17
+
+import django.contrib.postgres.fields
+import django.core.validators
+from django.db import migrations, models
+
+HISTOGRAM = ", ".join(f"coalesce(sum(sign) FILTER (WHERE rating = {value}), 0)" for value in range(1, 11))
+
+# Statement-level triggers see every row a statement wrote through transition
+# tables, so a bulk insert/upsert updates each book's stats row once.
+# Postgres only allows transition tables on single-event triggers, hence three.
+CREATE_TRIGGERS = f"""
+CREATE FUNCTION book_rating_stats_apply() RETURNS trigger AS $$
+DECLARE
+    changes text := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT isbn, rating, 1 AS sign FROM new_rows'
+        WHEN 'DELETE' THEN 'SELECT isbn, rating, -1 AS sign FROM old_rows'
+        ELSE 'SELECT isbn, rating, 1 AS sign FROM new_rows UNION ALL SELECT isbn, rating, -1 FROM old_rows'
+    END;
+BEGIN
+    EXECUTE format($sql$
+        INSERT INTO book_rating_stats AS s (isbn, count, total, mean, histogram)
+        SELECT isbn, count, total, coalesce(total::float8 / nullif(count, 0), 0), histogram
+        FROM (
+            SELECT isbn, sum(sign) AS count, sum(sign * rating) AS total, ARRAY[{HISTOGRAM}] AS histogram
+            FROM (%s) changes
+            GROUP BY isbn
+        ) delta
+        ORDER BY isbn  -- lock stats rows in a stable order
+        ON CONFLICT (isbn) DO UPDATE SET
+            count = s.count + EXCLUDED.count,
+            total = s.total + EXCLUDED.total,
+            mean = coalesce((s.total + EXCLUDED.total)::float8 / nullif(s.count + EXCLUDED.count, 0), 0),
+            histogram = ARRAY(
+                SELECT a + b FROM unnest(s.histogram, EXCLUDED.histogram) WITH ORDINALITY AS h(a, b, i) ORDER BY i
+            )
+    $sql$, changes);
+
+    IF TG_OP <> 'INSERT' THEN
+        EXECUTE format(
+            'DELETE FROM book_rating_stats s USING (%s) changes WHERE s.isbn = changes.isbn AND s.count = 0',
+            changes
+        );
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ratings_stats_insert AFTER INSERT ON ratings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_rating_stats_apply();
+
+CREATE TRIGGER ratings_stats_update AFTER UPDATE ON ratings
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_rating_stats_apply();
+
+CREATE TRIGGER ratings_stats_delete AFTER DELETE ON ratings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_rating_stats_apply();
+
+INSERT INTO book_rating_stats (isbn, count, total, mean, histogram)
+SELECT isbn, count(*), sum(rating), avg(rating), ARRAY[{HISTOGRAM.replace("sum(sign)", "count(*)")}]
+FROM ratings
+GROUP BY isbn;
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS ratings_stats_insert ON ratings;
+DROP TRIGGER IF EXISTS ratings_stats_update ON ratings;
+DROP TRIGGER IF EXISTS ratings_stats_delete ON ratings;
+DROP FUNCTION IF EXISTS book_rating_stats_apply();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0002_ratings_isbn13'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rating',
+            name='rating',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(10)]),
+        ),
+        migrations.CreateModel(
+            name='BookRatingStats',
+            fields=[
+                ('isbn', models.CharField(max_length=13, primary_key=True, serialize=False)),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.BigIntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('histogram', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), size=10)),
+            ],
+            options={
+                'db_table': 'book_rating_stats',
+                'indexes': [models.Index(fields=['mean', 'isbn'], name='book_rating_mean_9554e4_idx'), models.Index(fields=['count', 'isbn'], name='book_rating_count_ed424a_idx')],
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+    ]
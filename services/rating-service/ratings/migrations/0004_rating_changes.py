@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:23
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+# Statement-level triggers (one per event, as transition tables require) append
+# every row a statement wrote to rating_changes in one INSERT ... SELECT.
+# The transaction-scoped advisory lock serializes changelog writers until they
+# commit, so seq values become visible in order and "everything after seq N"
+# never misses a change committed later with a smaller seq.
+CREATE_TRIGGERS = """
+CREATE FUNCTION rating_changes_log() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock('rating_changes'::regclass::oid::bigint);
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO rating_changes (user_id, isbn, rating, op)
+        SELECT user_id, isbn, rating, 'I' FROM new_rows ORDER BY id;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO rating_changes (user_id, isbn, rating, op)
+        SELECT user_id, isbn, NULL, 'D' FROM old_rows ORDER BY id;
+    ELSE
+        -- Moving a rating to another (user, book) is a delete plus an insert;
+        -- rows rewritten with the same values are not changes
+        INSERT INTO rating_changes (user_id, isbn, rating, op)
+        SELECT user_id, isbn, rating, op FROM (
+            SELECT o.id, 0 AS step, o.user_id, o.isbn, NULL::smallint AS rating, 'D' AS op
+            FROM old_rows o JOIN new_rows n USING (id)
+            WHERE (o.user_id, o.isbn) IS DISTINCT FROM (n.user_id, n.isbn)
+            UNION ALL
+            SELECT n.id, 1, n.user_id, n.isbn, n.rating,
+                   CASE WHEN (o.user_id, o.isbn) = (n.user_id, n.isbn) THEN 'U' ELSE 'I' END
+            FROM old_rows o JOIN new_rows n USING (id)
+            WHERE (o.user_id, o.isbn, o.rating) IS DISTINCT FROM (n.user_id, n.isbn, n.rating)
+        ) changes
+        ORDER BY id, step;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ratings_changelog_insert AFTER INSERT ON ratings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rating_changes_log();
+
+CREATE TRIGGER ratings_changelog_update AFTER UPDATE ON ratings
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rating_changes_log();
+
+CREATE TRIGGER ratings_changelog_delete AFTER DELETE ON ratings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rating_changes_log();
+
+-- SQL access for consumers that read the database directly: the net change of
+-- every (user, book) pair changed after `after`, i.e. its latest change
+-- (rating NULL when it is deleted now)
+CREATE FUNCTION rating_changes_since(after bigint)
+RETURNS TABLE (seq bigint, user_id bigint, isbn varchar, rating smallint, op varchar) AS $$
+    SELECT DISTINCT ON (c.user_id, c.isbn) c.seq, c.user_id, c.isbn, c.rating, c.op
+    FROM rating_changes c
+    WHERE c.seq > after
+    ORDER BY c.user_id, c.isbn, c.seq DESC
+$$ LANGUAGE sql STABLE;
+"""
+
+DROP_TRIGGERS = """
+DROP FUNCTION IF EXISTS rating_changes_since(bigint);
+DROP TRIGGER IF EXISTS ratings_changelog_insert ON ratings;
+DROP TRIGGER IF EXISTS ratings_changelog_update ON ratings;
+DROP TRIGGER IF EXISTS ratings_changelog_delete ON ratings;
+DROP FUNCTION IF EXISTS rating_changes_log();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0003_book_rating_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('user_id', models.BigIntegerField()),
+                ('isbn', models.CharField(max_length=13)),
+                ('rating', models.PositiveSmallIntegerField(null=True)),
+                ('op', models.CharField(choices=[('I', 'insert'), ('U', 'update'), ('D', 'delete')], max_length=1)),
+                ('changed_at', models.DateTimeField(db_default=django.db.models.functions.datetime.Now())),
+            ],
+            options={
+                'db_table': 'rating_changes',
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+    ]
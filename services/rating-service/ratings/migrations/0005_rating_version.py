@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0004_rating_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rating',
+            name='version',
+            field=models.BigIntegerField(db_default=0, editable=False),
+        ),
+    ]
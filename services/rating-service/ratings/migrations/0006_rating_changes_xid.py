@@ -0,0 +1,126 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+# 0004 made seq commit-ordered with a global advisory lock, which serialized
+# every rating write until commit. Changes now record the id of the writing
+# transaction instead, and readers page on a commit-safe position:
+# pg_snapshot_xmin() of their snapshot, below which every transaction has
+# finished. A reader that has applied the changes below position P reads
+# those at or above P and below its own position next: nothing committed
+# late by a long transaction is skipped, and writers never wait on each other.
+# Per (user, book), seq still orders the changes: writers of one rating row
+# wait for each other's commit before logging.
+CREATE_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION rating_changes_log() RETURNS trigger AS $$
+DECLARE
+    writer bigint := pg_current_xact_id()::text::bigint;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO rating_changes (user_id, isbn, rating, op, xid)
+        SELECT user_id, isbn, rating, 'I', writer FROM new_rows ORDER BY id;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO rating_changes (user_id, isbn, rating, op, xid)
+        SELECT user_id, isbn, NULL, 'D', writer FROM old_rows ORDER BY id;
+    ELSE
+        -- Moving a rating to another (user, book) is a delete plus an insert;
+        -- rows rewritten with the same values are not changes
+        INSERT INTO rating_changes (user_id, isbn, rating, op, xid)
+        SELECT user_id, isbn, rating, op, writer FROM (
+            SELECT o.id, 0 AS step, o.user_id, o.isbn, NULL::smallint AS rating, 'D' AS op
+            FROM old_rows o JOIN new_rows n USING (id)
+            WHERE (o.user_id, o.isbn) IS DISTINCT FROM (n.user_id, n.isbn)
+            UNION ALL
+            SELECT n.id, 1, n.user_id, n.isbn, n.rating,
+                   CASE WHEN (o.user_id, o.isbn) = (n.user_id, n.isbn) THEN 'U' ELSE 'I' END
+            FROM old_rows o JOIN new_rows n USING (id)
+            WHERE (o.user_id, o.isbn, o.rating) IS DISTINCT FROM (n.user_id, n.isbn, n.rating)
+        ) changes
+        ORDER BY id, step;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- Changes below it are final. Read it in the same snapshot as the changes
+-- (or the ratings) it is stored with: REPEATABLE READ, or one statement.
+CREATE FUNCTION rating_changes_position() RETURNS bigint AS $$
+    SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+$$ LANGUAGE sql STABLE;
+
+-- The net change of every (user, book) pair changed at or after position
+-- `after` and below the current position, i.e. its latest change (rating
+-- NULL when it is deleted now)
+DROP FUNCTION rating_changes_since(bigint);
+CREATE FUNCTION rating_changes_since(after bigint)
+RETURNS TABLE (seq bigint, user_id bigint, isbn varchar, rating smallint, op varchar) AS $$
+    SELECT DISTINCT ON (c.user_id, c.isbn) c.seq, c.user_id, c.isbn, c.rating, c.op
+    FROM rating_changes c
+    WHERE c.xid >= after AND c.xid < rating_changes_position()
+    ORDER BY c.user_id, c.isbn, c.seq DESC
+$$ LANGUAGE sql STABLE;
+"""
+
+RESTORE_FUNCTIONS = """
+DROP FUNCTION IF EXISTS rating_changes_position();
+DROP FUNCTION IF EXISTS rating_changes_since(bigint);
+CREATE FUNCTION rating_changes_since(after bigint)
+RETURNS TABLE (seq bigint, user_id bigint, isbn varchar, rating smallint, op varchar) AS $$
+    SELECT DISTINCT ON (c.user_id, c.isbn) c.seq, c.user_id, c.isbn, c.rating, c.op
+    FROM rating_changes c
+    WHERE c.seq > after
+    ORDER BY c.user_id, c.isbn, c.seq DESC
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION rating_changes_log() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock('rating_changes'::regclass::oid::bigint);
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO rating_changes (user_id, isbn, rating, op)
+        SELECT user_id, isbn, rating, 'I' FROM new_rows ORDER BY id;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO rating_changes (user_id, isbn, rating, op)
+        SELECT user_id, isbn, NULL, 'D' FROM old_rows ORDER BY id;
+    ELSE
+        INSERT INTO rating_changes (user_id, isbn, rating, op)
+        SELECT user_id, isbn, rating, op FROM (
+            SELECT o.id, 0 AS step, o.user_id, o.isbn, NULL::smallint AS rating, 'D' AS op
+            FROM old_rows o JOIN new_rows n USING (id)
+            WHERE (o.user_id, o.isbn) IS DISTINCT FROM (n.user_id, n.isbn)
+            UNION ALL
+            SELECT n.id, 1, n.user_id, n.isbn, n.rating,
+                   CASE WHEN (o.user_id, o.isbn) = (n.user_id, n.isbn) THEN 'U' ELSE 'I' END
+            FROM old_rows o JOIN new_rows n USING (id)
+            WHERE (o.user_id, o.isbn, o.rating) IS DISTINCT FROM (n.user_id, n.isbn, n.rating)
+        ) changes
+        ORDER BY id, step;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0005_rating_version'),
+    ]
+
+    operations = [
+        # Changes logged before count as final long ago
+        migrations.AddField(
+            model_name='ratingchange',
+            name='xid',
+            field=models.BigIntegerField(db_default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='ratingchange',
+            index=models.Index(fields=['xid', 'seq'], name='rating_chan_xid_9c2f1e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ratingchange',
+            index=models.Index(fields=['changed_at'], name='rating_chan_changed_5b7d0a_idx'),
+        ),
+        migrations.RunSQL(CREATE_FUNCTIONS, reverse_sql=RESTORE_FUNCTIONS),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+# Ratings export incrementally like books (see ExportViewSetMixin): the id of
+# the transaction that last wrote a rating, so a pull picks up what a long
+# transaction commits late. Deletes are not exported; they come from /changes/.
+CREATE_TRIGGER = """
+CREATE FUNCTION set_change_xid() RETURNS trigger AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ratings_change_xid_trigger
+    BEFORE INSERT OR UPDATE ON ratings
+    FOR EACH ROW EXECUTE FUNCTION set_change_xid();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS ratings_change_xid_trigger ON ratings;
+DROP FUNCTION IF EXISTS set_change_xid();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ratings', '0006_rating_changes_xid'),
+    ]
+
+    operations = [
+        # Rows written before the trigger count as settled long ago
+        migrations.AddField(
+            model_name='rating',
+            name='change_xid',
+            field=models.BigIntegerField(db_default=0, db_index=True, editable=False),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, reverse_sql=DROP_TRIGGER),
+    ]
@@ -1,9 +1,30 @@
+import time
+
+from django.contrib.postgres.fields import ArrayField
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models.functions import Now
+
+RATING_SCALE = 10
+
+
+def write_version(ms: int, seq: int = 0) -> int:
+    """
+    Order of a rating write: the Redis stream id (ms-seq) of a queued write,
+    or the current time in milliseconds for a direct one.
+    """
+    return (ms << 20) | min(seq, (1 << 20) - 1)
+
 
 class Rating(models.Model):
     user_id = models.BigIntegerField()
     isbn = models.CharField(max_length=13)
-    rating = models.PositiveSmallIntegerField()
+    rating = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(RATING_SCALE)])
+    # write_version() of the write that set `rating`: upserts never replace it with
+    # an older write, e.g. a queued entry redelivered after a newer one was applied
+    version = models.BigIntegerField(db_default=0, editable=False)
+    # id of the transaction that last wrote the row, set by a database trigger; exports page on it
+    change_xid = models.BigIntegerField(db_default=0, db_index=True, editable=False)
 
     class Meta:
         db_table = 'ratings'
@@ -15,3 +36,78 @@ class Rating(models.Model):
 
     def __str__(self):
         return f"Rating(user_id={self.user_id}, isbn={self.isbn}, rating={self.rating})"
+
+    def save(self, *args, **kwargs):
+        self.version = write_version(time.time_ns() // 1_000_000)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "version"}
+        super().save(*args, **kwargs)
+
+
+class BookRatingStats(models.Model):
+    """
+    Per-book aggregates of `ratings`, kept up to date by statement-level
+    triggers on that table (see migration 0003), so a book's average is a
+    primary key read. Read-only from Django.
+    """
+    isbn = models.CharField(max_length=13, primary_key=True)
+    count = models.IntegerField(default=0)
+    total = models.BigIntegerField(default=0)
+    mean = models.FloatField(default=0)
+    # Not Positive*Fields: the triggers upsert signed deltas, which a CHECK would reject.
+    # histogram[i] is the number of ratings equal to i + 1
+    histogram = ArrayField(models.IntegerField(), size=RATING_SCALE)
+
+    class Meta:
+        db_table = 'book_rating_stats'
+        indexes = [
+            models.Index(fields=['mean', 'isbn']),
+            models.Index(fields=['count', 'isbn']),
+        ]
+
+    def __str__(self):
+        return f"BookRatingStats(isbn={self.isbn}, count={self.count}, mean={self.mean:.2f})"
+
+
+class RatingChange(models.Model):
+    """
+    Append-only log of the rating inserts, updates and deletes, written by
+    statement-level triggers on `ratings` (see migrations 0004 and 0006).
+    Read-only from Django.
+
+    `xid` is the writing transaction. Readers page on positions from
+    rating_changes_position(): every transaction below it has finished, so a
+    consumer that applied the changes below position P reads `xid >= P` and
+    below the current position next, and nothing committed late is skipped.
+    A new consumer reads `ratings` and the position in one snapshot first.
+    Per (user, book), `seq` orders the changes. An update that moves a rating
+    to another user or book is logged as a delete of the old pair and an
+    insert of the new one.
+
+    The log is purged after a retention period (purge_rating_changes):
+    consumers further behind rebuild from `ratings`.
+    """
+
+    class Op(models.TextChoices):
+        INSERT = 'I', 'insert'
+        UPDATE = 'U', 'update'
+        DELETE = 'D', 'delete'
+
+    seq = models.BigAutoField(primary_key=True)
+    user_id = models.BigIntegerField()
+    isbn = models.CharField(max_length=13)
+    rating = models.PositiveSmallIntegerField(null=True)  # None for deletes
+    op = models.CharField(max_length=1, choices=Op.choices)
+    changed_at = models.DateTimeField(db_default=Now())
+    xid = models.BigIntegerField(db_default=0, editable=False)
+
+    class Meta:
+        db_table = 'rating_changes'
+        indexes = [
+            models.Index(fields=['xid', 'seq'], name='rating_chan_xid_9c2f1e_idx'),
+            models.Index(fields=['changed_at'], name='rating_chan_changed_5b7d0a_idx'),
+        ]
+
+    def __str__(self):
+        return f"RatingChange(seq={self.seq}, op={self.op}, user_id={self.user_id}, isbn={self.isbn})"
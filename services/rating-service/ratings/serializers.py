@@ -0,0 +1,37 @@
+from rest_framework import serializers
+
+from django_common.utils.isbn_helpers import canonical_isbn
+from ratings.models import BookRatingStats, Rating, RatingChange
+
+
+class RatingSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Rating
+        fields = ['id', 'user_id', 'isbn', 'rating']
+
+    def validate_isbn(self, value):
+        # Ratings are stored under the ISBN-13, whichever form the client sent
+        isbn = canonical_isbn(value)
+        if isbn is None:
+            raise serializers.ValidationError('Not a valid ISBN-10 or ISBN-13.')
+        return isbn
+
+
+class BulkRatingSerializer(RatingSerializer):
+    """Rows of a bulk submit: upserted, so an existing (user_id, isbn) pair is not an error"""
+
+    class Meta(RatingSerializer.Meta):
+        fields = ['user_id', 'isbn', 'rating']
+        validators = []
+
+
+class BookRatingStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BookRatingStats
+        fields = ['isbn', 'count', 'total', 'mean', 'histogram']
+
+
+class RatingChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RatingChange
+        fields = ['seq', 'op', 'user_id', 'isbn', 'rating', 'changed_at']
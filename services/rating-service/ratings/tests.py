@@ -1,3 +1,390 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from ratings.ingest import ensure_group, queue_metrics, upsert_ratings
+from ratings.management.commands import drain_ratings
+from ratings.management.commands.import_ratings import Command as ImportCommand
+from ratings.models import BookRatingStats, Rating, RatingChange, write_version
+from ratings.views import RatingChangePagination
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class ImportRatingsTest(TestCase):
+    LINES = [
+        '"User-ID";"ISBN";"Book-Rating"',
+        '"1";"0441478123";"5"',
+        '"1";"978-0-441-47812-5";"7"',  # same book as ISBN-13: the later row wins
+        '"2";"034545104X";"0"',
+        '"2";"1234567890";"8"',
+        '"3";"034545104x";"9"',
+        '"three";"0441478123";"4"',
+        '"4";"0553283685";"6"',
+    ]
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(handle, "w", encoding="latin-1") as f:
+            f.write("\n".join(self.LINES) + "\n")
+        self.addCleanup(os.remove, self.path)
+
+    def import_ratings(self, **kwargs):
+        out = io.StringIO()
+        call_command("import_ratings", file=self.path, chunk_bytes=32, stdout=out, stderr=io.StringIO(), **kwargs)
+        return out.getvalue()
+
+    def ratings(self):
+        return sorted(Rating.objects.values_list("user_id", "isbn", "rating"))
+
+    def test_import_upserts_and_aggregates_rejections(self):
+        Rating.objects.create(user_id=4, isbn="9780553283686", rating=1)
+        out = self.import_ratings()
+
+        self.assertEqual(
+            self.ratings(),
+            [(1, "9780441478125", 7), (3, "9780345451040", 9), (4, "9780553283686", 6)],
+        )
+        self.assertIn("Skipped rows: 1 implicit (0) rating, 1 invalid ISBN, 1 malformed", out)
+        self.assertFalse(os.path.exists(f"{self.path}.checkpoint"))
+
+    def test_import_follows_the_write_versions(self):
+        queued_before = write_version(time.time_ns() // 1_000_000 - 1000)
+        # Written after the import started: must be kept
+        Rating.objects.create(user_id=4, isbn="9780553283686", rating=1)
+        Rating.objects.filter(user_id=4).update(version=write_version(time.time_ns() // 1_000_000 + 60_000))
+        self.import_ratings()
+        self.assertEqual(Rating.objects.get(user_id=4).rating, 1)
+
+        # Queued before the import, drained after it: must not replace the imported rating
+        upsert_ratings({(1, "9780441478125"): 2}, {(1, "9780441478125"): queued_before})
+        self.assertEqual(Rating.objects.get(user_id=1).rating, 7)
+
+    def test_resumes_from_the_last_committed_chunk(self):
+        load_chunk = ImportCommand.load_chunk
+        calls = []
+
+        def crash_on_third_chunk(command, cursor, rows):
+            calls.append(rows)
+            if len(calls) == 3:
+                raise RuntimeError("crash")
+            return load_chunk(command, cursor, rows)
+
+        with mock.patch.object(ImportCommand, "load_chunk", crash_on_third_chunk):
+            with self.assertRaises(RuntimeError):
+                self.import_ratings()
+        self.assertTrue(os.path.exists(f"{self.path}.checkpoint"))
+        Rating.objects.filter(user_id=1).update(rating=1)  # must not be touched again
+
+        out = self.import_ratings()
+        self.assertIn("Resuming at byte", out)
+        self.assertEqual(
+            self.ratings(),
+            [(1, "9780441478125", 1), (3, "9780345451040", 9), (4, "9780553283686", 6)],
+        )
+        self.assertIn("Skipped rows: 1 implicit (0) rating, 1 invalid ISBN, 1 malformed", out)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RatingApiTest(APITestCase):
+    ISBN10, ISBN13 = "0441478123", "9780441478125"
+
+    def setUp(self):
+        cache.clear()
+
+    def stats(self, isbn):
+        response = self.client.get(reverse("book-rating-stats-detail", args=[isbn]))
+        return response.data if response.status_code == 200 else None
+
+    def test_writes_keep_book_stats_current(self):
+        response = self.client.post(reverse("rating-list"), {"user_id": 1, "isbn": self.ISBN10, "rating": 8})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["isbn"], self.ISBN13)
+        self.assertEqual(self.stats(self.ISBN10)["mean"], 8)  # cached from now on
+
+        second = self.client.post(reverse("rating-list"), {"user_id": 2, "isbn": self.ISBN13, "rating": 3}).data
+        self.client.patch(reverse("rating-detail", args=[second["id"]]), {"rating": 4})
+        stats = self.stats(self.ISBN13)
+        self.assertEqual((stats["count"], stats["total"], stats["mean"]), (2, 12, 6))
+        self.assertEqual(stats["histogram"], [0, 0, 0, 1, 0, 0, 0, 1, 0, 0])
+
+        for rating in Rating.objects.all():
+            self.client.delete(reverse("rating-detail", args=[rating.id]))
+        self.assertIsNone(self.stats(self.ISBN13))
+
+    def test_bulk_submit_upserts_in_one_statement(self):
+        Rating.objects.create(user_id=1, isbn=self.ISBN13, rating=2)
+        rows = [
+            {"user_id": 1, "isbn": self.ISBN10, "rating": 9},  # replaces the existing rating
+            {"user_id": 2, "isbn": "0553283685", "rating": 5},
+            {"user_id": 2, "isbn": "9780553283686", "rating": 7},  # same book, last one wins
+            {"user_id": 3, "isbn": "0553283685", "rating": 10},
+        ]
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse("rating-bulk"), rows, format="json")
+        self.assertEqual(response.data, {"submitted": 3})
+        self.assertEqual(
+            sorted(Rating.objects.values_list("user_id", "isbn", "rating")),
+            [(1, self.ISBN13, 9), (2, "9780553283686", 7), (3, "9780553283686", 10)],
+        )
+        self.assertEqual(
+            list(BookRatingStats.objects.order_by("isbn").values_list("isbn", "count", "mean")),
+            [(self.ISBN13, 1, 9.0), ("9780553283686", 2, 8.5)],
+        )
+
+        invalid = [{"user_id": 4, "isbn": "1234567890", "rating": 5}, {"user_id": 4, "isbn": self.ISBN10, "rating": 11}]
+        response = self.client.post(reverse("rating-bulk"), invalid, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Rating.objects.filter(user_id=4).exists())
+
+    def test_history_and_batch_stats(self):
+        Rating.objects.bulk_create([
+            Rating(user_id=1, isbn=self.ISBN13, rating=8),
+            Rating(user_id=1, isbn="9780553283686", rating=5),
+            Rating(user_id=2, isbn=self.ISBN13, rating=4),
+        ])
+        history = self.client.get(reverse("rating-user", kwargs={"user_id": 1})).data["results"]
+        self.assertEqual([r["isbn"] for r in history], [self.ISBN13, "9780553283686"])
+        book = self.client.get(reverse("rating-book", kwargs={"isbn": self.ISBN10})).data["results"]
+        self.assertEqual([r["user_id"] for r in book], [1, 2])
+
+        response = self.client.get(reverse("book-rating-stats-batch"), {"isbn__in": f"{self.ISBN10},1234567890"})
+        self.assertEqual([(s["isbn"], s["mean"]) for s in response.data["results"]], [(self.ISBN13, 6)])
+        self.assertEqual(response.data["missing"], ["1234567890"])
+
+        top = self.client.get(reverse("book-rating-stats-list"), {"ordering": "-mean"}).data["results"]
+        self.assertEqual([s["isbn"] for s in top], [self.ISBN13, "9780553283686"])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RATINGS_WRITE_BEHIND=True)
+class WriteBehindTest(APITestCase):
+    ISBN10, ISBN13 = "0441478123", "9780441478125"
+
+    def setUp(self):
+        cache.clear()
+        self.redis = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        patcher = mock.patch("ratings.ingest.get_redis_connection", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def drain(self, **kwargs):
+        out, err = io.StringIO(), io.StringIO()
+        call_command("drain_ratings", once=True, consumer="test", stdout=out, stderr=err, **kwargs)
+        return out.getvalue(), err.getvalue()
+
+    def ratings(self):
+        return sorted(Rating.objects.values_list("user_id", "isbn", "rating"))
+
+    def test_writes_are_queued_then_drained_in_one_upsert(self):
+        Rating.objects.create(user_id=1, isbn=self.ISBN13, rating=2)
+        response = self.client.post(reverse("rating-list"), {"user_id": 1, "isbn": self.ISBN10, "rating": 8})
+        self.assertEqual((response.status_code, response.data), (202, {"queued": 1}))
+        rows = [
+            {"user_id": 2, "isbn": "0553283685", "rating": 5},
+            {"user_id": 2, "isbn": "9780553283686", "rating": 7},  # same book, last one wins
+        ]
+        response = self.client.post(reverse("rating-bulk"), rows, format="json")
+        self.assertEqual((response.status_code, response.data), (202, {"queued": 2}))
+
+        self.assertEqual(self.ratings(), [(1, self.ISBN13, 2)])
+        metrics = self.client.get(reverse("rating-queue")).data
+        self.assertEqual((metrics["backlog"], metrics["pending"], metrics["lag"]), (3, 0, 3))
+
+        with self.assertNumQueries(1):
+            self.drain()
+        self.assertEqual(self.ratings(), [(1, self.ISBN13, 8), (2, "9780553283686", 7)])
+        self.assertEqual(queue_metrics(self.redis)["backlog"], 0)
+
+        response = self.client.post(reverse("rating-list"), {"user_id": 3, "isbn": "1234567890", "rating": 5})
+        self.assertEqual(response.status_code, 400)
+
+    def test_metrics_leave_the_queue_alone(self):
+        metrics = self.client.get(reverse("rating-queue")).data
+        self.assertEqual((metrics["backlog"], metrics["pending"], metrics["lag"], metrics["consumers"]), (0, 0, 0, 0))
+        self.assertIsNone(metrics["oldest_age"])
+        self.assertFalse(self.redis.exists(settings.RATINGS_STREAM))
+
+    def test_entries_of_a_failed_or_dead_consumer_are_redelivered(self):
+        for user_id in (1, 2):
+            self.client.post(reverse("rating-list"), {"user_id": user_id, "isbn": self.ISBN13, "rating": 6})
+        # Another consumer read the entries, then died before committing them
+        ensure_group(self.redis)
+        self.redis.xreadgroup(
+            settings.RATINGS_STREAM_GROUP, "dead", {settings.RATINGS_STREAM: ">"}, count=10
+        )
+
+        upsert = drain_ratings.upsert_ratings
+        calls = []
+
+        def fail_once(rows, versions):
+            calls.append(rows)
+            if len(calls) == 1:
+                raise RuntimeError("connection lost")
+            return upsert(rows, versions)
+
+        with mock.patch.object(drain_ratings, "upsert_ratings", fail_once), mock.patch("time.sleep"):
+            _, err = self.drain(claim_idle_ms=0)
+        self.assertIn("failed, retrying: connection lost", err)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.ratings(), [(1, self.ISBN13, 6), (2, self.ISBN13, 6)])
+        self.assertEqual(queue_metrics(self.redis)["pending"], 0)
+        self.assertEqual(BookRatingStats.objects.get(isbn=self.ISBN13).count, 2)
+
+    def test_redelivered_entry_does_not_undo_a_later_rating(self):
+        self.client.post(reverse("rating-list"), {"user_id": 1, "isbn": self.ISBN13, "rating": 3})
+        # A consumer read the first rating, then died before committing it
+        ensure_group(self.redis)
+        self.redis.xreadgroup(settings.RATINGS_STREAM_GROUP, "dead", {settings.RATINGS_STREAM: ">"}, count=10)
+        self.client.post(reverse("rating-list"), {"user_id": 1, "isbn": self.ISBN13, "rating": 9})
+
+        self.drain()  # applies the second rating; the first is not idle long enough to be claimed
+        self.assertEqual(self.ratings(), [(1, self.ISBN13, 9)])
+        self.drain(claim_idle_ms=0)  # reclaims the first one
+        self.assertEqual(self.ratings(), [(1, self.ISBN13, 9)])
+        self.assertEqual(queue_metrics(self.redis)["backlog"], 0)
+
+        # Direct writes are versioned by the clock, so they still replace queued ones
+        rating = Rating.objects.get()
+        rating.rating = 4
+        rating.save(update_fields=["rating"])
+        with override_settings(RATINGS_WRITE_BEHIND=False):
+            self.client.post(reverse("rating-bulk"), [{"user_id": 1, "isbn": self.ISBN13, "rating": 5}], format="json")
+        self.assertEqual(self.ratings(), [(1, self.ISBN13, 5)])
+
+    @override_settings(RATINGS_STREAM_MAX_BACKLOG=2)
+    def test_full_queue_pushes_back(self):
+        rows = [{"user_id": user_id, "isbn": self.ISBN13, "rating": 6} for user_id in (1, 2)]
+        self.assertEqual(self.client.post(reverse("rating-bulk"), rows, format="json").status_code, 202)
+
+        response = self.client.post(reverse("rating-list"), {"user_id": 3, "isbn": self.ISBN13, "rating": 6})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+        self.drain()
+        response = self.client.post(reverse("rating-list"), {"user_id": 3, "isbn": self.ISBN13, "rating": 6})
+        self.assertEqual(response.status_code, 202)
+
+
+class RatingChangeTest(APITransactionTestCase):
+    ISBN13 = "9780441478125"
+
+    def changes(self, **params):
+        response = self.client.get(reverse("rating-change-list"), {"cursor": "", **params})
+        self.assertEqual(response.status_code, 200)
+        changes = [(c["op"], c["user_id"], c["isbn"], c["rating"]) for c in response.data["results"]]
+        return changes, response["X-Changes-Position"]
+
+    def test_every_write_is_logged_in_order(self):
+        rating = Rating.objects.create(user_id=1, isbn=self.ISBN13, rating=5)
+        rating.rating = 6
+        rating.save()
+        rating.save()  # same values: not a change
+        Rating.objects.filter(pk=rating.pk).update(isbn="9780553283686")
+        changes, position = self.changes()
+        self.assertEqual(changes, [
+            ("I", 1, self.ISBN13, 5),
+            ("U", 1, self.ISBN13, 6),
+            ("D", 1, self.ISBN13, None),
+            ("I", 1, "9780553283686", 6),
+        ])
+        self.assertEqual(self.changes(after=position), ([], position))
+
+        self.client.post(reverse("rating-bulk"), [
+            {"user_id": 1, "isbn": "9780553283686", "rating": 9},
+            {"user_id": 2, "isbn": self.ISBN13, "rating": 3},
+        ], format="json")
+        Rating.objects.filter(user_id=2).delete()
+        self.assertEqual(self.changes(after=position)[0], [
+            ("U", 1, "9780553283686", 9),  # an upsert logs its updates, then its inserts
+            ("I", 2, self.ISBN13, 3),
+            ("D", 2, self.ISBN13, None),
+        ])
+        self.assertEqual(self.client.get(reverse("rating-change-list"), {"after": "-1"}).status_code, 400)
+
+        # Net change per (user, book) for SQL consumers
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT op, user_id, isbn, rating FROM rating_changes_since(%s) ORDER BY seq", [position])
+            self.assertEqual(cursor.fetchall(), [("U", 1, "9780553283686", 9), ("D", 2, self.ISBN13, None)])
+
+    def test_changes_committed_late_are_not_skipped(self):
+        _, position = self.changes()
+        written, commit = threading.Event(), threading.Event()
+
+        def long_transaction():
+            try:
+                with transaction.atomic():
+                    Rating.objects.create(user_id=1, isbn="9780553283686", rating=5)
+                    written.set()
+                    commit.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=long_transaction)
+        thread.start()
+        written.wait(10)
+        # Another book (their stats rows would serialize the writers), committed first
+        Rating.objects.create(user_id=2, isbn=self.ISBN13, rating=7)
+        changes, next_position = self.changes(after=position)
+        self.assertEqual(changes, [])  # held back until the older transaction finishes
+
+        commit.set()
+        thread.join()
+        with mock.patch.object(RatingChangePagination, "page_size", 1):
+            response = self.client.get(reverse("rating-change-list"), {"after": next_position, "cursor": ""})
+            Rating.objects.create(user_id=3, isbn=self.ISBN13, rating=8)
+            # The next page keeps the bound of the first one
+            next_page = self.client.get(response.data["next"])
+        self.assertEqual([c["user_id"] for c in response.data["results"]], [1])
+        self.assertEqual([c["user_id"] for c in next_page.data["results"]], [2])
+        self.assertIsNone(next_page.data["next"])
+        self.assertEqual(next_page["X-Changes-Position"], response["X-Changes-Position"])
+
+    def test_purge_keeps_recent_changes(self):
+        Rating.objects.create(user_id=1, isbn=self.ISBN13, rating=5)
+        Rating.objects.create(user_id=2, isbn=self.ISBN13, rating=7)
+        RatingChange.objects.filter(user_id=1).update(changed_at=timezone.now() - timedelta(days=8))
+
+        out = io.StringIO()
+        call_command("purge_rating_changes", keep_days=7, batch_size=1, stdout=out)
+        self.assertIn("purged 1 rating changes", out.getvalue())
+        self.assertEqual(list(RatingChange.objects.values_list("user_id", flat=True)), [2])
+
+
+class RatingExportTest(APITransactionTestCase):
+    def export(self, **params):
+        response = self.client.get(reverse("rating-export"), params)
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        return [(row["user_id"], row["isbn"], row["rating"]) for row in rows], response["X-Export-Position"]
+
+    def test_pulls_return_ratings_written_since_the_last_one(self):
+        Rating.objects.create(user_id=1, isbn="9780441478125", rating=5)
+        Rating.objects.create(user_id=2, isbn="9780441478125", rating=7)
+        rows, position = self.export()
+        self.assertEqual(rows, [(1, "9780441478125", 5), (2, "9780441478125", 7)])
+        self.assertEqual(self.export(after=position), ([], position))
+
+        # Upserts are stamped too, updated rows as well as inserted ones
+        self.client.post(reverse("rating-bulk"), [
+            {"user_id": 2, "isbn": "9780441478125", "rating": 9},
+            {"user_id": 3, "isbn": "9780553283686", "rating": 4},
+        ], format="json")
+        rows, position = self.export(after=position)
+        self.assertEqual(rows, [(2, "9780441478125", 9), (3, "9780553283686", 4)])
+        self.assertEqual(self.export(after=position)[0], [])
+        self.assertEqual(self.client.get(reverse("rating-export"), {"after": "x"}).status_code, 400)
@@ -0,0 +1,10 @@
+from rest_framework.routers import SimpleRouter
+from .views import BookRatingStatsViewSet, RatingChangeViewSet, RatingViewSet
+
+# Everything lives under the gateway's /api/v1/ratings/ prefix
+router = SimpleRouter()
+router.register(r"stats", BookRatingStatsViewSet, basename="book-rating-stats")
+router.register(r"changes", RatingChangeViewSet, basename="rating-change")
+router.register(r"", RatingViewSet, basename="rating")
+
+urlpatterns = router.urls
@@ -1,3 +1,209 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.db import connection
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
-# Create your views here.
+from django_common.utils.isbn_helpers import canonical_isbn
+from django_common.utils.pagination import KeysetPagination
+from django_common.utils.viewsets import (
+    BatchRetrieveViewSetMixin,
+    CachedModelViewSetMixin,
+    ExportViewSetMixin,
+)
+from ratings.ingest import backlog, enqueue_ratings, invalidate_stats, queue_metrics, upsert_ratings
+from ratings.models import BookRatingStats, Rating, RatingChange
+from ratings.serializers import (
+    BookRatingStatsSerializer,
+    BulkRatingSerializer,
+    RatingChangeSerializer,
+    RatingSerializer,
+)
+
+
+class RatingViewSet(ExportViewSetMixin, viewsets.ModelViewSet):
+    """
+    Ratings, plus:
+        GET  users/<user_id>/  a user's rating history
+        GET  books/<isbn>/     the ratings of a book (ISBN-10 or ISBN-13)
+        POST bulk/             upsert up to `bulk_max_size` ratings in one statement
+        GET  queue/            backpressure metrics of the write-behind queue
+        GET  export/           every rating as NDJSON or CSV; `?after=` the rows written
+                               since a previous export (deletes come from /changes/)
+    Not cached: every write would invalidate it. Book averages come from /stats/.
+
+    With RATINGS_WRITE_BEHIND, POST / and POST bulk/ validate the ratings, queue
+    them on a Redis stream and answer 202: `manage.py drain_ratings` upserts them
+    shortly after (so POST / replaces an existing rating instead of failing).
+    Once the backlog reaches RATINGS_STREAM_MAX_BACKLOG, writes get a 429.
+    """
+
+    queryset = Rating.objects.all()
+    serializer_class = RatingSerializer
+    pagination_class = KeysetPagination
+
+    filterset_fields = ["user_id", "isbn", "rating"]
+    ordering_fields = ["id", "rating"]
+    ordering = ["id"]
+
+    export_fields = ("id", "user_id", "isbn", "rating")
+
+    bulk_max_size = 1000
+
+    @action(detail=False, url_path=r"users/(?P<user_id>[0-9]+)")
+    def user(self, request, user_id=None):
+        return self.paginated(self.get_queryset().filter(user_id=user_id))
+
+    @action(detail=False, url_path=r"books/(?P<isbn>[0-9Xx-]+)")
+    def book(self, request, isbn=None):
+        return self.paginated(self.get_queryset().filter(isbn=canonical_isbn(isbn) or isbn))
+
+    def paginated(self, queryset):
+        page = self.paginate_queryset(self.filter_queryset(queryset))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError("Expected a list of ratings.")
+        if len(request.data) > self.bulk_max_size:
+            raise ValidationError(f"At most {self.bulk_max_size} ratings per request.")
+        serializer = BulkRatingSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        if settings.RATINGS_WRITE_BEHIND:
+            return self.enqueue(serializer.validated_data)
+
+        # One row per (user, book), the last one wins, as it would with sequential requests
+        rows = {(row["user_id"], row["isbn"]): row["rating"] for row in serializer.validated_data}
+        upsert_ratings(rows)
+        invalidate_stats(isbn for _, isbn in rows)
+        return Response({"submitted": len(rows)}, status=status.HTTP_200_OK)
+
+    @action(detail=False)
+    def queue(self, request):
+        return Response(queue_metrics())
+
+    def create(self, request, *args, **kwargs):
+        if not settings.RATINGS_WRITE_BEHIND:
+            return super().create(request, *args, **kwargs)
+        serializer = BulkRatingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self.enqueue([serializer.validated_data])
+
+    def enqueue(self, ratings):
+        # Backpressure: refuse writes rather than let the backlog grow without bound
+        if backlog() >= settings.RATINGS_STREAM_MAX_BACKLOG:
+            raise Throttled(wait=settings.RATINGS_STREAM_RETRY_AFTER, detail="Too many ratings waiting to be saved.")
+        return Response({"queued": enqueue_ratings(ratings)}, status=status.HTTP_202_ACCEPTED)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_stats([serializer.instance.isbn])
+
+    def perform_update(self, serializer):
+        previous_isbn = serializer.instance.isbn
+        super().perform_update(serializer)
+        invalidate_stats([previous_isbn, serializer.instance.isbn])
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        invalidate_stats([instance.isbn])
+
+
+class BookRatingStatsViewSet(CachedModelViewSetMixin, BatchRetrieveViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Per-book rating aggregates, maintained by triggers on the ratings table:
+    a book page's average is one primary key read (or one batch/ request for a list).
+    """
+
+    queryset = BookRatingStats.objects.all()
+    serializer_class = BookRatingStatsSerializer
+    pagination_class = KeysetPagination
+    lookup_field = "isbn"
+
+    filterset_fields = {"count": ["gte"], "mean": ["gte"]}
+    ordering_fields = ["mean", "count"]
+    ordering = ["isbn"]
+
+    cache_prefix = "book_rating_stats"
+    cache_timeouts = {"list": 60, "retrieve": 60}
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Stats are keyed by ISBN-13; accept the ISBN-10 too
+        if self.lookup_field in self.kwargs:
+            isbn = self.kwargs[self.lookup_field]
+            self.kwargs[self.lookup_field] = canonical_isbn(isbn) or isbn
+
+    def get_batch_lookups(self, request) -> list:
+        return list(dict.fromkeys(canonical_isbn(isbn) or isbn for isbn in super().get_batch_lookups(request)))
+
+
+class RatingChangePagination(KeysetPagination):
+    page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.position = getattr(view, "position", None)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_cursor_link(self, position, reverse: bool):
+        link = super().get_cursor_link(position, reverse)
+        # Later pages stay bounded by the position of the first one
+        if link is not None and self.position is not None:
+            link = replace_query_param(link, "before", self.position)
+        return link
+
+
+class RatingChangeViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    The ratings changelog: `?after=<position>&cursor=` returns what changed
+    since, in keyset pages of 1000 (follow `next`). Every list carries an
+    `X-Changes-Position` header; once the last page is applied, pass it as
+    `after` in the next pull. Without `after`, lists from the start of the log.
+
+    Changes are ordered by writing transaction, then `seq`, and bounded by the
+    position: a transaction committing late is picked up by the next pull
+    instead of being skipped (see RatingChange).
+    """
+
+    queryset = RatingChange.objects.all()
+    serializer_class = RatingChangeSerializer
+    pagination_class = RatingChangePagination
+    position_header = "X-Changes-Position"
+
+    filterset_fields = {"user_id": ["exact"], "isbn": ["exact"]}
+    ordering_fields = []
+    ordering = ["xid", "seq"]
+
+    def list(self, request, *args, **kwargs):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rating_changes_position()")
+            position = cursor.fetchone()[0]
+        # A client paging through one pull keeps the bound it started with
+        self.position = min(self.get_position_param(request, "before", position), position)
+        response = super().list(request, *args, **kwargs)
+        response[self.position_header] = str(self.position)
+        return response
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != "list":
+            return queryset
+        after = self.get_position_param(self.request, "after", 0)
+        return queryset.filter(xid__gte=after, xid__lt=self.position)
+
+    @staticmethod
+    def get_position_param(request, name: str, default: int) -> int:
+        value = request.query_params.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            value = -1
+        if value < 0:
+            raise ValidationError({name: "Expected a position from a previous list."})
+        return value
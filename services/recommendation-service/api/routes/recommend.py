@@ -1,39 +1,85 @@
 from fastapi import APIRouter, HTTPException
 from sqlalchemy import text
 import pandas as pd
-from python_common.config.db import recommendation_engine
+from python_common.config.db import book_engine, rating_engine, recommendation_engine
+from django_common.utils.isbn_helpers import canonical_isbn, canonicalize_isbns
+from recommender.online import OnlineRecommender
 
 router = APIRouter()
 
+# Model artifacts of the last training run, loaded on first use and swapped when a new version appears
+recommender = OnlineRecommender()
+
+
+def fetch_books(isbns):
+    books = pd.read_sql(
+        text("SELECT * FROM books WHERE isbn = ANY(:isbns)"), book_engine, params={"isbns": list(isbns)}
+    ).drop(columns=["search_vector"], errors="ignore")
+    # In recommendation order, with nulls as None rather than NaN (not JSON)
+    books = books.set_index("isbn").reindex(isbns).dropna(how="all").reset_index()
+    return books.astype(object).where(books.notna(), None).to_dict(orient="records")
+
+
+def user_ratings(user_id: int):
+    """{isbn: rating} of the user now, in the trainer's canonical ISBN-13 form"""
+    with rating_engine.connect() as conn:
+        ratings = pd.read_sql(
+            text("SELECT isbn, rating FROM ratings WHERE user_id = :user_id"), conn, params={"user_id": user_id}
+        )
+    ratings["isbn"] = canonicalize_isbns(ratings["isbn"].to_numpy(dtype=str))
+    ratings = ratings.dropna(subset=["isbn"])
+    return dict(zip(ratings["isbn"], ratings["rating"]))
+
+
+def rated_since(user_id: int, position: int) -> bool:
+    with rating_engine.connect() as conn:
+        return conn.execute(
+            text("SELECT EXISTS (SELECT 1 FROM rating_changes WHERE xid >= :position AND user_id = :user_id)"),
+            {"position": position, "user_id": user_id},
+        ).scalar()
+
+
 @router.get("/user/{user_id}")
 def recommend_for_user(user_id: int):
-    query = text("SELECT recommended_isbns FROM user_recommendations WHERE user_id = :user_id")
-    result = recommendation_engine.execute(query, {"user_id": user_id}).fetchone()
-
-    if not result or not result[0]:
-        raise HTTPException(status_code=404, detail="Recommendations not found for user")
+    scorer = recommender.current()
 
-    recommended_isbns = result[0]  # This is already a list because of TEXT[]
+    recommended_isbns = None
+    # Rows of users who rated books after the model was trained are out of date
+    if scorer is None or not rated_since(user_id, scorer.changes_position):
+        with recommendation_engine.connect() as conn:
+            recommended_isbns = conn.execute(
+                text(
+                    "SELECT isbn FROM user_recommendations "
+                    "WHERE version = (SELECT version FROM active_model_version) AND user_id = :user_id "
+                    "ORDER BY score DESC"
+                ),
+                {"user_id": user_id},
+            ).scalars().all()
+    if not recommended_isbns and scorer is not None:
+        # New or unknown user: scored on the fly from their current ratings
+        recommended_isbns = scorer.recommend(user_ratings(user_id))
 
-    placeholders = ','.join(['%s'] * len(recommended_isbns))
-    books_query = text(f"SELECT * FROM books WHERE isbn IN ({placeholders})")
-    books = pd.read_sql(books_query, recommendation_engine, params=recommended_isbns)
+    if not recommended_isbns:
+        raise HTTPException(status_code=404, detail="Recommendations not found for user")
 
-    return books.to_dict(orient="records")
+    return fetch_books(recommended_isbns)
 
 
 @router.get("/book/{isbn}")
 def recommend_similar_books(isbn: str):
-    query = text("SELECT similar_isbns FROM book_similarities WHERE isbn = :isbn")
-    result = recommendation_engine.execute(query, {"isbn": isbn}).fetchone()
+    # Similarities are keyed by ISBN-13; accept the ISBN-10 too
+    isbn = canonical_isbn(isbn) or isbn
+    with recommendation_engine.connect() as conn:
+        similar_isbns = conn.execute(
+            text(
+                "SELECT isbn_similar FROM book_similarities "
+                "WHERE version = (SELECT version FROM active_model_version) AND isbn_source = :isbn "
+                "ORDER BY score DESC"
+            ),
+            {"isbn": isbn},
+        ).scalars().all()
 
-    if not result or not result[0]:
+    if not similar_isbns:
         raise HTTPException(status_code=404, detail="Similar books not found")
 
-    similar_isbns = result[0]  # Already a list
-
-    placeholders = ','.join(['%s'] * len(similar_isbns))
-    books_query = text(f"SELECT * FROM books WHERE isbn IN ({placeholders})")
-    books = pd.read_sql(books_query, recommendation_engine, params=similar_isbns)
-
-    return books.to_dict(orient="records")
+    return fetch_books(similar_isbns)
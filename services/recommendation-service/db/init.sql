@@ -1,24 +1,38 @@
--- CREATE TABLE user_recommendations (
---     user_id INTEGER,
---     isbn VARCHAR(20),
---     score FLOAT,
---     PRIMARY KEY (user_id, isbn)
--- );
+-- Every training run writes a complete new version of the results, then
+-- points active_model_version at it in the same transaction: readers join on
+-- the active version, so they never see a half-written one. Incremental runs
+-- patch the rows of the active version in place, in one transaction.
+CREATE TABLE model_versions (
+    version VARCHAR(32) PRIMARY KEY,    -- also the name of the model artifacts
+    model VARCHAR(16) NOT NULL,         -- knn, als or bpr
+    changes_position BIGINT NOT NULL,   -- ratings changelog position the results reflect
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
 
--- CREATE TABLE book_similarities (
---     isbn_source VARCHAR(20),
---     isbn_similar VARCHAR(20),
---     score FLOAT,
---     PRIMARY KEY (isbn_source, isbn_similar)
--- );
+-- A single row
+CREATE TABLE active_model_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version VARCHAR(32) NOT NULL REFERENCES model_versions
+);
 
+-- No foreign keys to model_versions below: rows are bulk-loaded by the
+-- million, and the trainer deletes old versions itself
 CREATE TABLE user_recommendations (
-    user_id INT,
-    recommended_isbns TEXT[]
+    version VARCHAR(32) NOT NULL,
+    user_id BIGINT NOT NULL,
+    isbn VARCHAR(13) NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (version, user_id, isbn)
 );
 
 CREATE TABLE book_similarities (
-    isbn TEXT,
-    similar_isbns TEXT[]
+    version VARCHAR(32) NOT NULL,
+    isbn_source VARCHAR(13) NOT NULL,
+    isbn_similar VARCHAR(13) NOT NULL,
+    score REAL NOT NULL,                -- cosine similarity
+    PRIMARY KEY (version, isbn_source, isbn_similar)
 );
 
+-- Incremental runs look up the books listing a changed book
+CREATE INDEX book_similarities_similar_idx ON book_similarities (version, isbn_similar);
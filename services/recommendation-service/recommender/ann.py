@@ -0,0 +1,112 @@
+"""
+Nearest-neighbor indexes over the book rows of the books x users ratings matrix.
+
+Every index follows the `NearestNeighbors` interface the trainer uses
+(`fit(X)`, then `kneighbors(Q, n_neighbors)` returning cosine distances and
+row indices), so backends are interchangeable:
+    brute  exact: every query is compared with every book (sklearn)
+    ivf    inverted file over raters: a query is only compared with the books
+           sharing a rater with it, i.e. the only books it can have a positive
+           cosine similarity with. Exact, unless `max_list_size` is set.
+See scripts/benchmark_ann.py for recall@10 and timings against brute force.
+"""
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import normalize
+
+BACKENDS = ("brute", "ivf")
+
+
+def create_index(backend="brute", n_jobs=-1, **options):
+    if backend == "brute":
+        return NearestNeighbors(metric="cosine", algorithm="brute", n_jobs=n_jobs, **options)
+    if backend == "ivf":
+        return InvertedFileIndex(**options)
+    raise ValueError(f"Unknown index backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+
+class InvertedFileIndex:
+    """
+    The inverted lists are the columns of the ratings matrix: the books each
+    user rated. A batch of queries is scored against its candidates with one
+    sparse product, and the top `n_neighbors` are selected per row.
+
+    Books with no rater in common have a cosine similarity of 0, so unlike
+    brute force the results stop at the last positively similar book; rows
+    with fewer neighbors are padded with index -1 at distance 1.
+
+    `max_list_size` bounds the work per query on catalogs with very heavy
+    raters: the lists of users with more ratings are left out of candidate
+    generation (their ratings still count in the similarity of the candidates
+    found through other raters), which makes the search approximate.
+    """
+
+    def __init__(self, max_list_size=None, batch_size=4096):
+        self.max_list_size = max_list_size
+        self.batch_size = batch_size
+
+    def fit(self, X):
+        self.X = normalize(csr_matrix(X, dtype=np.float32))
+        # users x books: row u is user u's inverted list
+        self.lists = self.X.T.tocsr()
+        self.candidate_lists = None
+        if self.max_list_size is not None:
+            sizes = np.diff(self.lists.indptr)
+            if sizes.max(initial=0) > self.max_list_size:
+                self.candidate_lists = diags((sizes <= self.max_list_size).astype(np.float32)) @ self.lists
+                self.candidate_lists.eliminate_zeros()
+        return self
+
+    def kneighbors(self, Q, n_neighbors=10, return_distance=True):
+        Qn = normalize(csr_matrix(Q, dtype=np.float32))
+        distances = np.ones((Qn.shape[0], n_neighbors), dtype=np.float32)
+        neighbours = np.full((Qn.shape[0], n_neighbors), -1, dtype=np.int64)
+        for start in range(0, Qn.shape[0], self.batch_size):
+            batch = Qn[start:start + self.batch_size]
+            if self.candidate_lists is not None:
+                similarity = self.pruned_similarity(batch)
+            else:
+                # Walks only the lists of the query's raters: exact cosine of every candidate
+                similarity = (batch @ self.lists).tocsr()
+            self.select(similarity, start, distances, neighbours)
+        return (distances, neighbours) if return_distance else neighbours
+
+    def pruned_similarity(self, batch):
+        """Exact similarity of the candidates found without the heavy raters' lists"""
+        candidates = (batch @ self.candidate_lists).tocoo()
+        queries, books = candidates.row, candidates.col
+        values = np.asarray(batch[queries].multiply(self.X[books]).sum(axis=1)).ravel()
+        return csr_matrix((values, (queries, books)), shape=(batch.shape[0], self.X.shape[0]))
+
+    @staticmethod
+    def select(similarity, start, distances, neighbours):
+        """Write the top `width` entries of each row of sparse `similarity` at row `start` on"""
+        width = neighbours.shape[1]
+        rows = np.repeat(np.arange(similarity.shape[0]), np.diff(similarity.indptr))
+        order = np.lexsort((similarity.indices, -similarity.data, rows))
+        rows, books, values = rows[order], similarity.indices[order], similarity.data[order]
+        rank = np.arange(len(rows)) - similarity.indptr[rows]
+        top = (rank < width) & (values > 0)
+        neighbours[start + rows[top], rank[top]] = books[top]
+        distances[start + rows[top], rank[top]] = np.clip(1 - values[top], 0, 1)
+
+
+def recall_at_k(rows, exact_distances, exact_neighbours, distances, neighbours, k=10):
+    """
+    Mean share of the exact top `k` neighbors of the query books `rows` found
+    by an approximate search, ties included: a result counts when its distance
+    is within the exact k-th distance. Only neighbors with a positive
+    similarity are expected (queries without any are skipped), and the query
+    book itself is ignored.
+    """
+    found, expected = 0, 0
+    for row, exact_d, exact_n, approx_d, approx_n in zip(rows, exact_distances, exact_neighbours, distances, neighbours):
+        exact = exact_d[exact_n != row][:k]
+        exact = exact[exact < 1 - 1e-6]
+        if not len(exact):
+            continue
+        approx = approx_d[(approx_n >= 0) & (approx_n != row)][:k]
+        found += min(len(exact), int((approx <= exact[-1] + 1e-5).sum()))
+        expected += len(exact)
+    return found / expected if expected else 1.0
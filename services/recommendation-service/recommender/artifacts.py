@@ -0,0 +1,154 @@
+"""
+Versioned model artifacts, written by the trainer and served by the API:
+
+    MODEL_DIR/
+        CURRENT                      name of the active version
+        versions/<version>/
+            ratings_data.npy         books x users CSR ratings: data, indices and indptr arrays
+            ratings_indices.npy
+            ratings_indptr.npy
+            ratings_index.npz        user_ids (columns), isbns (rows), matrix shape, changes_position,
+                                     model settings
+            neighbour_ids.npy        the k + 1 nearest books of every book (-1 padded) and their
+            neighbour_distances.npy  cosine distances, from the trainer's kNN index
+            user_factors.npy         factor models only
+            item_factors.npy
+
+The .npy files are memory-mapped by readers: loading a version reads the id
+arrays only, and the pages of the matrix, neighbours and factors are shared
+between processes through the page cache.
+
+A version is written in full under a temporary name and renamed into
+versions/ before CURRENT is replaced, so readers only ever see complete
+versions. The previous versions are kept a while for readers still using them.
+"""
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from recommender.factorization import ITEM_FACTORS_FILE, USER_FACTORS_FILE, save_factors
+
+# Mounted from recommendation-model-pvc by the CronJobs and the API
+MODEL_DIR = os.getenv("MODEL_DIR", "/app/models")
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+MATRIX_FILES = {"data": "ratings_data.npy", "indices": "ratings_indices.npy", "indptr": "ratings_indptr.npy"}
+NEIGHBOUR_IDS_FILE = "neighbour_ids.npy"
+NEIGHBOUR_DISTANCES_FILE = "neighbour_distances.npy"
+INDEX_FILE = "ratings_index.npz"
+KEEP_VERSIONS = 3
+
+
+class Artifacts:
+    """
+    One version: the ratings matrix, its id arrays, the ratings changelog
+    position it reflects, the books' nearest neighbours and, for factor models,
+    the factors. Arrays read from disk are read-only memory maps.
+    """
+
+    def __init__(
+        self, version, X, user_ids, isbns, changes_position, neighbour_ids, neighbour_distances,
+        model=None, user_factors=None, item_factors=None,
+    ):
+        self.version = version
+        self.X = X
+        self.user_ids = user_ids
+        self.isbns = isbns
+        self.changes_position = changes_position
+        self.neighbour_ids = neighbour_ids
+        self.neighbour_distances = neighbour_distances
+        # {"name": "knn"} or the factor model's settings, e.g. {"name": "als", "regularization": 0.05}
+        self.model = model or {"name": "knn"}
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+
+
+def current_version(directory=MODEL_DIR):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def new_version():
+    """A new version name: the UTC time, so names sort in creation order"""
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def write_version(
+    X, user_ids, isbns, changes_position, neighbours, model=None, model_settings=None, version=None,
+    directory=MODEL_DIR,
+):
+    """
+    Write a new version, make it the current one and prune old ones. Returns its name.
+    `neighbours` are the (distances, neighbour rows) of every book row of `X`.
+    """
+    version = version or new_version()
+    versions = os.path.join(directory, VERSIONS_DIR)
+    staging = os.path.join(versions, f".{version}.tmp")
+    os.makedirs(staging)
+
+    X = X.tocsr()
+    for name, file in MATRIX_FILES.items():
+        np.save(os.path.join(staging, file), getattr(X, name))
+    distances, neighbour_ids = neighbours
+    np.save(os.path.join(staging, NEIGHBOUR_IDS_FILE), np.asarray(neighbour_ids, dtype=np.int32))
+    np.save(os.path.join(staging, NEIGHBOUR_DISTANCES_FILE), np.asarray(distances, dtype=np.float32))
+    np.savez(
+        os.path.join(staging, INDEX_FILE),
+        user_ids=np.asarray(user_ids), isbns=np.asarray(isbns, dtype=str), shape=np.asarray(X.shape),
+        changes_position=changes_position, model=json.dumps(model_settings or {"name": "knn"}),
+    )
+    if model is not None:
+        save_factors(model, staging)
+    os.rename(staging, os.path.join(versions, version))
+
+    current = os.path.join(directory, CURRENT_FILE)
+    with open(f"{current}.tmp", "w") as f:
+        f.write(version)
+    os.replace(f"{current}.tmp", current)
+
+    prune_versions(directory)
+    return version
+
+
+def load_version(version=None, directory=MODEL_DIR):
+    """The Artifacts of `version` (the current one by default), or None if there is none"""
+    version = version or current_version(directory)
+    if version is None:
+        return None
+    path = os.path.join(directory, VERSIONS_DIR, version)
+    index = np.load(os.path.join(path, INDEX_FILE))
+    matrix = {name: np.load(os.path.join(path, file), mmap_mode="r") for name, file in MATRIX_FILES.items()}
+    factors = [
+        np.load(os.path.join(path, name), mmap_mode="r") if os.path.exists(os.path.join(path, name)) else None
+        for name in (USER_FACTORS_FILE, ITEM_FACTORS_FILE)
+    ]
+    return Artifacts(
+        version,
+        csr_matrix((matrix["data"], matrix["indices"], matrix["indptr"]), shape=tuple(index["shape"]), copy=False),
+        index["user_ids"],
+        index["isbns"].astype(object),
+        int(index["changes_position"]),
+        np.load(os.path.join(path, NEIGHBOUR_IDS_FILE), mmap_mode="r"),
+        np.load(os.path.join(path, NEIGHBOUR_DISTANCES_FILE), mmap_mode="r"),
+        json.loads(str(index["model"])),
+        *factors,
+    )
+
+
+def prune_versions(directory=MODEL_DIR, keep=KEEP_VERSIONS):
+    """Delete all but the `keep` newest versions (and leftovers of interrupted writes)"""
+    versions = os.path.join(directory, VERSIONS_DIR)
+    current = current_version(directory)
+    names = sorted(os.listdir(versions))
+    complete = [name for name in names if not name.startswith(".")]
+    # Staging directories left by interrupted runs (only one trainer runs at a time)
+    for name in [name for name in names if name.startswith(".")] + complete[:-keep]:
+        if name != current:
+            shutil.rmtree(os.path.join(versions, name), ignore_errors=True)
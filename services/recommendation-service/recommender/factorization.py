@@ -0,0 +1,77 @@
+"""
+Matrix factorization recommenders (implicit): ALS or BPR fitted once on the
+users x books ratings, then every user's top N from batched `recommend` calls.
+
+Ratings are used as confidences: ALS weighs a rating of 10 ten times a rating
+of 1, BPR only uses which books a user rated.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from implicit.als import AlternatingLeastSquares
+from implicit.bpr import BayesianPersonalizedRanking
+
+MODELS = ("als", "bpr")
+USER_FACTORS_FILE = "user_factors.npy"
+ITEM_FACTORS_FILE = "item_factors.npy"
+
+
+def create_model(name="als", factors=64, iterations=None, regularization=None, num_threads=0, random_state=0):
+    """A CPU model, using `num_threads` threads (0: every CPU)"""
+    if name == "als":
+        return AlternatingLeastSquares(
+            factors=factors, iterations=iterations or 15,
+            regularization=0.05 if regularization is None else regularization,
+            use_gpu=False, num_threads=num_threads, random_state=random_state,
+        )
+    if name == "bpr":
+        return BayesianPersonalizedRanking(
+            factors=factors, iterations=iterations or 100,
+            regularization=0.01 if regularization is None else regularization,
+            use_gpu=False, num_threads=num_threads, random_state=random_state,
+        )
+    raise ValueError(f"Unknown model {name!r}, expected one of {', '.join(MODELS)}")
+
+
+def user_items(X):
+    """The users x books CSR matrix implicit models take, for a books x users ratings matrix"""
+    return X.T.tocsr().astype(np.float32)
+
+
+def fit_model(model, X):
+    """Factorize the books x users ratings matrix `X`"""
+    model.fit(user_items(X), show_progress=False)
+    return model
+
+
+def recommend_all(model, X, columns=None, top_n=10, batch_size=10000):
+    """
+    (user column, book row, score) of the `top_n` recommended books of the users
+    in matrix `columns` (every user by default), best first, leaving out the
+    books they rated.
+    """
+    items = user_items(X)
+    columns = np.arange(items.shape[0]) if columns is None else np.asarray(columns)
+    batches = []
+    for start in range(0, len(columns), batch_size):
+        batch = columns[start:start + batch_size]
+        ids, scores = model.recommend(batch, items[batch], N=top_n, filter_already_liked_items=True)
+        # Filtered books come back last, at the lowest float score
+        valid = scores > np.finfo(np.float32).min
+        batches.append(pd.DataFrame({
+            "user": np.repeat(batch, ids.shape[1])[valid.ravel()],
+            "book": ids[valid],
+            "score": scores[valid],
+        }))
+    return pd.concat(batches, ignore_index=True) if batches else pd.DataFrame(columns=["user", "book", "score"])
+
+
+def save_factors(model, directory):
+    """Write the user and item factors as .npy files, whose rows follow the matrix columns and rows"""
+    os.makedirs(directory, exist_ok=True)
+    for name, factors in ((USER_FACTORS_FILE, model.user_factors), (ITEM_FACTORS_FILE, model.item_factors)):
+        path = os.path.join(directory, name)
+        # np.save appends .npy to a path without it
+        np.save(f"{path}.tmp.npy", np.ascontiguousarray(factors))
+        os.replace(f"{path}.tmp.npy", path)
@@ -0,0 +1,134 @@
+"""
+Online scoring from the current model artifacts, for users the last batch run
+does not cover: users it never saw, and users who rated books since.
+
+The scorer follows the model of the version: ALS users are folded into the
+item factors with one least squares solve, BPR users get the mean factors of
+the books they rated, and kNN users are scored from their liked books'
+neighbors, saved with the version by the batch run. Users without any known
+book get the most rated books.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from recommender.artifacts import CURRENT_FILE, MODEL_DIR, load_version
+
+POPULAR_BOOKS = 200
+
+
+class OnlineRecommender:
+    """
+    Serves the current artifact version, loaded on first use. CURRENT is
+    checked at most every `check_every` seconds, by one request at a time: a
+    new version is loaded without holding `lock`, and swapped in under it once
+    ready, while the other requests keep using the previous one.
+    """
+
+    def __init__(self, directory=MODEL_DIR, check_every=10.0):
+        self.directory = directory
+        self.check_every = check_every
+        self.lock = threading.Lock()
+        self.refreshing = threading.Lock()
+        self.scorer = None
+        self.stamp = None
+        self.checked_at = float("-inf")
+
+    def current(self):
+        """The Scorer of the current version, or None when no model was trained yet"""
+        if time.monotonic() - self.checked_at >= self.check_every:
+            # Only requests with nothing to serve yet wait for a check in progress
+            if self.refreshing.acquire(blocking=self.scorer is None):
+                try:
+                    if time.monotonic() - self.checked_at >= self.check_every:
+                        self.refresh()
+                        self.checked_at = time.monotonic()
+                finally:
+                    self.refreshing.release()
+        return self.scorer
+
+    def refresh(self):
+        try:
+            stat = os.stat(os.path.join(self.directory, CURRENT_FILE))
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_mtime_ns, stat.st_ino)
+        if stamp == self.stamp:
+            return
+        artifacts = load_version(directory=self.directory)
+        scorer = self.scorer
+        if artifacts is not None and (scorer is None or artifacts.version != scorer.version):
+            scorer = Scorer(artifacts)
+        with self.lock:
+            self.scorer, self.stamp = scorer, stamp
+
+
+class Scorer:
+    def __init__(self, artifacts):
+        self.artifacts = artifacts
+        self.version = artifacts.version
+        self.changes_position = artifacts.changes_position
+        self.books = pd.Index(artifacts.isbns)
+        counts = np.diff(artifacts.X.indptr)
+        self.popular = np.argsort(-counts, kind="stable")[:POPULAR_BOOKS]
+        self.gram = None
+
+    def recommend(self, ratings, top_n=10):
+        """Recommended isbns for a user with {isbn: rating}, leaving out the books they rated"""
+        rows = self.books.get_indexer(list(ratings))
+        known = rows >= 0
+        rows, values = rows[known], np.fromiter(ratings.values(), dtype=np.float32, count=len(ratings))[known]
+
+        recommended = []
+        if len(rows):
+            model = self.artifacts.model["name"]
+            if model == "knn":
+                recommended = self.from_neighbours(rows, values, top_n)
+            else:
+                recommended = self.from_factors(rows, values, top_n, model)
+        if len(recommended) < top_n:
+            seen = set(rows) | set(recommended)
+            recommended += [row for row in self.popular if row not in seen][:top_n - len(recommended)]
+        return [self.artifacts.isbns[row] for row in recommended]
+
+    def from_factors(self, rows, values, top_n, model):
+        items = self.artifacts.item_factors
+        liked = np.asarray(items[rows], dtype=np.float32)
+        if model == "als":
+            # The ALS user update for confidences `values`: (YtY + Yt(C - I)Y + reg I) u = Yt C 1
+            if self.gram is None:
+                self.gram = np.asarray(items.T @ items, dtype=np.float32)
+            A = self.gram + (liked.T * (values - 1)) @ liked
+            A += self.artifacts.model["regularization"] * np.eye(A.shape[0], dtype=np.float32)
+            user = np.linalg.solve(A, liked.T @ values)
+        else:
+            # BPR has no closed form: the mean of the rated books, with the item bias term kept at 1
+            user = liked.mean(axis=0)
+            user[-1] = 1
+        scores = np.asarray(items @ user)
+        scores[rows] = -np.inf
+        n = min(top_n, len(scores) - len(np.unique(rows)))
+        if n <= 0:
+            return []
+        top = np.argpartition(-scores, n - 1)[:n]
+        return top[np.argsort(-scores[top], kind="stable")].tolist()
+
+    def from_neighbours(self, rows, values, top_n, k=10):
+        # Each liked book (rated >= 4, else the 3 best ratings) gives its neighbours
+        # rating * cosine similarity, as in the batch run
+        liked = values >= 4
+        if not liked.any():
+            liked = np.isin(np.arange(len(rows)), np.argsort(-values, kind="stable")[:3])
+        liked_rows = rows[liked]
+        neighbours = self.artifacts.neighbour_ids[liked_rows, :k + 1]
+        distances = self.artifacts.neighbour_distances[liked_rows, :k + 1]
+        votes = pd.DataFrame({
+            "book": neighbours.ravel(),
+            "score": (values[liked][:, None] * (1 - distances)).ravel(),
+        })
+        votes = votes[(votes["book"] >= 0) & ~votes["book"].isin(rows)]
+        scores = votes.groupby("book", sort=False)["score"].sum().sort_values(ascending=False, kind="stable")
+        return scores.index[:top_n].tolist()
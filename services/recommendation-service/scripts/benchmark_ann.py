@@ -0,0 +1,63 @@
+"""
+Recall@10 and timings of the nearest-neighbor backends against brute force,
+on a random sample of book rows of the current ratings matrix:
+
+    python -m scripts.benchmark_ann --sample 5000 --max-list-size 200 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from recommender.ann import create_index, recall_at_k
+from scripts.update_recommendations import create_matrix, load_ratings, nearest_books
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the nearest-neighbor backends against brute force")
+    parser.add_argument("--sample", type=int, default=5000, help="Book rows queried")
+    parser.add_argument("--k", type=int, default=10, help="Neighbors per book")
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel jobs of brute force (-1: every CPU)")
+    parser.add_argument(
+        "--max-list-size", type=int, nargs="*", default=[],
+        help="Also run the ivf backend with these inverted list caps",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ratings, _ = load_ratings()
+    X = create_matrix(ratings)[0]
+    del ratings
+    rows = np.sort(np.random.default_rng(args.seed).choice(X.shape[0], min(args.sample, X.shape[0]), replace=False))
+    lists = np.diff(X.tocsc().indptr)
+    print(
+        f"{X.shape[0]} books x {X.shape[1]} users, {X.nnz} ratings; "
+        f"longest inverted list {lists.max()}, {len(rows)} books queried"
+    )
+
+    index, fit_time = timed(create_index("brute", n_jobs=args.jobs).fit, X)
+    (exact_distances, exact_neighbours), query_time = timed(nearest_books, index, X, rows, args.k)
+    results = [("brute", fit_time, query_time, 1.0)]
+
+    for max_list_size in [None, *args.max_list_size]:
+        index, fit_time = timed(create_index("ivf", max_list_size=max_list_size).fit, X)
+        (distances, neighbours), query_time = timed(nearest_books, index, X, rows, args.k)
+        recall = recall_at_k(rows, exact_distances, exact_neighbours, distances, neighbours, args.k)
+        name = "ivf" if max_list_size is None else f"ivf max_list_size={max_list_size}"
+        results.append((name, fit_time, query_time, recall))
+
+    print(f"\n{'backend':<28}{'fit s':>8}{'query s':>10}{'catalog s':>11}{'recall@' + str(args.k):>11}")
+    for name, fit_time, query_time, recall in results:
+        # Query time extrapolated to every book of the catalog, as a full run needs
+        catalog = fit_time + query_time * X.shape[0] / len(rows)
+        print(f"{name:<28}{fit_time:>8.2f}{query_time:>10.2f}{catalog:>11.1f}{recall:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
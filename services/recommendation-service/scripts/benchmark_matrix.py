@@ -0,0 +1,59 @@
+"""
+Build time and peak memory of `create_matrix` on synthetic ratings shaped like
+the Book-Crossing set (1.1M ratings, 105k users, 340k books by default):
+
+    python -m scripts.benchmark_matrix --ratings 1100000
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from scripts.update_recommendations import create_matrix
+
+
+def synthetic_ratings(n_ratings, n_users, n_books, seed=0):
+    rng = np.random.default_rng(seed)
+    users = rng.integers(1, n_users + 1, n_ratings)
+    books = rng.integers(0, n_books, n_ratings)
+    isbns = pd.Series(9780000000000 + books).astype(str)
+    ratings = pd.DataFrame({"user_id": users, "isbn": isbns, "rating": rng.integers(1, 11, n_ratings)})
+    return ratings.drop_duplicates(["user_id", "isbn"], keep="last").reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ratings matrix construction")
+    parser.add_argument("--ratings", type=int, default=1_100_000)
+    parser.add_argument("--users", type=int, default=105_000)
+    parser.add_argument("--books", type=int, default=340_000)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs timed; the best is reported")
+    args = parser.parse_args()
+
+    ratings = synthetic_ratings(args.ratings, args.users, args.books)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        create_matrix(ratings)
+        timings.append(time.perf_counter() - start)
+
+    # Separate run: tracing allocations slows the build down
+    tracemalloc.start()
+    X, *mappers = create_matrix(ratings)
+    # What the trainer keeps for the whole run: the matrix and the four mappers
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{len(ratings)} ratings -> {X.shape[0]} books x {X.shape[1]} users "
+        f"({X.data.dtype} data, {X.indices.dtype} indices, {(X.data.nbytes + X.indices.nbytes + X.indptr.nbytes) / 2**20:.1f} MiB)"
+    )
+    print(
+        f"build {min(timings):.2f} s (best of {args.repeat}), "
+        f"peak allocations {peak / 2**20:.0f} MiB, retained {retained / 2**20:.0f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Offline comparison of the recommenders on a holdout split: a share of every
+user's ratings is hidden, each model is trained on the rest, and precision@k
+and recall@k count the hidden books among the top k recommended:
+
+    python -m scripts.evaluate_recommenders --models popular knn als bpr
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from recommender.factorization import MODELS, create_model, fit_model, recommend_all
+from scripts.update_recommendations import create_matrix, fit_index, load_ratings, nearest_books, recommend_books
+
+
+def holdout_split(X, test_size=0.2, min_ratings=3, seed=0):
+    """
+    (train matrix, {user column: hidden book rows}): `test_size` of the ratings
+    (at least one) of every user with `min_ratings` or more, picked at random.
+    """
+    R = X.tocoo()
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(R.nnz)
+    users = pd.Series(R.col[order])
+    rank = users.groupby(users).cumcount().to_numpy()
+    counts = np.bincount(R.col, minlength=X.shape[1])[users]
+    hidden = (counts >= min_ratings) & (rank < np.maximum(1, (counts * test_size).astype(int)))
+
+    keep = order[~hidden]
+    train = csr_matrix((R.data[keep], (R.row[keep], R.col[keep])), shape=X.shape)
+    test = pd.Series(R.row[order[hidden]]).groupby(R.col[order[hidden]]).agg(set).to_dict()
+    return train, test
+
+
+def popular_books(train, columns, top_n=10):
+    """The most rated books each user has not rated: the baseline"""
+    popular = np.argsort(-np.diff(train.tocsr().indptr), kind="stable")[:top_n * 10]
+    rated = train.tocsc()
+    recommended = {}
+    for column in columns:
+        seen = set(rated.indices[rated.indptr[column]:rated.indptr[column + 1]])
+        recommended[column] = [book for book in popular if book not in seen][:top_n]
+    return recommended
+
+
+def as_lists(recommended):
+    """{user column: book rows, best first} for (user column, book row, score) rows"""
+    return recommended.groupby("user", sort=False)["book"].agg(list).to_dict()
+
+
+def knn_books(train, columns, top_n=10, backend="ivf"):
+    rows = np.arange(train.shape[0])
+    distances, neighbours = nearest_books(fit_index(train, backend=backend), train, rows)
+    return as_lists(recommend_books(train, columns, rows, distances, neighbours, top_n))
+
+
+def factor_books(train, columns, top_n=10, **model_options):
+    model = fit_model(create_model(**model_options), train)
+    return as_lists(recommend_all(model, train, columns, top_n))
+
+
+def score(recommended, test, k=10):
+    """(precision@k, recall@k) averaged over the users with hidden ratings"""
+    precision, recall = [], []
+    for column, hidden in test.items():
+        hits = len(hidden.intersection(recommended.get(column, [])[:k]))
+        precision.append(hits / k)
+        recall.append(hits / min(k, len(hidden)))
+    return float(np.mean(precision)), float(np.mean(recall))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the recommenders on a holdout split")
+    parser.add_argument("--models", nargs="+", choices=("popular", "knn", *MODELS), default=["popular", "knn", "als", "bpr"])
+    parser.add_argument("--k", type=int, default=10, help="Recommendations per user")
+    parser.add_argument("--test-size", type=float, default=0.2, help="Share of each user's ratings hidden")
+    parser.add_argument("--min-ratings", type=int, default=3, help="Users with fewer ratings are not evaluated")
+    parser.add_argument("--factors", type=int, default=64, help="Latent factors of als/bpr")
+    parser.add_argument("--iterations", type=int, default=None, help="Training iterations of als/bpr")
+    parser.add_argument("--threads", type=int, default=0, help="Threads of als/bpr (0: every CPU)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ratings, _ = load_ratings()
+    X = create_matrix(ratings)[0]
+    del ratings
+    train, test = holdout_split(X, args.test_size, args.min_ratings, args.seed)
+    columns = np.fromiter(test, dtype=np.int64)
+    print(
+        f"{X.shape[0]} books x {X.shape[1]} users, {X.nnz} ratings; "
+        f"{X.nnz - train.nnz} hidden from {len(test)} users"
+    )
+
+    results = []
+    for name in args.models:
+        start = time.perf_counter()
+        if name == "popular":
+            recommended = popular_books(train, columns, args.k)
+        elif name == "knn":
+            recommended = knn_books(train, columns, args.k)
+        else:
+            recommended = factor_books(
+                train, columns, args.k, name=name, factors=args.factors,
+                iterations=args.iterations, num_threads=args.threads, random_state=args.seed,
+            )
+        elapsed = time.perf_counter() - start
+        results.append((name, elapsed, *score(recommended, test, args.k)))
+
+    print(f"\n{'model':<10}{'time s':>9}{'precision@' + str(args.k):>15}{'recall@' + str(args.k):>12}")
+    for name, elapsed, precision, recall in results:
+        print(f"{name:<10}{elapsed:>9.1f}{precision:>15.4f}{recall:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
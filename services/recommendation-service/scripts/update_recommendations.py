@@ -4,156 +4,489 @@ PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os
 COMMON_DIR = os.path.join(PROJECT_DIR, "common")
 if COMMON_DIR not in sys.path:
     sys.path.insert(0, COMMON_DIR)
-import pandas as pd
-from sqlalchemy import create_engine, text
-from scipy.sparse import coo_matrix
-from python_common.config.db import book_engine, rating_engine, recommendation_engine
+import argparse
+import io
+from sqlalchemy import text
+from python_common.config.db import rating_engine, recommendation_engine
+from django_common.utils.isbn_helpers import canonicalize_isbns
 import numpy as np
 import pandas as pd
-import sklearn
-import matplotlib.pyplot as plt
-import seaborn as sns
-import warnings
-from sklearn.neighbors import NearestNeighbors
+from sklearn import config_context
 from scipy.sparse import csr_matrix
-import json
-
-books = pd.read_sql("SELECT * FROM books", book_engine)
-ratings = pd.read_sql("SELECT * FROM ratings", rating_engine)
-
-isbns = ratings["isbn"].unique()[10:12]
-user_ids = ratings["user_id"].unique()[101:103]
-
-conn = recommendation_engine.connect()
-conn.execute(text("DELETE FROM user_recommendations"))
-conn.execute(text("DELETE FROM book_similarities"))
+from recommender.ann import BACKENDS, create_index
+from recommender.artifacts import KEEP_VERSIONS, load_version, new_version, write_version
+from recommender.factorization import MODELS, create_model, fit_model, recommend_all
+
+# MiB of distances kneighbors computes at a time: sklearn's 1024 default
+# multiplies peak memory by 5 for a few percent of speed
+KNN_WORKING_MEMORY = 128
+
+# Only one trainer may write recommendations and the saved matrix at a time
+TRAINER_LOCK = 7_201_901
+
+
+def load_ratings():
+    """
+    (ratings, changelog position) read in one snapshot: the matrix built from
+    them reflects every change below that position, and none at or above it.
+    """
+    with rating_engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+        position = conn.execute(text("SELECT rating_changes_position()")).scalar()
+        ratings = pd.read_sql(text("SELECT user_id, isbn, rating FROM ratings"), conn)
+    return clean_ratings(ratings), position
+
+
+def load_changes(after):
+    """
+    (net change of every (user, book) pair changed at or after changelog
+    position `after`, the position they lead to), read in one snapshot
+    """
+    with rating_engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+        position = conn.execute(text("SELECT rating_changes_position()")).scalar()
+        changes = pd.read_sql(
+            text("SELECT seq, user_id, isbn, rating, op FROM rating_changes_since(:after) ORDER BY seq"),
+            conn,
+            params={"after": after},
+        )
+    changes["isbn"] = canonicalize_isbns(changes["isbn"].to_numpy(dtype=str))
+    return changes.dropna(subset=["isbn"]).drop_duplicates(["user_id", "isbn"], keep="last"), position
+
+
+def clean_ratings(ratings):
+    # ISBN-10 and ISBN-13 spellings of the same book must land on one matrix row
+    ratings["isbn"] = canonicalize_isbns(ratings["isbn"].to_numpy(dtype=str))
+    return ratings.dropna(subset=["isbn"]).drop_duplicates(["user_id", "isbn"], keep="last")
 
-print("Connected do databases")
 
 def create_matrix(df):
-    N = len(df['user_id'].unique())
-    M = len(df['isbn'].unique())
-
-    user_mapper = dict(zip(np.unique(df["user_id"]), list(range(N))))
-    book_mapper = dict(zip(np.unique(df["isbn"]), list(range(M))))
-
-    user_inv_mapper = dict(zip(list(range(N)), np.unique(df["user_id"])))
-    book_inv_mapper = dict(zip(list(range(M)), np.unique(df["isbn"])))
-
-    user_index = [user_mapper[i] for i in df['user_id']]
-    book_index = [book_mapper[i] for i in df['isbn']]
-
-    X = csr_matrix((df["rating"], (book_index, user_index)), shape=(M, N))
-
-    return X, user_mapper, book_mapper, user_inv_mapper, book_inv_mapper
-
-X, user_mapper, book_mapper, user_inv_mapper, book_inv_mapper = create_matrix(ratings)
-
-def find_similar_books(isbn, X, k, metric='cosine', show_distance=False):
-    neighbour_ids = []
-
-    if isbn not in book_mapper:
-        print(f"Movie ID {isbn} not found in book_mapper!")
-        return []
-
-    book_ind = book_mapper[isbn]
-    book_vec = X[book_ind]
-    k += 1 
-    kNN = NearestNeighbors(n_neighbors=k, algorithm="brute", metric=metric)
-    kNN.fit(X)
-    book_vec = book_vec.reshape(1, -1)
-    neighbour = kNN.kneighbors(book_vec, return_distance=show_distance)
-
-    for i in range(0, k):
-        n = neighbour.item(i)
-        neighbour_ids.append(book_inv_mapper[n])
-
-    neighbour_ids.pop(0)
-    return neighbour_ids
-
-def recommend_books_for_user(user_id, X, user_mapper, book_mapper, book_inv_mapper, k=10):
-    df1 = ratings[ratings['user_id'] == user_id]
-    isbn = df1[df1['rating'] == max(df1['rating'])]['isbn'].iloc[0]
-    recommended_isbns= find_similar_books(isbn, X, k)
-
-    return recommended_isbns
-
-def recommend_books_for_user_v2(user_id, X, user_mapper, book_mapper, book_inv_mapper, k=10, top_n=10):
-    """Improved user recommendation based on weighted aggregation of multiple liked books."""
-    if user_id not in user_mapper:
-        print(f"User {user_id} not found!")
-        return []
-
-    # Get this user's ratings
-    user_ratings = ratings[ratings['user_id'] == user_id]
-    if user_ratings.empty:
-        return []
-
-    # Focus on books rated above a threshold
-    high_rated = user_ratings[user_ratings['rating'] >= 4]
-    if high_rated.empty:
-        high_rated = user_ratings.nlargest(3, 'rating')  # fallback to top 3
-
-    scores = {}
-    kNN = NearestNeighbors(n_neighbors=k+1, algorithm="brute", metric='cosine')
-    kNN.fit(X)
-
-    for _, row in high_rated.iterrows():
-        isbn = row['isbn']
-        rating = row['rating']
-
-        if isbn not in book_mapper:
-            continue
+    """
+    The books x users ratings matrix (float32 data, int32 indices), with its
+    mappers: user_mapper and book_mapper are pd.Index of the ids (use
+    get_indexer/get_loc), user_inv_mapper and book_inv_mapper the id arrays
+    themselves, in column and row order (sorted ids).
+    """
+    # One hash pass per column, instead of a dict lookup per rating
+    user_index, user_ids = pd.factorize(df["user_id"], sort=True)
+    book_index, isbns = pd.factorize(df["isbn"], sort=True)
+
+    X = csr_matrix(
+        (
+            df["rating"].to_numpy(np.float32),
+            (book_index.astype(np.int32), user_index.astype(np.int32)),
+        ),
+        shape=(len(isbns), len(user_ids)),
+    )
 
-        book_ind = book_mapper[isbn]
-        book_vec = X[book_ind].reshape(1, -1)
+    user_inv_mapper, book_inv_mapper = np.asarray(user_ids), np.asarray(isbns, dtype=object)
+    return X, pd.Index(user_inv_mapper), pd.Index(book_inv_mapper), user_inv_mapper, book_inv_mapper
+
+
+def create_mappers(user_ids, isbns):
+    """The mappers of `create_matrix` for the saved id arrays (column/row order)"""
+    return pd.Index(user_ids), pd.Index(isbns), np.asarray(user_ids), np.asarray(isbns, dtype=object)
+
+
+def patch_matrix(X, user_ids, isbns, changes):
+    """
+    Apply net rating changes (user_id, isbn, rating, op) to the books x users
+    matrix `X`, whose rows and columns are `isbns` and `user_ids`. Unknown books
+    and users are appended. Returns (X, user_ids, isbns, rows of the changed books).
+    """
+    user_ids = np.concatenate([user_ids, pd.unique(changes["user_id"][~changes["user_id"].isin(user_ids)])])
+    isbns = np.concatenate([isbns, pd.unique(changes["isbn"][~changes["isbn"].isin(isbns)])]).astype(object)
+    cols = pd.Index(user_ids).get_indexer(changes["user_id"])
+    rows = pd.Index(isbns).get_indexer(changes["isbn"])
+
+    # Drop the current value of every changed cell, then add back the new values
+    # (deletes add nothing); all on the COO arrays, without a Python loop per rating
+    X = X.tocoo()
+    n_users = np.int64(len(user_ids))
+    keep = ~np.isin(X.row.astype(np.int64) * n_users + X.col, rows.astype(np.int64) * n_users + cols)
+    upsert = (changes["op"] != "D").to_numpy()
+    X = csr_matrix(
+        (
+            np.concatenate([X.data[keep], changes["rating"].to_numpy(np.float32)[upsert]]),
+            (np.concatenate([X.row[keep], rows[upsert]]), np.concatenate([X.col[keep], cols[upsert]])),
+        ),
+        shape=(len(isbns), len(user_ids)),
+    )
+    return X, user_ids, isbns, np.unique(rows)
+
+
+def fit_index(X, n_jobs=-1, backend="ivf", **options):
+    """Cosine kNN index over the book rows of `X` (see recommender.ann), fitted once per run"""
+    return create_index(backend, n_jobs=n_jobs, **options).fit(X)
+
+
+def nearest_books(index, X, rows, k=10, batch_size=20000):
+    """
+    (distances, neighbours) of the `k` + 1 nearest books of each book row in
+    `rows` (the book itself usually comes first), in batched kneighbors calls.
+    Rows with fewer neighbours are padded with -1.
+    """
+    distances = np.empty((len(rows), k + 1), dtype=np.float32)
+    neighbours = np.empty((len(rows), k + 1), dtype=np.int64)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        with config_context(working_memory=KNN_WORKING_MEMORY):
+            distances[start:start + len(batch)], neighbours[start:start + len(batch)] = index.kneighbors(
+                X[batch], n_neighbors=k + 1
+            )
+        print(f"  … neighbors of {start + len(batch)}/{len(rows)} books")
+    return distances, neighbours
+
+
+def patch_neighbours(artifacts, n_books, affected, rows, distances, neighbours):
+    """
+    The saved (distances, neighbours) of every book, grown to `n_books` rows,
+    with the `affected` rows cleared and the recomputed `rows` replaced
+    """
+    saved_distances, saved_neighbours = artifacts.neighbour_distances, artifacts.neighbour_ids
+    all_distances = np.ones((n_books, saved_distances.shape[1]), dtype=np.float32)
+    all_neighbours = np.full((n_books, saved_neighbours.shape[1]), -1, dtype=np.int32)
+    all_distances[:len(saved_distances)] = saved_distances
+    all_neighbours[:len(saved_neighbours)] = saved_neighbours
+    # Affected books left without ratings have no neighbours any more
+    all_neighbours[affected] = -1
+    all_distances[rows], all_neighbours[rows] = distances, neighbours
+    return all_distances, all_neighbours
+
+
+def similar_books(rows, distances, neighbours, book_inv_mapper, k=10):
+    """
+    (isbn_source, isbn_similar, score) of the `k` most similar books of each book
+    row the neighbours were computed for; score is the cosine similarity.
+    """
+    width = neighbours.shape[1]
+    source, similar = np.repeat(np.asarray(rows), width), neighbours.ravel()
+    keep = (similar >= 0) & (similar != source)
+    pairs = pd.DataFrame({"source": source[keep], "similar": similar[keep], "score": 1 - distances.ravel()[keep]})
+    # Neighbours come nearest first
+    pairs = pairs[pairs.groupby("source").cumcount() < k]
+    return pd.DataFrame({
+        "isbn_source": book_inv_mapper[pairs["source"].to_numpy()],
+        "isbn_similar": book_inv_mapper[pairs["similar"].to_numpy()],
+        "score": pairs["score"].to_numpy(),
+    })
+
+
+def recommend_books(X, columns, rows, distances, neighbours, top_n=10):
+    """
+    (user column, book row, score) of the `top_n` recommended books of the users
+    in matrix `columns`, best first. Each book a user liked (rated >= 4, else
+    their 3 best ratings) gives its neighbours rating * cosine similarity; books
+    the user has rated are left out. `rows` must cover every book these users
+    rated. One groupby over all users instead of a loop with a kNN query per rating.
+    """
+    columns = np.asarray(columns)
+    R = X[:, columns].tocoo()
+    rated = pd.DataFrame({"user": columns[R.col], "book": R.row, "rating": R.data})
+
+    high = rated["rating"] >= 4
+    has_high = high.groupby(rated["user"]).transform("any")
+    fallback = rated[~has_high].sort_values("rating", ascending=False, kind="stable").groupby("user").head(3)
+    liked = pd.concat([rated[high], fallback])
+
+    position = np.full(X.shape[0], -1, dtype=np.int64)
+    position[rows] = np.arange(len(rows))
+    liked_at = position[liked["book"].to_numpy()]
+    width = neighbours.shape[1]
+    votes = pd.DataFrame({
+        "user": np.repeat(liked["user"].to_numpy(), width),
+        "source": np.repeat(liked["book"].to_numpy(), width),
+        "book": neighbours[liked_at].ravel(),
+        "score": (liked["rating"].to_numpy()[:, None] * (1 - distances[liked_at])).ravel(),
+    })
+    n_books = np.int64(X.shape[0])
+    read = rated["user"].to_numpy(np.int64) * n_books + rated["book"].to_numpy()
+    votes = votes[
+        (votes["book"] >= 0)
+        & (votes["book"] != votes["source"])
+        & ~np.isin(votes["user"].to_numpy(np.int64) * n_books + votes["book"].to_numpy(), read)
+    ]
+
+    scores = votes.groupby(["user", "book"], sort=False)["score"].sum().reset_index()
+    return scores.sort_values(["user", "score"], ascending=[True, False], kind="stable").groupby("user").head(top_n)
+
+
+def recommendations_by_id(recommended, user_inv_mapper, book_inv_mapper):
+    """(user_id, isbn, score) rows for (user column, book row, score) rows"""
+    return pd.DataFrame({
+        "user_id": user_inv_mapper[recommended["user"].to_numpy()],
+        "isbn": book_inv_mapper[recommended["book"].to_numpy()],
+        "score": recommended["score"].to_numpy(),
+    })
+
+
+# -----------------------------
+# Storage (db/init.sql): rows are keyed by model version, and readers only
+# see the version active_model_version points to
+# -----------------------------
+def copy_rows(conn, table, frame, chunk_size=200000):
+    """Bulk-load `frame`, whose columns are named after the table's, with COPY"""
+    with conn.connection.cursor() as cursor:
+        # One COPY per chunk bounds the text buffer
+        for start in range(0, len(frame), chunk_size):
+            buffer = io.StringIO()
+            frame.iloc[start:start + chunk_size].to_csv(buffer, sep="\t", header=False, index=False)
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table} ({', '.join(frame.columns)}) FROM STDIN", buffer)
+
+
+def active_version(conn):
+    return conn.execute(text("SELECT version FROM active_model_version")).scalar()
+
+
+def publish_version(conn, version, model, changes_position, similarities, recommendations):
+    """
+    Write every row of a new version and make it the active one. Runs in the
+    caller's transaction, so readers switch from the complete previous version
+    to the complete new one at commit.
+    """
+    conn.execute(
+        text(
+            "INSERT INTO model_versions (version, model, changes_position) "
+            "VALUES (:version, :model, :changes_position)"
+        ),
+        {"version": version, "model": model, "changes_position": changes_position},
+    )
+    copy_rows(conn, "book_similarities", similarities.assign(version=version))
+    copy_rows(conn, "user_recommendations", recommendations.assign(version=version))
+    conn.execute(
+        text(
+            "INSERT INTO active_model_version (version) VALUES (:version) "
+            "ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version"
+        ),
+        {"version": version},
+    )
 
-        distances, neighbours = kNN.kneighbors(book_vec, return_distance=True)
 
-        for dist, neighbour_idx in zip(distances[0], neighbours[0]):
-            sim_isbn = book_inv_mapper[neighbour_idx]
-            if sim_isbn == isbn:
-                continue  # skip the same book
+def patch_version(conn, version, changes_position, similarities, recommendations, isbns, user_ids):
+    """Replace the rows of books `isbns` and users `user_ids` of `version` in place, in the caller's transaction"""
+    conn.execute(
+        text("DELETE FROM book_similarities WHERE version = :version AND isbn_source = ANY(:isbns)"),
+        {"version": version, "isbns": list(isbns)},
+    )
+    conn.execute(
+        text("DELETE FROM user_recommendations WHERE version = :version AND user_id = ANY(:user_ids)"),
+        {"version": version, "user_ids": [int(user_id) for user_id in user_ids]},
+    )
+    copy_rows(conn, "book_similarities", similarities.assign(version=version))
+    copy_rows(conn, "user_recommendations", recommendations.assign(version=version))
+    conn.execute(
+        text(
+            "UPDATE model_versions SET changes_position = :changes_position, updated_at = now() "
+            "WHERE version = :version"
+        ),
+        {"version": version, "changes_position": changes_position},
+    )
 
-            # Weighted score: higher rating + closer similarity = higher score
-            similarity_score = 1 - dist
-            weight = rating * similarity_score
-            scores[sim_isbn] = scores.get(sim_isbn, 0) + weight
 
-    # Remove books the user has already rated
-    read_books = set(user_ratings['isbn'])
-    scores = {isbn: score for isbn, score in scores.items() if isbn not in read_books}
+def drop_old_versions(conn, keep=KEEP_VERSIONS):
+    """Delete all but the `keep` newest versions (never the active one) once readers moved on, then ANALYZE"""
+    old = conn.execute(
+        text(
+            "SELECT version FROM model_versions "
+            "WHERE version <> (SELECT version FROM active_model_version) "
+            "ORDER BY created_at DESC OFFSET :keep"
+        ),
+        {"keep": keep - 1},
+    ).scalars().all()
+    if old:
+        conn.execute(text("DELETE FROM book_similarities WHERE version = ANY(:old)"), {"old": old})
+        conn.execute(text("DELETE FROM user_recommendations WHERE version = ANY(:old)"), {"old": old})
+        conn.execute(text("DELETE FROM model_versions WHERE version = ANY(:old)"), {"old": old})
+    # Fresh statistics for the bulk-loaded rows, before autovacuum gets to them
+    conn.execute(text("ANALYZE book_similarities, user_recommendations"))
+    conn.commit()
+
+
+def model_settings(model_options, model):
+    """What the API needs to score with the model, and incremental runs to refit it"""
+    settings = {key: value for key, value in model_options.items() if key != "num_threads"}
+    settings.update(iterations=model.iterations, regularization=float(model.regularization))
+    return settings
+
+
+def update_all(conn, n_jobs=-1, index_options=None, model_options=None):
+    """
+    Rebuild everything from the ratings table. Book similarities come from the
+    kNN index; user recommendations from it too, or from a factor model fitted
+    with `model_options` (see recommender.factorization).
+    """
+    ratings, changes_position = load_ratings()
+    X, user_mapper, book_mapper, user_inv_mapper, book_inv_mapper = create_matrix(ratings)
+    del ratings
+
+    # Every book's neighbours, from one fitted index: they also serve every user
+    index = fit_index(X, n_jobs, **(index_options or {}))
+    rows = np.arange(X.shape[0])
+    distances, neighbours = nearest_books(index, X, rows)
+    similarities = similar_books(rows, distances, neighbours, book_inv_mapper)
+
+    columns = np.arange(X.shape[1])
+    model = None
+    if model_options:
+        model = fit_model(create_model(**model_options), X)
+        recommended = recommend_all(model, X, columns)
+    else:
+        recommended = recommend_books(X, columns, rows, distances, neighbours)
+    recommendations = recommendations_by_id(recommended, user_inv_mapper, book_inv_mapper)
+
+    # The stored rows and the artifacts the API scores new ratings with share the version name
+    version = new_version()
+    publish_version(
+        conn, version, model_options["name"] if model else "knn", changes_position, similarities, recommendations
+    )
+    conn.commit()
+    write_version(
+        X,
+        user_inv_mapper,
+        book_inv_mapper,
+        changes_position,
+        (distances, neighbours),
+        model,
+        model_settings(model_options, model) if model else None,
+        version=version,
+    )
+    drop_old_versions(conn)
+    print(
+        f"Full update done: {similarities['isbn_source'].nunique()} books, "
+        f"{recommendations['user_id'].nunique()} users (changelog position {changes_position}, model version {version})"
+    )
 
-    # Sort by aggregated score
-    recommended_isbns = sorted(scores, key=scores.get, reverse=True)[:top_n]
 
-    return recommended_isbns
+def update_changed(conn, n_jobs=-1, index_options=None, model_options=None):
+    """
+    Patch the saved matrix with the rating changes since the last run and
+    recompute only what they can affect:
+      - the neighbors of the changed books, and of the books whose stored
+        neighbors include a changed book
+      - the recommendations of the users who rated any of those books
+    Books that only became closer to a changed book without listing it are
+    left to the next full run. Factor models (the given one, else the current
+    version's) are refitted: every rating moves every factor.
+    """
+    artifacts = load_version()
+    version = active_version(conn)
+    if artifacts is None or version is None:
+        print("No saved ratings matrix yet: running a full update")
+        return update_all(conn, n_jobs, index_options, model_options)
+    X, user_ids, isbns = artifacts.X, artifacts.user_ids, artifacts.isbns
+
+    changes, changes_position = load_changes(artifacts.changes_position)
+    if changes.empty:
+        print(f"No rating changes since changelog position {artifacts.changes_position}")
+        return
+    if not model_options and artifacts.model["name"] != "knn":
+        model_options = {**artifacts.model, "num_threads": max(n_jobs, 0)}
+    if model_options:
+        print(f"The {model_options['name']} model is refitted on every rating: running a full update")
+        return update_all(conn, n_jobs, index_options, model_options)
+    X, user_ids, isbns, changed_rows = patch_matrix(X, user_ids, isbns, changes)
+    user_mapper, book_mapper, user_inv_mapper, book_inv_mapper = create_mappers(user_ids, isbns)
+
+    stale = conn.execute(
+        text(
+            "SELECT DISTINCT isbn_source FROM book_similarities "
+            "WHERE version = :version AND isbn_similar = ANY(:isbns)"
+        ),
+        {"version": version, "isbns": list(isbns[changed_rows])},
+    ).scalars()
+    stale = book_mapper.get_indexer(list(stale))
+    affected = np.union1d(changed_rows, stale[stale >= 0])
+    columns = np.union1d(X[affected].indices, pd.Index(user_ids).get_indexer(changes["user_id"]))
+
+    # Neighbours of the affected books and of every book the affected users rated,
+    # from one index over the patched matrix
+    rated = np.diff(X.indptr) > 0
+    rows = np.union1d(affected, X[:, columns].tocoo().row)
+    rows = rows[rated[rows]]
+    distances, neighbours = nearest_books(fit_index(X, n_jobs, **(index_options or {})), X, rows)
+
+    # Books left without ratings have no neighbours: their rows are only deleted
+    similarities = similar_books(rows, distances, neighbours, book_inv_mapper)
+    similarities = similarities[similarities["isbn_source"].isin(isbns[affected])]
+    recommended = recommend_books(X, columns, rows, distances, neighbours)
+    recommendations = recommendations_by_id(recommended, user_inv_mapper, book_inv_mapper)
+    patch_version(
+        conn, version, changes_position, similarities, recommendations, isbns[affected], user_inv_mapper[columns]
+    )
+    conn.commit()
+
+    # Saved after the commit: a crash in between replays the same changes next time
+    neighbours = patch_neighbours(artifacts, X.shape[0], affected, rows, distances, neighbours)
+    artifacts_version = write_version(X, user_ids, isbns, changes_position, neighbours)
+    print(
+        f"Incremental update done: {len(changes)} rating changes, {len(affected)} books, "
+        f"{len(columns)} users recomputed (model version {version}, artifacts {artifacts_version})"
+    )
 
 
-for isbn in isbns:
-    similar_isbns = find_similar_books(isbn, X, 10)
-    conn.execute(
-        text("INSERT INTO book_similarities (isbn, similar_isbns) VALUES (:isbn, :similar_isbns)"),
-        {
-            "isbn": isbn,
-            "similar_isbns": similar_isbns
-        }
+def main():
+    parser = argparse.ArgumentParser(description="Compute book similarities and user recommendations")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Apply the rating changes since the last run instead of rebuilding everything",
     )
-    
-for user_id in user_ids:
-    recommended_isbns = recommend_books_for_user_v2(user_id, X, user_mapper, book_mapper, book_inv_mapper, k=10)
-    conn.execute(
-        text("INSERT INTO user_recommendations (user_id, recommended_isbns) VALUES (:user_id, :recommended_isbns)"),
-        {
-            "user_id": int(user_id),
-            "recommended_isbns": recommended_isbns
-        }
+    parser.add_argument(
+        "--jobs", type=int, default=-1,
+        help="Parallel jobs of the brute index and threads of factor models (-1: every CPU)",
     )
-    
-conn.commit()
-
-print("TEST:")
-recommendations = pd.read_sql("SELECT * FROM user_recommendations", recommendation_engine)
-similarities = pd.read_sql("SELECT * FROM book_similarities", recommendation_engine)
-print(recommendations.head())
-print(similarities.head())
+    parser.add_argument(
+        "--index", choices=BACKENDS, default="ivf",
+        help="Nearest-neighbor backend: ivf only scores books sharing a rater, brute scores every pair",
+    )
+    parser.add_argument(
+        "--max-list-size", type=int, default=None,
+        help="ivf: skip the raters of more books when generating candidates (approximate, bounds query time)",
+    )
+    parser.add_argument(
+        "--model", choices=("knn", *MODELS), default="knn",
+        help="User recommendations from the liked books' neighbors (knn) or from a factor model",
+    )
+    parser.add_argument("--factors", type=int, default=64, help="Latent factors of als/bpr")
+    parser.add_argument("--iterations", type=int, default=None, help="Training iterations of als/bpr")
+    args = parser.parse_args()
+    model_options = None
+    if args.model != "knn":
+        model_options = {
+            "name": args.model, "factors": args.factors, "iterations": args.iterations,
+            "num_threads": max(args.jobs, 0),
+        }
+    index_options = {"backend": args.index}
+    if args.max_list_size is not None:
+        if args.index != "ivf":
+            parser.error("--max-list-size only applies to --index ivf")
+        index_options["max_list_size"] = args.max_list_size
+
+    with recommendation_engine.connect() as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": TRAINER_LOCK}).scalar():
+            print("Another recommendation update is running")
+            return
+        conn.commit()
+        print("Connected do databases")
+        try:
+            if args.incremental:
+                update_changed(conn, args.jobs, index_options, model_options)
+            else:
+                update_all(conn, args.jobs, index_options, model_options)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": TRAINER_LOCK})
+            conn.commit()
+
+        active = conn.execute(
+            text(
+                "SELECT version, model, changes_position, updated_at FROM model_versions "
+                "WHERE version = (SELECT version FROM active_model_version)"
+            )
+        ).first()
+    if active is not None:
+        print(
+            f"Active model version {active.version} ({active.model}, "
+            f"changelog position {active.changes_position}, updated {active.updated_at:%Y-%m-%d %H:%M:%S %Z})"
+        )
+
+
+if __name__ == "__main__":
+    main()
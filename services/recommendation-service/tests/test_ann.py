@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+from sklearn.preprocessing import normalize
+
+from recommender.ann import InvertedFileIndex, create_index, recall_at_k
+
+
+class InvertedFileIndexTest(unittest.TestCase):
+    def setUp(self):
+        # Sparse enough that many books have fewer than 10 similar ones
+        self.X = sparse_random(300, 200, density=0.01, format="csr", dtype=np.float32, random_state=0)
+        self.rows = np.arange(self.X.shape[0])
+        self.exact = create_index("brute").fit(self.X).kneighbors(self.X, n_neighbors=11)
+
+    def assert_matches_brute_force(self, distances, neighbours):
+        exact_distances, _ = self.exact
+        # Brute force goes on past the last similar book, at distance 1; the inverted file pads with -1
+        similar = exact_distances < 1 - 1e-6
+        self.assertTrue((neighbours[~similar] == -1).all())
+        self.assertTrue((neighbours[similar] >= 0).all())
+        self.assertTrue(all(len(set(row[row >= 0])) == (row >= 0).sum() for row in neighbours))
+        np.testing.assert_allclose(distances, exact_distances, atol=1e-5)
+        # Equally similar books may come in another order: check each one is at the distance listed
+        Xn = normalize(self.X)
+        queries = np.repeat(self.rows, neighbours.shape[1]).reshape(neighbours.shape)[similar]
+        cosine = np.asarray(Xn[queries].multiply(Xn[neighbours[similar]]).sum(axis=1)).ravel()
+        np.testing.assert_allclose(distances[similar], 1 - cosine, atol=1e-5)
+        self.assertEqual(recall_at_k(self.rows, *self.exact, distances, neighbours), 1.0)
+
+    def test_matches_brute_force(self):
+        index = InvertedFileIndex(batch_size=64).fit(self.X)
+        self.assert_matches_brute_force(*index.kneighbors(self.X, n_neighbors=11))
+
+    def test_list_size_bound_above_every_list_is_exact(self):
+        longest = np.diff(self.X.T.tocsr().indptr).max()
+        index = InvertedFileIndex(max_list_size=longest).fit(self.X)
+        self.assertIsNone(index.candidate_lists)
+        self.assert_matches_brute_force(*index.kneighbors(self.X, n_neighbors=11))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+
+from recommender.artifacts import (
+    CURRENT_FILE,
+    VERSIONS_DIR,
+    current_version,
+    load_version,
+    prune_versions,
+    write_version,
+)
+
+
+def ratings_matrix(n_books=30, n_users=20, seed=0):
+    """A random books x users ratings matrix (1-10), float32 data and int32 indices as the trainer builds it"""
+    rng = np.random.default_rng(seed)
+    X = sparse_random(n_books, n_users, density=0.2, format="csr", dtype=np.float32, random_state=rng)
+    X.data = rng.integers(1, 11, size=X.nnz).astype(np.float32)
+    return X
+
+
+class ArtifactsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.X = ratings_matrix()
+        self.user_ids = np.arange(100, 100 + self.X.shape[1])
+        self.isbns = np.array([f"97800000{row:05d}" for row in range(self.X.shape[0])], dtype=object)
+        rng = np.random.default_rng(1)
+        self.neighbours = (
+            rng.random((self.X.shape[0], 11), dtype=np.float32),
+            rng.integers(-1, self.X.shape[0], size=(self.X.shape[0], 11)),
+        )
+
+    def write(self, **kwargs):
+        return write_version(
+            self.X, self.user_ids, self.isbns, 1234, self.neighbours, directory=self.directory, **kwargs
+        )
+
+    def test_versions_round_trip_as_memory_maps(self):
+        version = self.write()
+        self.assertEqual(current_version(self.directory), version)
+
+        artifacts = load_version(directory=self.directory)
+        self.assertEqual(artifacts.version, version)
+        self.assertEqual((artifacts.X != self.X).nnz, 0)
+        self.assertFalse(artifacts.X.data.flags.writeable)  # read-only view of the mapped file
+        np.testing.assert_array_equal(artifacts.user_ids, self.user_ids)
+        self.assertEqual(list(artifacts.isbns), list(self.isbns))
+        self.assertEqual(artifacts.changes_position, 1234)
+        self.assertIsInstance(artifacts.neighbour_ids, np.memmap)
+        np.testing.assert_array_equal(artifacts.neighbour_ids, self.neighbours[1])
+        np.testing.assert_array_equal(artifacts.neighbour_distances, self.neighbours[0])
+        self.assertEqual(artifacts.model, {"name": "knn"})
+        self.assertIsNone(artifacts.item_factors)
+
+    def test_factor_models_are_saved_with_their_settings(self):
+        rng = np.random.default_rng(2)
+        model = SimpleNamespace(
+            user_factors=rng.random((self.X.shape[1], 4), dtype=np.float32),
+            item_factors=rng.random((self.X.shape[0], 4), dtype=np.float32),
+        )
+        self.write(model=model, model_settings={"name": "als", "regularization": 0.05})
+
+        artifacts = load_version(directory=self.directory)
+        self.assertEqual(artifacts.model, {"name": "als", "regularization": 0.05})
+        self.assertIsInstance(artifacts.item_factors, np.memmap)
+        np.testing.assert_array_equal(artifacts.item_factors, model.item_factors)
+        np.testing.assert_array_equal(artifacts.user_factors, model.user_factors)
+
+    def test_old_versions_are_pruned(self):
+        versions = os.path.join(self.directory, VERSIONS_DIR)
+        os.makedirs(os.path.join(versions, ".20000101T000000000000Z.tmp"))  # left by an interrupted run
+        for version in ["v1", "v2", "v3", "v4", "v5"]:
+            self.write(version=version)
+        self.assertEqual(sorted(os.listdir(versions)), ["v3", "v4", "v5"])
+
+        # The current version is kept whatever its age
+        with open(os.path.join(self.directory, CURRENT_FILE), "w") as f:
+            f.write("v3")
+        prune_versions(self.directory, keep=1)
+        self.assertEqual(sorted(os.listdir(versions)), ["v3", "v5"])
+
+    def test_no_version_yet(self):
+        self.assertIsNone(current_version(self.directory))
+        self.assertIsNone(load_version(directory=self.directory))
+
+
+if __name__ == "__main__":
+    unittest.main()
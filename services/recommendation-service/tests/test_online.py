@@ -0,0 +1,119 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from recommender import online
+from recommender.artifacts import load_version, write_version
+from recommender.factorization import create_model, fit_model, user_items
+from recommender.online import OnlineRecommender, Scorer
+from scripts.update_recommendations import fit_index, model_settings, nearest_books, recommend_books
+from tests.test_artifacts import ratings_matrix
+
+
+class ScorerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.X = ratings_matrix(n_books=60, n_users=40)
+        self.isbns = np.array([f"97800000{row:05d}" for row in range(self.X.shape[0])], dtype=object)
+        rows = np.arange(self.X.shape[0])
+        self.distances, self.neighbours = nearest_books(fit_index(self.X), self.X, rows)
+
+    def scorer(self, model=None, settings=None):
+        write_version(
+            self.X, np.arange(self.X.shape[1]), self.isbns, 0, (self.distances, self.neighbours),
+            model, settings, directory=self.directory,
+        )
+        return Scorer(load_version(directory=self.directory))
+
+    def user_ratings(self, column):
+        ratings = self.X[:, column].tocoo()
+        return dict(zip(self.isbns[ratings.row], ratings.data))
+
+    def test_knn_users_are_scored_as_in_the_batch_run(self):
+        scorer = self.scorer()
+        for column in range(5):
+            batch = recommend_books(
+                self.X, [column], np.arange(self.X.shape[0]), self.distances, self.neighbours
+            )
+            self.assertEqual(scorer.recommend(self.user_ratings(column)), list(self.isbns[batch["book"]]))
+
+    def test_als_fold_in_matches_implicit(self):
+        options = {"name": "als", "factors": 8, "iterations": 10, "num_threads": 1}
+        model = fit_model(create_model(**options), self.X)
+        scorer = self.scorer(model, model_settings(options, model))
+
+        items = user_items(self.X)
+        for column in range(5):
+            ids, _ = model.recommend(
+                column, items[column], N=10, filter_already_liked_items=True, recalculate_user=True
+            )
+            self.assertEqual(scorer.recommend(self.user_ratings(column)), list(self.isbns[ids]))
+
+    def test_bpr_users_get_the_mean_of_their_books(self):
+        options = {"name": "bpr", "factors": 8, "iterations": 10, "num_threads": 1}
+        model = fit_model(create_model(**options), self.X)
+        scorer = self.scorer(model, model_settings(options, model))
+
+        ratings = self.user_ratings(0)
+        rows = [int(isbn[-5:]) for isbn in ratings]
+        user = np.asarray(scorer.artifacts.item_factors[rows]).mean(axis=0)
+        user[-1] = 1  # item bias term
+        scores = np.asarray(scorer.artifacts.item_factors) @ user
+        scores[rows] = -np.inf
+        self.assertEqual(scorer.recommend(ratings), list(self.isbns[np.argsort(-scores, kind="stable")[:10]]))
+
+    def test_unknown_books_get_the_most_rated_ones(self):
+        counts = np.diff(self.X.indptr)
+        most_rated = self.isbns[np.argsort(-counts, kind="stable")[:10]]
+        self.assertEqual(self.scorer().recommend({"9789999999991": 8}), list(most_rated))
+
+
+class OnlineRecommenderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.X = ratings_matrix()
+        self.neighbours = nearest_books(fit_index(self.X), self.X, np.arange(self.X.shape[0]))
+
+    def write(self, version):
+        isbns = np.array([f"97800000{row:05d}" for row in range(self.X.shape[0])], dtype=object)
+        write_version(
+            self.X, np.arange(self.X.shape[1]), isbns, 0, self.neighbours, version=version, directory=self.directory
+        )
+
+    def test_new_versions_are_swapped_in(self):
+        recommender = OnlineRecommender(self.directory, check_every=0)
+        self.assertIsNone(recommender.current())
+
+        self.write("v1")
+        scorer = recommender.current()
+        self.assertEqual(scorer.version, "v1")
+        self.assertIs(recommender.current(), scorer)  # unchanged CURRENT: not loaded again
+
+        self.write("v2")
+        self.assertEqual(recommender.current().version, "v2")
+
+    def test_checks_are_spaced_and_load_without_the_lock(self):
+        recommender = OnlineRecommender(self.directory, check_every=3600)
+        self.write("v1")
+        load = online.load_version
+
+        def load_unlocked(**kwargs):
+            self.assertFalse(recommender.lock.locked())
+            return load(**kwargs)
+
+        with mock.patch.object(online, "load_version", side_effect=load_unlocked) as loaded:
+            self.assertEqual(recommender.current().version, "v1")
+            self.write("v2")
+            self.assertEqual(recommender.current().version, "v1")  # not checked again yet
+            recommender.checked_at -= 3600
+            self.assertEqual(recommender.current().version, "v2")
+        self.assertEqual(loaded.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
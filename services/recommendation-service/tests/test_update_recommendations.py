@@ -0,0 +1,104 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from scripts.update_recommendations import (
+    create_matrix,
+    fit_index,
+    nearest_books,
+    patch_matrix,
+    patch_neighbours,
+)
+
+RATINGS = pd.DataFrame(
+    [
+        (1, "9780000000001", 8), (1, "9780000000002", 5),
+        (2, "9780000000002", 7), (2, "9780000000003", 9),
+        (3, "9780000000001", 6), (3, "9780000000003", 4),
+        (5, "9780000000004", 3), (5, "9780000000006", 6),
+        (2, "9780000000006", 5),
+    ],
+    columns=["user_id", "isbn", "rating"],
+)
+
+# Net changes, as load_changes returns them
+CHANGES = pd.DataFrame(
+    [
+        (1, "9780000000001", 10, "U"),
+        (2, "9780000000002", None, "D"),
+        (1, "9780000000002", None, "D"),    # leaves the book without ratings
+        (3, "9780000000004", 2, "I"),       # existing user and book, new cell
+        (4, "9780000000005", 7, "I"),       # unknown user and book
+        (4, "9780000000003", 8, "I"),       # unknown user, known book
+    ],
+    columns=["user_id", "isbn", "rating", "op"],
+)
+
+
+def final_ratings():
+    ratings = RATINGS.set_index(["user_id", "isbn"])["rating"].to_dict()
+    for user_id, isbn, rating, op in CHANGES.itertuples(index=False):
+        if op == "D":
+            ratings.pop((user_id, isbn))
+        else:
+            ratings[user_id, isbn] = rating
+    return pd.DataFrame(
+        [(user_id, isbn, rating) for (user_id, isbn), rating in ratings.items()],
+        columns=["user_id", "isbn", "rating"],
+    )
+
+
+def cells(X, user_ids, isbns):
+    """{(user_id, isbn): rating} of the stored cells of a books x users matrix"""
+    coo = X.tocoo()
+    return {(user_ids[col], isbns[row]): value for row, col, value in zip(coo.row, coo.col, coo.data)}
+
+
+class PatchMatrixTest(unittest.TestCase):
+    def test_patched_matrix_matches_a_rebuild(self):
+        X, _, _, user_ids, isbns = create_matrix(RATINGS.copy())
+        X, user_ids, isbns, changed_rows = patch_matrix(X, user_ids, isbns, CHANGES)
+
+        expected, _, _, expected_user_ids, expected_isbns = create_matrix(final_ratings())
+        self.assertEqual(cells(X, user_ids, isbns), cells(expected, expected_user_ids, expected_isbns))
+        self.assertEqual(X.nnz, expected.nnz)  # deleted cells are gone, not stored as 0
+        # Known ids keep their positions; new ones are appended
+        self.assertEqual(list(user_ids), [1, 2, 3, 5, 4])
+        self.assertEqual(list(isbns[:5]), sorted(RATINGS["isbn"].unique()))
+        self.assertEqual(isbns[5], "9780000000005")
+        self.assertEqual(X.shape, (6, 5))
+        self.assertEqual(sorted(isbns[changed_rows]), sorted(CHANGES["isbn"].unique()))
+
+
+class PatchNeighboursTest(unittest.TestCase):
+    def test_recomputed_rows_match_a_rebuild(self):
+        X, _, _, user_ids, isbns = create_matrix(RATINGS.copy())
+        saved = nearest_books(fit_index(X), X, np.arange(X.shape[0]), k=2)
+        artifacts = SimpleNamespace(neighbour_distances=saved[0], neighbour_ids=saved[1])
+
+        X, user_ids, isbns, changed_rows = patch_matrix(X, user_ids, isbns, CHANGES)
+        rated = np.diff(X.indptr) > 0
+        rows = changed_rows[rated[changed_rows]]
+        distances, neighbours = nearest_books(fit_index(X), X, rows, k=2)
+        all_distances, all_neighbours = patch_neighbours(
+            artifacts, X.shape[0], changed_rows, rows, distances, neighbours
+        )
+
+        self.assertEqual(all_neighbours.shape, (6, 3))
+        rebuilt_distances, rebuilt_neighbours = nearest_books(fit_index(X), X, np.arange(X.shape[0]), k=2)
+        np.testing.assert_array_equal(all_neighbours[rows], rebuilt_neighbours[rows])
+        np.testing.assert_allclose(all_distances[rows], rebuilt_distances[rows])
+        # The book left without ratings has no neighbours any more
+        unrated = np.flatnonzero(~rated)
+        self.assertEqual(list(isbns[unrated]), ["9780000000002"])
+        self.assertTrue((all_neighbours[unrated] == -1).all())
+        # Rows not recomputed are kept as saved
+        kept = np.setdiff1d(np.arange(5), changed_rows)
+        self.assertEqual(list(isbns[kept]), ["9780000000006"])
+        np.testing.assert_array_equal(all_neighbours[kept], saved[1][kept])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,70 +1,121 @@
 import csv
 import os
-import random
+import secrets
 import string
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice, repeat
+from typing import Iterator, List
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from users.hashers import hash_passwords
 from users.models import User
-from django.contrib.auth.hashers import make_password
 from config.settings import BASE_DIR
+from django_common.utils.bulk import copy_rows
 
-def random_username(existing_usernames, length=8):
-    while True:
-        username = 'user_' + ''.join(random.choices(string.ascii_lowercase + string.digits, k=length))
-        if username not in existing_usernames:
-            return username
+SEED_HASHER = 'users.hashers.SeedPasswordHasher'
+STAGING_COLUMNS = ['id', 'username', 'email', 'password', 'location', 'age']
+DEFAULT_CHUNK = 5000
 
-def random_email(existing_emails, length=8):
-    domains = ['example.com', 'testmail.com', 'mail.com']
-    while True:
-        email = ''.join(random.choices(string.ascii_lowercase + string.digits, k=length)) + '@' + random.choice(domains)
-        if email not in existing_emails:
-            return email
+
+def username_for(uid: int) -> str:
+    # User-IDs are unique, so are the usernames and emails derived from them
+    return f'user_{uid}'
+
+def email_for(uid: int) -> str:
+    return f'user_{uid}@example.com'
 
 def random_password(length=12):
     chars = string.ascii_letters + string.digits + string.punctuation
-    return ''.join(random.choices(chars, k=length))
+    return ''.join(secrets.choice(chars) for _ in range(length))
+
+def chunked(iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
 
 class Command(BaseCommand):
-    help = 'Import users from users.csv with random unique usernames, emails and passwords'
+    help = 'Import users from users.csv with usernames and emails derived from User-ID and random passwords'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=os.path.join(BASE_DIR, 'data/users.csv'))
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK,
+            help='Users hashed, staged and committed per chunk (bounds memory use).',
+        )
+        parser.add_argument(
+            '--hasher', choices=['seed', 'default'], default='seed',
+            help='"seed": cheap PBKDF2 for seeded data (the random passwords are never handed out); '
+                 '"default": the first of PASSWORD_HASHERS, at full strength.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Processes hashing passwords in parallel.',
+        )
 
     def handle(self, *args, **kwargs):
-        file_path = os.path.join(BASE_DIR, 'data/users.csv')
+        file_path = kwargs['file']
+        hasher_path = SEED_HASHER if kwargs['hasher'] == 'seed' else settings.PASSWORD_HASHERS[0]
+        workers = kwargs['workers']
 
         self.stdout.write(f'Loading users from {file_path}')
 
-        # Fetch existing usernames and emails to avoid duplicates
-        existing_usernames = set(User.objects.values_list('username', flat=True))
-        existing_emails = set(User.objects.values_list('email', flat=True))
+        read, imported = 0, 0
+        with ProcessPoolExecutor(workers) if workers > 1 else nullcontext() as pool, connection.cursor() as cursor:
+            self.create_staging_table(cursor)
+            try:
+                for chunk in chunked(self.read_users(file_path), kwargs['chunk_size']):
+                    passwords = self.hash_passwords(pool, workers, hasher_path, [random_password() for _ in chunk])
+                    rows = [
+                        (uid, username_for(uid), email_for(uid), password, location, age)
+                        for (uid, location, age), password in zip(chunk, passwords)
+                    ]
+                    with transaction.atomic():
+                        imported += self.load_chunk(cursor, rows)
+                    read += len(rows)
+                    self.stdout.write(f'  … {read} users read')
+            finally:
+                cursor.execute('DROP TABLE IF EXISTS users_import')
 
+            # Ids come from the file: move the sequence past them for users created later
+            for sql in connection.ops.sequence_reset_sql(no_style(), [User]):
+                cursor.execute(sql)
+
+        if read > imported:
+            self.stdout.write(f'Skipped {read - imported} users whose id, username or email already exists')
+        self.stdout.write(self.style.SUCCESS(f'Successfully imported {imported} users with random credentials'))
+
+    def read_users(self, file_path: str) -> Iterator[tuple]:
+        """(User-ID, location, age) per valid row"""
         with open(file_path, newline='', encoding='latin-1') as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=';')
-            users = []
-            for row in reader:
+            for row in csv.DictReader(csvfile, delimiter=';'):
                 try:
                     age = row['Age']
-                    uid = int(row['User-ID'])
-
-                    # Generate unique username and email
-                    username = random_username(existing_usernames)
-                    existing_usernames.add(username)
-
-                    email = random_email(existing_emails)
-                    existing_emails.add(email)
-
-                    raw_password = random_password()
-                    
-                    hash_password = False
-
-                    users.append(User(
-                        id=uid,
-                        location=row['Location'],
-                        age=int(age) if age.isdigit() else None,
-                        username=username,
-                        email=email,
-                        password=make_password(raw_password) if hash_password else raw_password
-                    ))
+                    yield int(row['User-ID']), row['Location'], int(age) if age.isdigit() else None
                 except Exception as e:
                     self.stderr.write(f"Skipping row due to error: {e}")
 
-            User.objects.bulk_create(users, ignore_conflicts=True)
-            self.stdout.write(self.style.SUCCESS('Successfully imported users with random credentials'))
+    def hash_passwords(self, pool, workers: int, hasher_path: str, passwords: List[str]) -> List[str]:
+        if pool is None:
+            return hash_passwords(hasher_path, passwords)
+        batches = chunked(passwords, -(-len(passwords) // (workers * 4)))
+        return [hashed for batch in pool.map(hash_passwords, repeat(hasher_path), batches) for hashed in batch]
+
+    def create_staging_table(self, cursor):
+        # Session-level temp table: it must survive the per-chunk commits
+        cursor.execute('DROP TABLE IF EXISTS users_import')
+        cursor.execute(f'CREATE TEMP TABLE users_import (LIKE {User._meta.db_table} INCLUDING DEFAULTS)')
+
+    def load_chunk(self, cursor, rows: List[tuple]) -> int:
+        cursor.execute('TRUNCATE users_import')
+        copy_rows(cursor, 'users_import', STAGING_COLUMNS, rows)
+        cursor.execute(
+            f"""
+            INSERT INTO {User._meta.db_table} ({', '.join(STAGING_COLUMNS)})
+            SELECT {', '.join(STAGING_COLUMNS)} FROM users_import
+            ON CONFLICT DO NOTHING
+            """
+        )
+        return cursor.rowcount
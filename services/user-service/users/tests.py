@@ -1,3 +1,9 @@
+import io
+import os
+import tempfile
+
+from django.contrib.auth.hashers import check_password, identify_hasher
+from django.core.management import call_command
 from django.test import TestCase
 
 # Create your tests here.
@@ -25,3 +31,50 @@ class UserViewSetTest(APITestCase):
         # Check user is in DB with hashed password
         user = User.objects.get(username=data['username'])
         self.assertTrue(user.check_password(data['password']))
+
+
+class ImportUsersTest(TestCase):
+    LINES = [
+        '"User-ID";"Location";"Age"',
+        '"1";"nyc, new york, usa";NULL',
+        '"2";"stockton, california, usa";"18"',
+        '"3";"moscow, yukon territory, russia";NULL',
+        '"three";"nowhere";NULL',
+        '"4";"porto, v.n.gaia, portugal";"17"',
+    ]
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(handle, "w", encoding="latin-1") as f:
+            f.write("\n".join(self.LINES) + "\n")
+        self.addCleanup(os.remove, self.path)
+
+    def import_users(self, **kwargs):
+        out = io.StringIO()
+        call_command("import_users", file=self.path, chunk_size=2, stdout=out, stderr=io.StringIO(), **kwargs)
+        return out.getvalue()
+
+    def test_identities_are_derived_from_user_id(self):
+        User.objects.create(id=100, username="user_3", email="taken@example.com", password="x")
+        out = self.import_users(workers=2)
+
+        self.assertIn("Skipped 1 users", out)
+        self.assertEqual(
+            list(User.objects.exclude(id=100).order_by("id").values_list("id", "username", "email", "age")),
+            [(1, "user_1", "user_1@example.com", None), (2, "user_2", "user_2@example.com", 18),
+             (4, "user_4", "user_4@example.com", 17)],
+        )
+        # Seed hashes are regular PBKDF2 hashes, just cheaper
+        password = User.objects.get(id=1).password
+        self.assertEqual(identify_hasher(password).algorithm, "pbkdf2_sha256")
+        self.assertEqual(password.split("$")[1], "1000")
+        self.assertFalse(check_password("wrong", password))
+
+        # The id sequence was moved past the imported ids
+        self.assertEqual(User.objects.create(username="new", password="x").id, 101)
+
+    def test_reimport_is_idempotent(self):
+        self.import_users(workers=1)
+        passwords = dict(User.objects.values_list("id", "password"))
+        self.assertIn("Skipped 4 users", self.import_users(workers=1))
+        self.assertEqual(dict(User.objects.values_list("id", "password")), passwords)